@@ -0,0 +1,192 @@
+"""
+Бенчмарк channel layer: пропускная способность group_send в зависимости от числа шардов Redis.
+
+Поднимает --max-shards локальных redis-server и для каждого числа шардов 1..N
+запускает --workers процессов (каждый — как отдельный ASGI-процесс со своими каналами),
+которые рассылают сообщения в случайные комнаты и принимают их.
+
+Запуск (нужен redis-server в PATH):
+    python benchmarks/channel_layer_shards.py --max-shards 4 --workers 4 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import redis
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_app.channel_layers import ShardedRedisChannelLayer  # noqa: E402
+
+
+def start_redis_servers(count, base_port, workdir):
+    processes = []
+    for i in range(count):
+        port = base_port + i
+        processes.append(subprocess.Popen(
+            [
+                "redis-server", "--port", str(port), "--save", "", "--appendonly", "no",
+                "--dir", workdir, "--dbfilename", f"bench-{port}.rdb",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ))
+
+    for i in range(count):
+        client = redis.Redis(port=base_port + i)
+        for _ in range(100):
+            try:
+                client.ping()
+                break
+            except redis.ConnectionError:
+                time.sleep(0.05)
+        else:
+            raise RuntimeError(f"redis-server на порту {base_port + i} не запустился")
+    return processes
+
+
+def run_worker(hosts, rooms, channels, duration, senders, payload_size, seed, barrier, results):
+    asyncio.run(_worker(hosts, rooms, channels, duration, senders, payload_size, seed, barrier, results))
+
+
+async def _worker(hosts, rooms, channels, duration, senders, payload_size, seed, barrier, results):
+    rnd = random.Random(seed)
+    layer = ShardedRedisChannelLayer(hosts=hosts, capacity=1000, expiry=10)
+    groups = [f"chat_bench{i}" for i in range(rooms)]
+
+    members = []
+    for _ in range(channels):
+        channel = await layer.new_channel()
+        group = rnd.choice(groups)
+        await layer.group_add(group, channel)
+        members.append((group, channel))
+
+    await asyncio.get_running_loop().run_in_executor(None, barrier.wait)
+
+    counters = {"sent": 0, "received": 0}
+    deadline = time.monotonic() + duration
+    message = {"type": "chat.message", "frame": "x" * payload_size}
+
+    async def receiver(channel):
+        while True:
+            await layer.receive(channel)
+            counters["received"] += 1
+
+    async def sender():
+        while time.monotonic() < deadline:
+            await layer.group_send(rnd.choice(groups), message)
+            counters["sent"] += 1
+
+    receivers = [asyncio.create_task(receiver(channel)) for _, channel in members]
+    await asyncio.gather(*(sender() for _ in range(senders)))
+    # даём долететь последним сообщениям
+    await asyncio.sleep(0.5)
+    for task in receivers:
+        task.cancel()
+    await asyncio.gather(*receivers, return_exceptions=True)
+
+    for group, channel in members:
+        await layer.group_discard(group, channel)
+    await layer.close_pools()
+    results.put(counters)
+
+
+def run_round(hosts, args):
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(args.workers)
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=run_worker, args=(
+            hosts, args.rooms, args.channels, args.duration, args.senders,
+            args.payload_size, seed, barrier, results,
+        ))
+        for seed in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    totals = {"sent": 0, "received": 0}
+    for _ in processes:
+        counters = results.get()
+        totals["sent"] += counters["sent"]
+        totals["received"] += counters["received"]
+    for process in processes:
+        process.join()
+    return totals
+
+
+def shard_hosts(base_port, count):
+    return [{"address": f"redis://127.0.0.1:{base_port + i}/0"} for i in range(count)]
+
+
+def remapped_fraction(base_port, shards, rooms):
+    """Доля комнат, которые переезжают на другой Redis при добавлении shards+1-го шарда"""
+    keys = [f"chat_bench{i}" for i in range(rooms)]
+    before = ShardedRedisChannelLayer(hosts=shard_hosts(base_port, shards))
+    after = ShardedRedisChannelLayer(hosts=shard_hosts(base_port, shards + 1))
+
+    def address(layer, key):
+        return layer.hosts[layer.consistent_hash(key)]["address"]
+
+    return sum(address(before, key) != address(after, key) for key in keys) / len(keys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-shards", type=int, default=4)
+    parser.add_argument("--base-port", type=int, default=16379)
+    parser.add_argument("--workers", type=int, default=4, help="число процессов")
+    parser.add_argument("--channels", type=int, default=200, help="каналов на процесс")
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--senders", type=int, default=8, help="корутин-отправителей на процесс")
+    parser.add_argument("--payload-size", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--output", help="куда записать результаты в JSON")
+    args = parser.parse_args()
+
+    if not shutil.which("redis-server"):
+        sys.exit("redis-server не найден в PATH")
+
+    workdir = tempfile.mkdtemp(prefix="bench-redis-")
+    servers = start_redis_servers(args.max_shards, args.base_port, workdir)
+    rounds = []
+    try:
+        for shards in range(1, args.max_shards + 1):
+            for i in range(shards):
+                redis.Redis(port=args.base_port + i).flushall()
+            hosts = shard_hosts(args.base_port, shards)
+            totals = run_round(hosts, args)
+            result = {
+                "shards": shards,
+                "group_send_per_sec": round(totals["sent"] / args.duration, 1),
+                "delivered_per_sec": round(totals["received"] / args.duration, 1),
+                "remapped_on_next_shard": round(remapped_fraction(args.base_port, shards, args.rooms), 3),
+            }
+            rounds.append(result)
+            print(
+                f"shards={result['shards']} group_send/s={result['group_send_per_sec']} "
+                f"delivered/s={result['delivered_per_sec']} "
+                f"remapped_on_next_shard={result['remapped_on_next_shard']}"
+            )
+    finally:
+        for server in servers:
+            server.terminate()
+        for server in servers:
+            server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"benchmark": "channel_layer_shards", "params": vars(args), "results": rounds}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+"""
+Нагрузочный бенчмарк WebSocket: ChatConsumer connect -> receive -> group_send -> chat_message.
+
+Создаёт --clients пользователей и --rooms комнат, подключает всех клиентов (asyncio, одним процессом),
+после чего --senders-per-room участников каждой комнаты шлют по --rate сообщений в секунду.
+Каждое сообщение несёт время отправки, получатели считают задержку доставки.
+Результат: скорость установки соединений, сообщений в секунду, p50/p95/p99 задержки, в JSON — через --output.
+
+Режимы:
+    --target inprocess  ASGI-приложение вызывается напрямую в том же процессе, без сети
+    --target server     бенчмарк поднимает uvicorn на --port и ходит по настоящему WebSocket
+                        (или к уже запущенному серверу через --url)
+
+Channel layer: --layer memory (InMemoryChannelLayer) или --layer redis.
+Redis нужен в обоих случаях (presence, история, fan-out): бенчмарк запускает redis-server на --redis-port,
+с --use-running-redis берёт REDIS_HOST/REDIS_PORT из окружения.
+База — из настроек проекта, пользователи bench_user_* и комнаты bench_room_* создаются при необходимости,
+--cleanup удаляет их (вместе с сообщениями) после прогона.
+
+Запуск:
+    python benchmarks/ws_load.py --clients 2000 --rooms 100 --duration 20 --layer redis --output ws.json
+    python benchmarks/ws_load.py --target server --clients 1000 --layer memory
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "chat_project.settings")
+
+USER_PREFIX = "bench_user_"
+ROOM_PREFIX = "bench_room_"
+MESSAGE_PREFIX = "bench "
+
+
+def configure(args):
+    """Окружение для настроек проекта; вызывается до django.setup()"""
+    if not args.use_running_redis:
+        os.environ["REDIS_HOST"] = "127.0.0.1"
+        os.environ["REDIS_PORT"] = str(args.redis_port)
+        os.environ.pop("REDIS_SHARDS", None)
+    if not args.rate_limits:
+        os.environ["WS_RATE_LIMIT_ENABLED"] = "False"
+
+    import django
+    django.setup()
+
+    if args.layer == "memory":
+        from django.conf import settings
+        settings.CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+def prepare_data(clients, rooms):
+    """Пользователи, комнаты и участники; возвращает [(room_name, token)] для каждого клиента"""
+    from django.contrib.auth import get_user_model
+    from rest_framework_simplejwt.tokens import AccessToken
+    from chat_app.models import Room
+
+    User = get_user_model()
+    User.objects.bulk_create(
+        [User(username=f"{USER_PREFIX}{i}", phone=f"bench-{i}") for i in range(clients)],
+        ignore_conflicts=True,
+    )
+    Room.objects.bulk_create(
+        [Room(name=f"{ROOM_PREFIX}{i}") for i in range(rooms)],
+        ignore_conflicts=True,
+    )
+    users = {
+        user.username: user
+        for user in User.objects.filter(username__in=[f"{USER_PREFIX}{i}" for i in range(clients)])
+    }
+    room_ids = dict(Room.objects.filter(name__startswith=ROOM_PREFIX).values_list("name", "id"))
+
+    plan = []
+    participants = []
+    for i in range(clients):
+        user = users[f"{USER_PREFIX}{i}"]
+        room_name = f"{ROOM_PREFIX}{i % rooms}"
+        participants.append(Room.participants.through(room_id=room_ids[room_name], user_id=user.pk))
+        plan.append((room_name, str(AccessToken.for_user(user))))
+    Room.participants.through.objects.bulk_create(participants, ignore_conflicts=True)
+    return plan
+
+
+def cleanup_data():
+    from django.contrib.auth import get_user_model
+    from chat_app.models import Room
+
+    Room.objects.filter(name__startswith=ROOM_PREFIX).delete()
+    get_user_model().objects.filter(username__startswith=USER_PREFIX).delete()
+
+
+class InProcessClient:
+    """WebSocket-клиент поверх ASGI-приложения, без сети"""
+
+    def __init__(self, application, room_name, token):
+        from asgiref.testing import ApplicationCommunicator
+
+        self.communicator = ApplicationCommunicator(application, {
+            "type": "websocket",
+            "path": f"/ws/chat/{room_name}/",
+            "query_string": f"token={token}&replay=0".encode(),
+            "headers": [],
+            "subprotocols": [],
+            "client": ("127.0.0.1", 0),
+        })
+
+    async def connect(self):
+        await self.communicator.send_input({"type": "websocket.connect"})
+        response = await self.communicator.receive_output(timeout=30)
+        if response["type"] != "websocket.accept":
+            raise ConnectionError("соединение отклонено")
+
+    async def send(self, text):
+        await self.communicator.send_input({"type": "websocket.receive", "text": text})
+
+    async def recv(self):
+        """Текст следующего фрейма или None, если соединение закрыто"""
+        while True:
+            message = await self.communicator.receive_output(timeout=None)
+            if message["type"] == "websocket.close":
+                return None
+            if message.get("text") is not None:
+                return message["text"]
+
+    async def close(self):
+        await self.communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+        await self.communicator.wait(timeout=5)
+
+
+class NetworkClient:
+    """Обычный WebSocket-клиент (библиотека websockets)"""
+
+    def __init__(self, base_url, room_name, token):
+        self.url = f"{base_url}/ws/chat/{room_name}/?token={token}&replay=0"
+        self.connection = None
+
+    async def connect(self):
+        import websockets
+
+        self.connection = await websockets.connect(self.url, max_size=None, open_timeout=30)
+
+    async def send(self, text):
+        await self.connection.send(text)
+
+    async def recv(self):
+        import websockets
+
+        while True:
+            try:
+                frame = await self.connection.recv()
+            except websockets.ConnectionClosed:
+                return None
+            if isinstance(frame, str):
+                return frame
+
+    async def close(self):
+        await self.connection.close()
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return round(sorted_values[index], 3)
+
+
+def latency_summary(values):
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": round(values[-1], 3) if values else None,
+    }
+
+
+async def run_load(make_client, plan, args):
+    clients = [make_client(room_name, token) for room_name, token in plan]
+    connect_latencies = []
+    failed = 0
+    semaphore = asyncio.Semaphore(args.connect_concurrency)
+
+    async def connect(client):
+        nonlocal failed
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await client.connect()
+            except Exception:
+                failed += 1
+                return False
+            connect_latencies.append((time.perf_counter() - started) * 1000)
+            return True
+
+    connect_started = time.perf_counter()
+    connected = await asyncio.gather(*(connect(client) for client in clients))
+    connect_seconds = time.perf_counter() - connect_started
+    rooms = [room_name for (room_name, _), ok in zip(plan, connected) if ok]
+    clients = [client for client, ok in zip(clients, connected) if ok]
+
+    counters = {"sent": 0, "delivered": 0}
+    delivery_latencies = []
+    measuring = False
+    padding = "x" * max(0, args.payload_size - 30)
+
+    async def receiver(client):
+        while True:
+            text = await client.recv()
+            if text is None:
+                return
+            if not measuring:
+                continue
+            try:
+                message = json.loads(text).get("message")
+            except ValueError:
+                continue
+            if isinstance(message, str) and message.startswith(MESSAGE_PREFIX):
+                sent_ns = int(message.split(" ", 2)[1])
+                delivery_latencies.append((time.perf_counter_ns() - sent_ns) / 1e6)
+                counters["delivered"] += 1
+
+    async def sender(client, deadline):
+        interval = 1 / args.rate
+        next_at = time.perf_counter()
+        while next_at < deadline:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await client.send(json.dumps({"message": f"{MESSAGE_PREFIX}{time.perf_counter_ns()} {padding}"}))
+            counters["sent"] += 1
+            next_at += interval
+
+    receivers = [asyncio.create_task(receiver(client)) for client in clients]
+    # приветствия и presence-события первых секунд в замер не идут
+    await asyncio.sleep(args.warmup)
+    measuring = True
+
+    room_size = {}
+    senders = []
+    for client, room_name in zip(clients, rooms):
+        room_size[room_name] = room_size.get(room_name, 0) + 1
+        if room_size[room_name] <= args.senders_per_room:
+            senders.append((client, room_name))
+
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*(sender(client, deadline) for client, _ in senders))
+    send_seconds = time.perf_counter() - started
+    await asyncio.sleep(args.drain)
+    measuring = False
+
+    # каждое сообщение получают все участники комнаты, включая отправителя
+    expected = sum(room_size[room_name] for _, room_name in senders) * args.rate * args.duration
+
+    await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+    for task in receivers:
+        task.cancel()
+    await asyncio.gather(*receivers, return_exceptions=True)
+
+    return {
+        "connect": {
+            "attempted": len(plan),
+            "connected": len(clients),
+            "failed": failed,
+            "seconds": round(connect_seconds, 3),
+            "per_sec": round(len(clients) / connect_seconds, 1) if connect_seconds else None,
+            "latency_ms": latency_summary(connect_latencies),
+        },
+        "messages": {
+            "sent": counters["sent"],
+            "delivered": counters["delivered"],
+            "expected_deliveries": round(expected),
+            "sent_per_sec": round(counters["sent"] / send_seconds, 1),
+            "delivered_per_sec": round(counters["delivered"] / (send_seconds + args.drain), 1),
+            "latency_ms": latency_summary(delivery_latencies),
+        },
+    }
+
+
+async def run_inprocess(plan, args):
+    from chat_project.asgi import application
+    from chat_app.outbound import OutboundQueue
+    from chat_app.persistence import message_writer
+
+    result = await run_load(lambda room_name, token: InProcessClient(application, room_name, token), plan, args)
+    await message_writer.close()
+    result["outbound"] = OutboundQueue.stats()
+    return result
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"процесс на порту {port} завершился с кодом {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"порт {port} не открылся за {timeout} с")
+
+
+def serve(args):
+    """Внутренний режим: uvicorn с настройками бенчмарка (запускается из --target server)"""
+    import uvicorn
+
+    configure(args)
+    from chat_project.asgi import application
+
+    uvicorn.run(application, host="127.0.0.1", port=args.port, log_level="warning", backlog=4096, ws_max_size=1 << 20)
+
+
+def start_server(args):
+    command = [
+        sys.executable, os.path.abspath(__file__), "--serve",
+        "--port", str(args.port), "--layer", args.layer, "--redis-port", str(args.redis_port),
+    ]
+    if args.use_running_redis:
+        command.append("--use-running-redis")
+    if args.rate_limits:
+        command.append("--rate-limits")
+    process = subprocess.Popen(command)
+    try:
+        wait_for_port(args.port, process)
+    except Exception:
+        process.terminate()
+        raise
+    return process
+
+
+def start_redis(port):
+    if not shutil.which("redis-server"):
+        sys.exit("redis-server не найден в PATH (или используйте --use-running-redis)")
+    workdir = tempfile.mkdtemp(prefix="bench-redis-")
+    process = subprocess.Popen(
+        ["redis-server", "--port", str(port), "--save", "", "--appendonly", "no", "--dir", workdir],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    wait_for_port(port, process)
+    return process, workdir
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=("inprocess", "server"), default="inprocess")
+    parser.add_argument("--url", help="уже запущенный сервер, например ws://127.0.0.1:8000")
+    parser.add_argument("--port", type=int, default=0, help="порт uvicorn для --target server, 0 — свободный")
+    parser.add_argument("--layer", choices=("memory", "redis"), default="memory")
+    parser.add_argument("--redis-port", type=int, default=16400)
+    parser.add_argument("--use-running-redis", action="store_true", help="не запускать redis-server")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--senders-per-room", type=int, default=2)
+    parser.add_argument("--rate", type=float, default=2, help="сообщений в секунду на отправителя")
+    parser.add_argument("--payload-size", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=2, help="пауза после подключения, секунд")
+    parser.add_argument("--drain", type=float, default=2, help="ожидание последних доставок, секунд")
+    parser.add_argument("--connect-concurrency", type=int, default=200)
+    parser.add_argument("--rate-limits", action="store_true", help="не отключать WS_RATE_LIMITS")
+    parser.add_argument("--cleanup", action="store_true", help="удалить bench-пользователей и комнаты после прогона")
+    parser.add_argument("--output", help="куда записать результаты в JSON")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    redis_server = workdir = server = None
+    if not args.use_running_redis:
+        redis_server, workdir = start_redis(args.redis_port)
+    try:
+        configure(args)
+        plan = prepare_data(args.clients, args.rooms)
+
+        if args.target == "inprocess":
+            result = asyncio.run(run_inprocess(plan, args))
+        else:
+            base_url = args.url
+            if base_url is None:
+                args.port = args.port or free_port()
+                server = start_server(args)
+                base_url = f"ws://127.0.0.1:{args.port}"
+            result = asyncio.run(run_load(
+                lambda room_name, token: NetworkClient(base_url, room_name, token), plan, args,
+            ))
+
+        if args.cleanup:
+            cleanup_data()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if redis_server is not None:
+            redis_server.terminate()
+            redis_server.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    connect, messages = result["connect"], result["messages"]
+    print(
+        f"target={args.target} layer={args.layer} clients={connect['connected']}/{connect['attempted']} "
+        f"connect/s={connect['per_sec']} connect_p99_ms={connect['latency_ms']['p99']}"
+    )
+    print(
+        f"sent/s={messages['sent_per_sec']} delivered/s={messages['delivered_per_sec']} "
+        f"delivered={messages['delivered']}/{messages['expected_deliveries']} "
+        f"p50={messages['latency_ms']['p50']}ms p95={messages['latency_ms']['p95']}ms "
+        f"p99={messages['latency_ms']['p99']}ms"
+    )
+
+    report = {"benchmark": "ws_load", "params": vars(args), "results": result}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
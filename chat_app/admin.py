@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Room, Message, User
+from django.contrib.postgres.search import SearchQuery
+from django.db.models import Q
+from .models import MESSAGE_SEARCH_CONFIG, Room, Message, User, message_search_vector
 from django.contrib.auth.admin import UserAdmin
 
 
@@ -42,9 +44,23 @@ class RoomAdmin(admin.ModelAdmin):
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     list_display = ("id", "timestamp", "content", "user", "short_content")
-    search_fields = ("id", "content", "user__username", "room__name")
+    search_fields = ("user__username", "room__name")
+    search_help_text = "Поиск по автору, комнате, id или полнотекстовый по тексту сообщения"
     list_filter = ("timestamp", "room", "user")
 
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        # автор и комната — стандартный поиск по search_fields
+        by_fields, _ = super().get_search_results(request, queryset, search_term)
+        matches = Q(pk__in=by_fields.values("pk"))
+        if search_term.isdigit():
+            matches |= Q(id=int(search_term))
+        # icontains по content — последовательное сканирование всей таблицы, текст ищем по GIN индексу
+        query = SearchQuery(search_term, config=MESSAGE_SEARCH_CONFIG, search_type="websearch")
+        return queryset.annotate(search=message_search_vector()).filter(matches | Q(search=query)), False
+
     def short_content(self, obj):
         return (obj.content[:50] + "...") if len(obj.content) > 50 else obj.content
 
@@ -0,0 +1,24 @@
+from django.db.models import Exists, OuterRef
+from rest_framework.response import Response
+from rest_framework import status
+from chat_app.models import Room
+
+
+def room_access_error(room_id, user):
+    """
+    Проверка доступа к содержимому комнаты одним запросом: None — пользователь участник,
+    иначе готовый ответ 404 (комнаты нет) или 403 (не участник)
+    """
+    is_member = (
+        Room.objects.filter(id=room_id)
+        .annotate(is_member=Exists(
+            Room.participants.through.objects.filter(room_id=OuterRef("id"), user_id=user.id)
+        ))
+        .values_list("is_member", flat=True)
+        .first()
+    )
+    if is_member is None:
+        return Response({"detail": "Комната не найдена"}, status=status.HTTP_404_NOT_FOUND)
+    if not is_member:
+        return Response({"detail": "Вы не участник комнаты"}, status=status.HTTP_403_FORBIDDEN)
+    return None
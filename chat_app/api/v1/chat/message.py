@@ -0,0 +1,75 @@
+from django.db.models import F, Q
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from chat_app.api.v1.chat.access import room_access_error
+from chat_app.api.v1.chat.serializers import MessageSerializer, MessagePageSerializer
+from chat_app.api.v1.pagination import cursor_datetime, cursor_id, decode_cursor, encode_cursor, get_page_size
+from chat_app.models import Message
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RoomMessagesView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=['Messages'],
+        parameters=[
+            OpenApiParameter(
+                name="cursor",
+                description="next_cursor из предыдущей страницы",
+                required=False,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="limit",
+                description="Размер страницы",
+                required=False,
+                type=int,
+            ),
+        ],
+        responses=MessagePageSerializer,
+    )
+    def get(self, request, room_id):
+        """
+        История сообщений комнаты, от новых к старым \n
+        Keyset-пагинация по (timestamp, id): стоимость страницы не зависит от глубины \n
+        Доступна только участникам комнаты
+        """
+        error = room_access_error(room_id, request.user)
+        if error is not None:
+            return error
+
+        limit = get_page_size(request)
+        messages = Message.objects.filter(room_id=room_id)
+
+        cursor = request.query_params.get("cursor")
+        if cursor:
+            timestamp, message_id = decode_cursor(cursor, 2)
+            timestamp, message_id = cursor_datetime(timestamp), cursor_id(message_id)
+            # (timestamp, id) < (cursor): диапазон по индексу + отсев совпадений по timestamp
+            messages = messages.filter(timestamp__lte=timestamp).exclude(
+                Q(timestamp=timestamp) & Q(id__gte=message_id)
+            )
+
+        rows = list(
+            messages
+            .order_by("-timestamp", "-id")
+            .values("id", "user_id", "content", "timestamp", username=F("user__username"))[:limit + 1]
+        )
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor([last["timestamp"].isoformat(), last["id"]])
+
+        logger.info("Запрошена история комнаты с id=%s пользователем %s", room_id, request.user.username)
+        return Response(
+            {"results": MessageSerializer(rows, many=True).data, "next_cursor": next_cursor},
+            status=status.HTTP_200_OK,
+        )
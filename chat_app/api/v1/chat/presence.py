@@ -0,0 +1,43 @@
+from redis.exceptions import RedisError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from chat_app.api.v1.chat.access import room_access_error
+from chat_app.api.v1.chat.serializers import OnlineUserSerializer
+from chat_app.models import Room, User
+from chat_app.presence import presence
+from drf_spectacular.utils import extend_schema
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class OnlineUsersView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=['Room'],
+        responses=OnlineUserSerializer(many=True),
+    )
+    def get(self, request, room_id):
+        """
+        Участники комнаты, которые сейчас онлайн \n
+        Доступно только участникам комнаты
+        """
+        error = room_access_error(room_id, request.user)
+        if error is not None:
+            return error
+        room_name = Room.objects.filter(id=room_id).values_list("name", flat=True).first()
+        if room_name is None:
+            return Response({"detail": "Комната не найдена"}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            user_ids = presence.online_user_ids(room_name)
+        except RedisError as e:
+            logger.error("Ошибка при получении онлайн участников комнаты с id=%s: %s", room_id, e)
+            return Response({"detail": "Сервис присутствия недоступен"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        users = User.objects.filter(id__in=user_ids).order_by("username").values("id", "username")
+        serializer = OnlineUserSerializer(users, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
@@ -1,14 +1,26 @@
+from django.db.models import Count, Prefetch
+from django.http import HttpResponse
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from chat_app.api.v1.chat.serializers import RoomCreateUpdateSerializer, RoomSerializer
-from chat_app.models import Room
-from drf_spectacular.utils import extend_schema, OpenApiParameter
+from chat_app.api.v1.chat.serializers import (
+    RoomCreateUpdateSerializer, RoomPageSerializer, RoomSerializer, RoomSummaryPageSerializer, RoomSummarySerializer,
+)
+from chat_app.api.v1.etag import etag_matches, make_etag
+from chat_app.api.v1.pagination import cursor_id, decode_cursor, encode_cursor, get_page_size
+from chat_app.models import Room, User
+from chat_app.response_cache import response_cache
+from chat_app.versions import rooms_version
+from drf_spectacular.utils import extend_schema, OpenApiParameter, PolymorphicProxySerializer
 import logging
 
 logger = logging.getLogger(__name__)
 
+PARTICIPANTS_IDS = "ids"
+PARTICIPANTS_COUNT = "count"
+
 
 class GetRoomView(APIView):
     permission_classes = [IsAuthenticated]
@@ -18,14 +30,23 @@ class GetRoomView(APIView):
         responses=RoomSerializer,
     )
     def get(self, request, room_id):
-        try:
-            room = Room.objects.get(id=room_id)
-        except Room.DoesNotExist:
+        """
+        Информация о комнате \n
+        Ответ кэшируется в Redis и сбрасывается при изменении комнаты или её участников
+        """
+        body = response_cache.get_or_build("room", room_id, lambda: self.build(room_id))
+        if body is None:
             return Response({"detail": "Комната не найдена"}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = RoomSerializer(room)
-        logger.info("Запрошена информация о комнате '%s' пользователем %s", room.name, request.user.username)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        logger.info("Запрошена информация о комнате с id=%s пользователем %s", room_id, request.user.username)
+        return HttpResponse(body, content_type="application/json")
+
+    @staticmethod
+    def build(room_id):
+        room = Room.objects.prefetch_related(
+            Prefetch("participants", queryset=User.objects.only("id")),
+        ).filter(id=room_id).first()
+        return RoomSerializer(room).data if room is not None else None
 
 
 class GetRoomsView(APIView):
@@ -33,17 +54,103 @@ class GetRoomsView(APIView):
 
     @extend_schema(
         tags=['Room'],
-        responses=RoomSerializer(many=True),
+        parameters=[
+            OpenApiParameter(
+                name="mine",
+                description="1 — только комнаты, где пользователь участник",
+                required=False,
+                type=bool,
+            ),
+            OpenApiParameter(
+                name="participants",
+                description="ids — список id участников, count — только их число",
+                required=False,
+                type=str,
+                enum=[PARTICIPANTS_IDS, PARTICIPANTS_COUNT],
+            ),
+            OpenApiParameter(
+                name="cursor",
+                description="next_cursor из предыдущей страницы",
+                required=False,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="limit",
+                description="Размер страницы",
+                required=False,
+                type=int,
+            ),
+        ],
+        # participants=count отдаёт вместо участников их число
+        responses=PolymorphicProxySerializer(
+            component_name="RoomListPage",
+            serializers=[RoomPageSerializer, RoomSummaryPageSerializer],
+            resource_type_field_name=None,
+        ),
     )
     def get(self, request):
-        try:
-            rooms = Room.objects.all()
-        except Room.DoesNotExist:
-            return Response([], status=status.HTTP_200_OK)
-
-        serializer = RoomSerializer(rooms, many=True)
+        """
+        Список комнат по возрастанию id, keyset-пагинация \n
+        Поддерживает If-None-Match: пока комнаты и участники не менялись, ответ — 304 без запросов к БД
+        """
+        mine = request.query_params.get("mine") in ("1", "true", "True")
+        mode = request.query_params.get("participants", PARTICIPANTS_IDS)
+        if mode not in (PARTICIPANTS_IDS, PARTICIPANTS_COUNT):
+            raise ValidationError({"participants": "participants должен быть ids или count"})
+        limit = get_page_size(request)
+        cursor = request.query_params.get("cursor")
+
+        etag = None
+        version = rooms_version.get()
+        if version is not None:
+            etag = make_etag(version, request.user.id if mine else "all", mode, limit, cursor)
+            if etag_matches(request, etag):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        def build():
+            return self.build_page(request, mine, mode, limit, cursor)
+
+        if etag is not None:
+            # ключ включает версию списка, поэтому после изменений старые страницы просто не читаются
+            body = response_cache.get_or_build("rooms", etag.strip('"'), build)
+        else:
+            body = response_cache.render(build())
+
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"} if etag else None
         logger.info("Запрошена информация о комнатах пользователем %s", request.user.username)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return HttpResponse(body, content_type="application/json", headers=headers)
+
+    @staticmethod
+    def build_page(request, mine, mode, limit, cursor):
+        rooms = Room.objects.all()
+        if mine:
+            # подзапрос, а не join: иначе Count ниже посчитает только строку текущего пользователя
+            rooms = rooms.filter(
+                id__in=Room.participants.through.objects.filter(user_id=request.user.id).values("room_id")
+            )
+        if cursor:
+            (room_id,) = decode_cursor(cursor, 1)
+            rooms = rooms.filter(id__gt=cursor_id(room_id))
+        rooms = rooms.order_by("id")
+
+        if mode == PARTICIPANTS_COUNT:
+            rows = list(rooms.annotate(participants_count=Count("participants")).values(
+                "id", "name", "participants_count",
+            )[:limit + 1])
+        else:
+            # участники всех комнат страницы одним запросом, без загрузки пользователей целиком
+            rows = list(rooms.prefetch_related(
+                Prefetch("participants", queryset=User.objects.only("id")),
+            )[:limit + 1])
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor([last["id"] if mode == PARTICIPANTS_COUNT else last.id])
+
+        serializer_class = RoomSummarySerializer if mode == PARTICIPANTS_COUNT else RoomSerializer
+        return {"results": serializer_class(rows, many=True).data, "next_cursor": next_cursor}
 
 
 class CreateRoomView(APIView):
@@ -105,7 +212,3 @@ class DeleteRoomView(APIView):
             {"message": f"Комната с id={room_id} успешно удалена"},
             status=status.HTTP_200_OK
         )
-
-
-
-
@@ -0,0 +1,132 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from chat_app.api.v1.chat.access import room_access_error
+from chat_app.api.v1.chat.serializers import MessageSearchPageSerializer, MessageSearchResultSerializer
+from chat_app.api.v1.pagination import cursor_id, decode_cursor, encode_cursor, get_page_size
+from chat_app.models import MESSAGE_SEARCH_CONFIG, Message, Room, message_search_vector
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_QUERY_LENGTH = 200
+
+ORDER_RANK = "rank"
+ORDER_RECENT = "recent"
+
+
+class MessageSearchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=['Messages'],
+        parameters=[
+            OpenApiParameter(
+                name="q",
+                description='Поисковый запрос: слова, "фраза", -исключить, or',
+                required=True,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="room_id",
+                description="Искать только в комнате (пользователь должен быть участником), по умолчанию — во всех комнатах пользователя",
+                required=False,
+                type=int,
+            ),
+            OpenApiParameter(
+                name="order",
+                description="rank — по релевантности, recent — сначала новые",
+                required=False,
+                type=str,
+                enum=[ORDER_RANK, ORDER_RECENT],
+            ),
+            OpenApiParameter(
+                name="cursor",
+                description="next_cursor из предыдущей страницы",
+                required=False,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="limit",
+                description="Размер страницы",
+                required=False,
+                type=int,
+            ),
+        ],
+        responses=MessageSearchPageSerializer,
+    )
+    def get(self, request):
+        """
+        Полнотекстовый поиск по сообщениям \n
+        Совпадения ищутся по GIN индексу message_content_fts_idx, keyset-пагинация по (rank, id) или id
+        """
+        text = request.query_params.get("q", "").strip()
+        if not text:
+            raise ValidationError({"q": "Пустой поисковый запрос"})
+        if len(text) > MAX_QUERY_LENGTH:
+            raise ValidationError({"q": f"Запрос длиннее {MAX_QUERY_LENGTH} символов"})
+
+        order = request.query_params.get("order", ORDER_RANK)
+        if order not in (ORDER_RANK, ORDER_RECENT):
+            raise ValidationError({"order": "order должен быть rank или recent"})
+
+        limit = get_page_size(request)
+        vector = message_search_vector()
+        query = SearchQuery(text, config=MESSAGE_SEARCH_CONFIG, search_type="websearch")
+        # Выражение совпадает с индексом, поэтому условие @@ идёт через Bitmap Index Scan
+        # только комнаты, где пользователь участник (подзапрос, а не JOIN: строки не дублируются)
+        messages = Message.objects.annotate(search=vector).filter(
+            search=query,
+            room_id__in=Room.participants.through.objects.filter(user_id=request.user.id).values("room_id"),
+        )
+
+        room_id = request.query_params.get("room_id")
+        if room_id:
+            try:
+                room_id = int(room_id)
+            except ValueError:
+                raise ValidationError({"room_id": "room_id должен быть числом"})
+            error = room_access_error(room_id, request.user)
+            if error is not None:
+                return error
+            messages = messages.filter(room_id=room_id)
+
+        fields = ["id", "room_id", "user_id", "content", "timestamp"]
+        cursor = request.query_params.get("cursor")
+
+        if order == ORDER_RANK:
+            # ts_rank возвращает real, приводим к double: значение в курсоре должно совпадать точно
+            messages = messages.annotate(rank=Cast(SearchRank(vector, query), FloatField()))
+            if cursor:
+                rank, message_id = decode_cursor(cursor, 2)
+                message_id = cursor_id(message_id)
+                if not isinstance(rank, (int, float)) or isinstance(rank, bool):
+                    raise ValidationError({"cursor": "Не правильный cursor"})
+                messages = messages.filter(Q(rank__lt=rank) | Q(rank=rank, id__lt=message_id))
+            messages = messages.order_by("-rank", "-id")
+            fields.append("rank")
+        else:
+            if cursor:
+                (message_id,) = decode_cursor(cursor, 1)
+                messages = messages.filter(id__lt=cursor_id(message_id))
+            messages = messages.order_by("-id")
+
+        rows = list(messages.values(*fields, username=F("user__username"))[:limit + 1])
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor([last["rank"], last["id"]] if order == ORDER_RANK else [last["id"]])
+
+        logger.info("Поиск по сообщениям пользователем %s, room_id=%s", request.user.username, room_id or None)
+        return Response(
+            {"results": MessageSearchResultSerializer(rows, many=True).data, "next_cursor": next_cursor},
+            status=status.HTTP_200_OK,
+        )
@@ -1,6 +1,22 @@
 __all__ = [
     "RoomSerializer",
+    "RoomSummarySerializer",
+    "RoomPageSerializer",
+    "RoomSummaryPageSerializer",
     "RoomCreateUpdateSerializer",
+    "MessageSerializer",
+    "MessagePageSerializer",
+    "MessageSearchResultSerializer",
+    "MessageSearchPageSerializer",
+    "OnlineUserSerializer",
+    "UnreadCountSerializer",
 ]
 
-from .room import RoomCreateUpdateSerializer, RoomSerializer
\ No newline at end of file
+from .room import (
+    RoomCreateUpdateSerializer, RoomSerializer, RoomSummarySerializer, RoomPageSerializer, RoomSummaryPageSerializer,
+)
+from .message import (
+    MessageSerializer, MessagePageSerializer, MessageSearchResultSerializer, MessageSearchPageSerializer,
+)
+from .presence import OnlineUserSerializer
+from .unread import UnreadCountSerializer
@@ -0,0 +1,24 @@
+from rest_framework import serializers
+
+
+class MessageSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    user_id = serializers.IntegerField()
+    username = serializers.CharField()
+    content = serializers.CharField()
+    timestamp = serializers.DateTimeField()
+
+
+class MessagePageSerializer(serializers.Serializer):
+    results = MessageSerializer(many=True)
+    next_cursor = serializers.CharField(allow_null=True)
+
+
+class MessageSearchResultSerializer(MessageSerializer):
+    room_id = serializers.IntegerField()
+    rank = serializers.FloatField(required=False)
+
+
+class MessageSearchPageSerializer(serializers.Serializer):
+    results = MessageSearchResultSerializer(many=True)
+    next_cursor = serializers.CharField(allow_null=True)
@@ -0,0 +1,6 @@
+from rest_framework import serializers
+
+
+class OnlineUserSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    username = serializers.CharField()
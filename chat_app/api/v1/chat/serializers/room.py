@@ -12,6 +12,22 @@ class RoomSerializer(serializers.ModelSerializer):
         }
 
 
+class RoomSummarySerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    participants_count = serializers.IntegerField()
+
+
+class RoomPageSerializer(serializers.Serializer):
+    results = RoomSerializer(many=True)
+    next_cursor = serializers.CharField(allow_null=True)
+
+
+class RoomSummaryPageSerializer(serializers.Serializer):
+    results = RoomSummarySerializer(many=True)
+    next_cursor = serializers.CharField(allow_null=True)
+
+
 class RoomCreateUpdateSerializer(serializers.ModelSerializer):
     participants = serializers.PrimaryKeyRelatedField(
         many=True,
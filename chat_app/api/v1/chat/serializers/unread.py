@@ -0,0 +1,6 @@
+from rest_framework import serializers
+
+
+class UnreadCountSerializer(serializers.Serializer):
+    room_id = serializers.IntegerField()
+    unread = serializers.IntegerField()
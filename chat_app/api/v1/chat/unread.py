@@ -0,0 +1,28 @@
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from chat_app.api.v1.chat.serializers import UnreadCountSerializer
+from chat_app.unread import unread_counters
+from drf_spectacular.utils import extend_schema
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class UnreadCountsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=['Messages'],
+        responses=UnreadCountSerializer(many=True),
+    )
+    def get(self, request):
+        """
+        Непрочитанные сообщения во всех комнатах пользователя \n
+        Счётчики берутся из Redis одним запросом, сбрасываются WebSocket-сообщением {"type": "read"}
+        """
+        counts = unread_counters.counts(request.user.id)
+        rows = [{"room_id": room_id, "unread": unread} for room_id, unread in sorted(counts.items())]
+        serializer = UnreadCountSerializer(rows, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
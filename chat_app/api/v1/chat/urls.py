@@ -1,5 +1,9 @@
 from django.urls import path
 from .room import CreateRoomView, DeleteRoomView, UpdateRoomView, GetRoomView, GetRoomsView
+from .message import RoomMessagesView
+from .presence import OnlineUsersView
+from .search import MessageSearchView
+from .unread import UnreadCountsView
 
 urlpatterns = [
     # Комнаты
@@ -8,4 +12,10 @@ urlpatterns = [
     path('room/create/', CreateRoomView.as_view(), name='create-room'),
     path('room/update/<int:room_id>/', UpdateRoomView.as_view(), name='update-room'),
     path('room/delete/<int:room_id>/', DeleteRoomView.as_view(), name='delete-room'),
+    path('room/<int:room_id>/online/', OnlineUsersView.as_view(), name='room-online'),
+
+    # Сообщения
+    path('room/<int:room_id>/messages/', RoomMessagesView.as_view(), name='room-messages'),
+    path('messages/search/', MessageSearchView.as_view(), name='message-search'),
+    path('messages/unread/', UnreadCountsView.as_view(), name='message-unread'),
 ]
\ No newline at end of file
@@ -0,0 +1,16 @@
+import hashlib
+from django.utils.http import parse_etags
+
+
+def make_etag(version, *parts):
+    """ETag ответа: версия данных + всё, от чего зависит ответ (параметры запроса, пользователь)"""
+    raw = "|".join(str(part) for part in (version, *parts))
+    return '"' + hashlib.blake2b(raw.encode(), digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(request, etag):
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return "*" in etags or etag in etags or f"W/{etag}" in etags
@@ -0,0 +1,57 @@
+import base64
+import json
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# id в курсоре сравнивается с bigint: число вне диапазона дало бы ошибку БД вместо 400
+MAX_CURSOR_ID = 2 ** 63 - 1
+
+
+def encode_cursor(values):
+    """Курсор keyset-пагинации: значения ключа последней строки страницы"""
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValidationError({"cursor": "Не правильный cursor"})
+
+    if not isinstance(values, list) or len(values) != size:
+        raise ValidationError({"cursor": "Не правильный cursor"})
+    return values
+
+
+def cursor_id(value):
+    """id из курсора (bool в Python — тоже int, но в курсоре его быть не может)"""
+    if not isinstance(value, int) or isinstance(value, bool) or not -MAX_CURSOR_ID <= value <= MAX_CURSOR_ID:
+        raise ValidationError({"cursor": "Не правильный cursor"})
+    return value
+
+
+def cursor_datetime(value):
+    """Время из курсора; parse_datetime поднимает ValueError на строке верного формата вне диапазона (2024-13-01)"""
+    try:
+        parsed = parse_datetime(value) if isinstance(value, str) else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({"cursor": "Не правильный cursor"})
+    return parsed
+
+
+def get_page_size(request, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    limit = request.query_params.get("limit")
+    if not limit:
+        return default
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValidationError({"limit": "limit должен быть числом"})
+    return max(1, min(limit, maximum))
@@ -1,4 +1,3 @@
-from django.db import transaction
 import logging
 from rest_framework import status
 from rest_framework.views import APIView
@@ -6,9 +5,12 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from drf_spectacular.utils import extend_schema
 from rest_framework.exceptions import AuthenticationFailed, ValidationError
-from rest_framework_simplejwt.tokens import RefreshToken, TokenError
+from rest_framework_simplejwt.tokens import TokenError
+from redis.exceptions import RedisError
 
+from chat_app.authentication import SESSION_CLAIM, ChatRefreshToken
 from chat_app.models import User
+from chat_app.refresh_tokens import refresh_tokens
 from chat_app.api.v1.tokens import TokensSerializer, TokensRefreshParamsSerializer, TokenObtainPairParamsSerializer
 
 logger = logging.getLogger(__name__)
@@ -34,12 +36,16 @@ class TokenObtainPairView(APIView):
         if not user:
             raise AuthenticationFailed("Не правильные credentials")
 
-        refresh = RefreshToken.for_user(user)
+        refresh = ChatRefreshToken.for_user(user)
         access = str(refresh.access_token)
         refresh_str = str(refresh)
 
-        user.refresh_token = refresh_str
-        user.save(update_fields=["refresh_token"])
+        # Каждый вход — отдельная сессия, текущий refresh сессии хранится в Redis
+        try:
+            refresh_tokens.create(user.pk, refresh[SESSION_CLAIM], refresh["jti"])
+        except RedisError as e:
+            logger.error("Не удалось сохранить сессию пользователя %s: %s", user.pk, e)
+            return Response({"detail": "Сервис временно недоступен"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
         data = {"access_token": access, "refresh_token": refresh_str, "token_type": "Bearer"}
         serializer = TokensSerializer(data=data)
@@ -62,7 +68,8 @@ class TokensRefreshView(APIView):
             raise AuthenticationFailed("Не правильный refresh token")
 
         try:
-            incoming = RefreshToken(refresh_token)
+            # подпись, срок и отзыв (фильтр revoked_tokens вместо запроса к blacklist)
+            incoming = ChatRefreshToken(refresh_token)
         except Exception as e:
             raise AuthenticationFailed(str(e))
 
@@ -70,30 +77,36 @@ class TokensRefreshView(APIView):
         if not user_id:
             raise AuthenticationFailed("Не правильный token payload")
 
-        with transaction.atomic():
-            user = User.objects.select_for_update().filter(pk=user_id).first()
-            if not user:
-                raise AuthenticationFailed("Пользователь не найден")
-
-            # Старый refresh в чс
-            stored = user.refresh_token
-            if not stored or stored != refresh_token:
-                raise AuthenticationFailed("Refresh token устарел или не правильный")
-
-            try:
-                incoming.blacklist()
-            except AttributeError as e:
-                logger.warning("Ошибка при добавлении старого refresh в чс: %s", e)
-            except TokenError as e:
-                logger.warning("Ошибка при добавлении старого refresh в чс: %s", e)
-
-            new_refresh = RefreshToken.for_user(user)
-            new_access = str(new_refresh.access_token)
-            new_refresh_str = str(new_refresh)
-
-            # Сохраняем новый refresh
-            user.refresh_token = new_refresh_str
-            user.save(update_fields=["refresh_token"])
+        user = User.objects.filter(pk=user_id).first()
+        if not user:
+            raise AuthenticationFailed("Пользователь не найден")
+
+        # Токены, выпущенные до появления sid, перенесены migrate_refresh_tokens с sid = jti
+        sid = incoming.get(SESSION_CLAIM) or incoming.get("jti")
+        new_refresh = ChatRefreshToken.for_user(user, sid=sid)
+
+        # Compare-and-swap в Redis: из двух запросов с одним refresh пройдёт только первый
+        try:
+            rotated = refresh_tokens.rotate(user_id, sid, incoming.get("jti"), new_refresh["jti"])
+        except RedisError as e:
+            logger.error("Не удалось обновить сессию пользователя %s: %s", user_id, e)
+            return Response({"detail": "Сервис временно недоступен"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if not rotated:
+            raise AuthenticationFailed("Refresh token устарел или не правильный")
+
+        # Старый refresh в чс
+        try:
+            incoming.blacklist()
+        except AttributeError as e:
+            logger.warning("Ошибка при добавлении старого refresh в чс: %s", e)
+        except TokenError as e:
+            logger.warning("Ошибка при добавлении старого refresh в чс: %s", e)
+        except RedisError as e:
+            # повторно его всё равно не примет ротация сессии
+            logger.warning("Ошибка при добавлении старого refresh в чс: %s", e)
+
+        new_access = str(new_refresh.access_token)
+        new_refresh_str = str(new_refresh)
 
         data = {"access_token": new_access, "refresh_token": new_refresh_str, "token_type": "Bearer"}
         serializer = TokensSerializer(data=data)
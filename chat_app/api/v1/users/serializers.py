@@ -33,6 +33,26 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
+class UserListSerializer(serializers.Serializer):
+    """Пользователь в списке; fields — подмножество полей (sparse fieldset)"""
+
+    id = serializers.IntegerField()
+    created_at = serializers.DateTimeField()
+    username = serializers.CharField()
+    email = serializers.EmailField()
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class UserPageSerializer(serializers.Serializer):
+    results = UserListSerializer(many=True)
+    next_cursor = serializers.CharField(allow_null=True)
+
+
 class UserCreateUpdateSerializer(serializers.ModelSerializer):
     password = serializers.CharField(
         required=False,
@@ -1,16 +1,28 @@
+import json
 import logging
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.parsers import FormParser, MultiPartParser
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 
+from chat_app.api.v1.pagination import cursor_id, decode_cursor, encode_cursor, get_page_size
 from chat_app.models import User
-from .serializers import UserSerializer, UserCreateUpdateSerializer
+from chat_app.response_cache import response_cache
+from .serializers import UserSerializer, UserCreateUpdateSerializer, UserListSerializer, UserPageSerializer
 
 logger = logging.getLogger(__name__)
 
+# Поля, которые можно запросить через fields=
+USER_LIST_FIELDS = ("id", "created_at", "username", "email")
+
+# Строк на одно чтение server-side курсора и на один кусок ответа при выгрузке
+EXPORT_CHUNK_SIZE = 2000
+
 
 class CreateUserView(APIView):
     permission_classes = [IsAuthenticated]
@@ -61,29 +73,128 @@ class UserInfoView(APIView):
         if not user_id:
             logger.error("Ошибка при попытке получить информацию пользователя: не передан id пользователя")
             return Response({"error": "Не передан id пользователя"}, status=status.HTTP_400_BAD_REQUEST)
-        user = User.objects.get(id=user_id)
-        serializer = UserSerializer(user)
+        try:
+            user_id = int(user_id)
+        except ValueError:
+            return Response({"error": "user_id должен быть числом"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Ответ кэшируется в Redis, сбрасывается сигналами при изменении или удалении пользователя
+        body = response_cache.get_or_build("user", user_id, lambda: self.build(user_id))
+        if body is None:
+            return Response({"error": "Пользователь не найден"}, status=status.HTTP_404_NOT_FOUND)
 
         logger.info("Успешный запрос информации пользователя с id: %s", user_id)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return HttpResponse(body, content_type="application/json")
+
+    @staticmethod
+    def build(user_id):
+        user = User.objects.filter(id=user_id).first()
+        return UserSerializer(user).data if user is not None else None
 
 
 class UsersListView(APIView):
     permission_classes = [IsAuthenticated]
 
-    @extend_schema(tags=['Users'])
+    @extend_schema(
+        tags=['Users'],
+        parameters=[
+            OpenApiParameter(
+                name="fields",
+                description=f"Поля через запятую: {', '.join(USER_LIST_FIELDS)}",
+                required=False,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="cursor",
+                description="next_cursor из предыдущей страницы",
+                required=False,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="limit",
+                description="Размер страницы",
+                required=False,
+                type=int,
+            ),
+            OpenApiParameter(
+                name="export",
+                description="1 — выгрузить всех пользователей одним потоковым JSON массивом (только для staff)",
+                required=False,
+                type=bool,
+            ),
+        ],
+        responses=UserPageSerializer,
+    )
     def get(self, request):
         """
-        Получить всех пользователей
+        Получить пользователей \n
+        Keyset-пагинация по id; export=1 отдаёт всех пользователей потоком, не собирая ответ в памяти
         """
         user = request.user
         assert isinstance(user, User)
 
-        users = User.objects.all()
-        serializer = UserSerializer(users, many=True)
-
+        fields = self.get_fields(request)
+        # id нужен для курсора, даже если его не запросили
+        users = User.objects.order_by("id").values(*dict.fromkeys(["id", *fields]))
+
+        if request.query_params.get("export") in ("1", "true", "True"):
+            if not user.is_staff:
+                return Response({"error": "Выгрузка доступна только администраторам"}, status=status.HTTP_403_FORBIDDEN)
+            logger.info("Выгрузка пользователей администратором %s", user.username)
+            response = StreamingHttpResponse(
+                stream_json_array(users, fields),
+                content_type="application/json",
+            )
+            response["Content-Disposition"] = 'attachment; filename="users.json"'
+            return response
+
+        limit = get_page_size(request)
+        cursor = request.query_params.get("cursor")
+        if cursor:
+            (last_id,) = decode_cursor(cursor, 1)
+            users = users.filter(id__gt=cursor_id(last_id))
+
+        rows = list(users[:limit + 1])
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1]["id"]])
+
+        serializer = UserListSerializer(rows, many=True, fields=fields)
         logger.info("Успешный запрос информации пользователей")
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response({"results": serializer.data, "next_cursor": next_cursor}, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def get_fields(request):
+        fields = request.query_params.get("fields")
+        if not fields:
+            return list(USER_LIST_FIELDS)
+        fields = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in fields if field not in USER_LIST_FIELDS]
+        if unknown or not fields:
+            raise ValidationError({"fields": f"Допустимые поля: {', '.join(USER_LIST_FIELDS)}"})
+        return list(dict.fromkeys(fields))
+
+
+async def stream_json_array(queryset, fields):
+    """
+    JSON массив строк queryset по частям.
+    aiterator читает Postgres server-side курсором пачками по EXPORT_CHUNK_SIZE,
+    поэтому память не зависит от числа строк. Генератор асинхронный: синхронный
+    StreamingHttpResponse под ASGI был бы сначала целиком прочитан в память.
+    """
+    yield "["
+    separator = ""
+    batch = []
+    async for row in queryset.aiterator(chunk_size=EXPORT_CHUNK_SIZE):
+        batch.append(json.dumps({field: row[field] for field in fields}, cls=DjangoJSONEncoder, ensure_ascii=False))
+        if len(batch) >= EXPORT_CHUNK_SIZE:
+            yield separator + ",".join(batch)
+            separator = ","
+            batch = []
+    if batch:
+        yield separator + ",".join(batch)
+    yield "]"
 
 
 class ChangeUserView(APIView):
@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class ChatAppConfig(AppConfig):
+    name = "chat_app"
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,111 @@
+import logging
+import uuid
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import BlacklistMixin, RefreshToken
+from .cache import TTLCache
+from .metrics import register_cache
+from .models import ClaimsUser
+from .revocation import revoked_tokens
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# Поля пользователя, которые кладутся в токен и нужны API без похода в БД
+USER_CLAIMS = ("username", "is_staff")
+# Сессия входа, общая для всех refresh/access токенов, выпущенных ротацией (см. chat_app.refresh_tokens)
+SESSION_CLAIM = "sid"
+
+_conf = getattr(settings, "REST_JWT_AUTH", {})
+
+# Пользователи, загруженные из БД для токенов без claims: user_id -> User
+user_cache = TTLCache(
+    max_size=_conf.get("USER_CACHE_SIZE", 10000),
+    ttl=_conf.get("USER_CACHE_TTL", 60),
+)
+register_cache("rest_jwt_user", user_cache)
+
+
+class ChatRefreshToken(RefreshToken):
+    """
+    Refresh token с USER_CLAIMS и SESSION_CLAIM; access token из него получает те же claims.
+    Сессии и отзыв живут в Redis (chat_app.refresh_tokens, chat_app.revocation),
+    таблицы token_blacklist при входе и ротации не используются
+    """
+
+    @classmethod
+    def for_user(cls, user, sid=None):
+        """sid — сессия, которую продолжает ротация; без него начинается новая"""
+        # мимо BlacklistMixin.for_user: он пишет OutstandingToken на каждый вход и ротацию
+        token = super(BlacklistMixin, cls).for_user(user)
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        token[SESSION_CLAIM] = sid or uuid.uuid4().hex
+        return token
+
+    def check_blacklist(self):
+        """Отзыв проверяется по revoked_tokens (фильтр в памяти), без запроса к таблицам blacklist"""
+        if revoked_tokens.is_revoked(jti=self.get(api_settings.JTI_CLAIM), sid=self.get(SESSION_CLAIM)):
+            raise TokenError("Token is blacklisted")
+
+    def blacklist(self):
+        """Отозвать refresh до его exp: запись в Redis и во все процессы через pub/sub"""
+        revoked_tokens.revoke(self["exp"], jti=self[api_settings.JTI_CLAIM])
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    Bearer access token для REST API.
+    Токен проверяется только по подписи, сроку и отзыву: пользователь собирается из claims
+    (ClaimsUser только для чтения), без запроса в БД и без хэширования пароля.
+    is_active в БД не проверяется: деактивация пользователя отзывает его сессии (chat_app.signals),
+    и токены с sid перестают приниматься сразу; токены без sid действуют до своего exp (ACCESS_TOKEN_LIFETIME).
+    Токены без USER_CLAIMS (выпущены раньше) или при STATELESS=False — пользователь из БД
+    через кэш процесса на USER_CACHE_TTL секунд.
+    """
+
+    stateless = _conf.get("STATELESS", True)
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if revoked_tokens.is_revoked(
+            jti=validated_token.get(api_settings.JTI_CLAIM), sid=validated_token.get(SESSION_CLAIM),
+        ):
+            raise InvalidToken("Токен отозван")
+        return validated_token
+
+    def get_user(self, validated_token):
+        if self.stateless and all(claim in validated_token for claim in USER_CLAIMS):
+            return self.user_from_claims(validated_token)
+
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        user = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+        return user
+
+    @staticmethod
+    def user_from_claims(validated_token):
+        try:
+            user_id = User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, ValueError) as e:
+            raise InvalidToken("В токене нет id пользователя") from e
+
+        # неактивным пользователям токены не выдаются, а их сессии отзываются при деактивации
+        user = ClaimsUser(pk=user_id, is_active=True, **{claim: validated_token[claim] for claim in USER_CLAIMS})
+        # объект ведёт себя как загруженный из БД: related managers (user.rooms) работают по pk
+        user._state.adding = False
+        user._state.db = ClaimsUser.objects.db
+        return user
+
+
+class StatelessJWTScheme(SimpleJWTScheme):
+    """Bearer JWT в схеме OpenAPI (расширение drf-spectacular не матчит наследников)"""
+
+    target_class = StatelessJWTAuthentication
@@ -0,0 +1,64 @@
+import bisect
+import functools
+import hashlib
+from channels_redis.core import RedisChannelLayer
+
+
+class HashRing:
+    """
+    Кольцо консистентного хеширования с виртуальными узлами.
+    При добавлении узла к нему переезжает примерно 1/N ключей,
+    остальные остаются на прежних узлах.
+    """
+
+    def __init__(self, nodes, replicas=160, cache_size=65536):
+        if not nodes:
+            raise ValueError("Кольцо не может быть пустым")
+        points = []
+        for index, node in enumerate(nodes):
+            for replica in range(replicas):
+                points.append((self._hash(f"{node}#{replica}"), index))
+        points.sort()
+        self._hashes = [point for point, _ in points]
+        self._indexes = [index for _, index in points]
+        self.get = functools.lru_cache(maxsize=cache_size)(self._get)
+
+    @staticmethod
+    def _hash(value):
+        if isinstance(value, str):
+            value = value.encode("utf8")
+        return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), "big")
+
+    def _get(self, value):
+        position = bisect.bisect(self._hashes, self._hash(value))
+        if position == len(self._hashes):
+            position = 0
+        return self._indexes[position]
+
+
+class ShardedRedisChannelLayer(RedisChannelLayer):
+    """
+    RedisChannelLayer, который раскладывает группы (chat_{room_name}) и очереди каналов
+    по шардам через консистентное хеширование.
+    Стандартный слой делит диапазон crc32 на равные части, поэтому при добавлении шарда
+    переезжает около половины комнат.
+    """
+
+    def __init__(self, hosts=None, ring_replicas=160, **kwargs):
+        super().__init__(hosts=hosts, **kwargs)
+        # Узел кольца определяется адресом, а не позицией в списке
+        nodes = [self._node_name(host) for host in self.hosts]
+        self.ring = HashRing(nodes, replicas=ring_replicas)
+
+    @staticmethod
+    def _node_name(host):
+        if "address" in host:
+            return host["address"]
+        if "master_name" in host:
+            return f"sentinel:{host['master_name']}"
+        return f"{host.get('host', 'localhost')}:{host.get('port', 6379)}/{host.get('db', 0)}"
+
+    def consistent_hash(self, value):
+        if self.ring_size == 1:
+            return 0
+        return self.ring.get(value)
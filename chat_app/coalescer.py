@@ -0,0 +1,45 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+class StateCoalescer:
+    """
+    Копит изменения состояния (вошёл/вышел, печатает/перестал) по комнатам
+    и отдаёт их одной пачкой раз в window секунд.
+    Противоположные изменения одного ключа внутри окна взаимно гасятся.
+    """
+
+    def __init__(self, window, on_flush):
+        self.window = window
+        # on_flush(room_name, {key: (state, info)})
+        self.on_flush = on_flush
+        self._pending = defaultdict(dict)
+        self._task = None
+
+    def update(self, room_name, key, state, info=None):
+        changes = self._pending[room_name]
+        previous = changes.get(key)
+        if previous is not None and previous[0] != state:
+            del changes[key]
+        else:
+            changes[key] = (state, info)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def flush(self):
+        pending, self._pending = self._pending, defaultdict(dict)
+        for room_name, changes in pending.items():
+            if not changes:
+                continue
+            try:
+                await self.on_flush(room_name, changes)
+            except Exception as e:
+                logger.error("Ошибка при отправке пачки событий комнаты %s: %s", room_name, e)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        await self.flush()
@@ -0,0 +1,114 @@
+import json
+import zlib
+import msgpack
+from django.conf import settings
+
+try:
+    import orjson
+except ImportError:  # orjson не обязателен, без него используется стандартный json
+    orjson = None
+
+
+class JsonCodec:
+    name = "json"
+
+    @staticmethod
+    def dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    name = "orjson"
+
+    @staticmethod
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+
+    @staticmethod
+    def loads(data):
+        return orjson.loads(data)
+
+
+class MsgpackCodec:
+    """
+    Бинарные фреймы подпротокола chat.msgpack: 1 байт флага + тело в MessagePack.
+    Тела больше compress_threshold байт сжимаются zlib (флаг FLAG_DEFLATE).
+    """
+
+    name = "msgpack"
+
+    FLAG_RAW = 0
+    FLAG_DEFLATE = 1
+
+    def __init__(self, compress_threshold=0, compress_level=6, max_size=1024 * 1024):
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self.max_size = max_size
+
+    def dumps(self, obj) -> bytes:
+        body = msgpack.packb(obj, use_bin_type=True)
+        if self.compress_threshold and len(body) > self.compress_threshold:
+            return bytes((self.FLAG_DEFLATE,)) + zlib.compress(body, self.compress_level)
+        return bytes((self.FLAG_RAW,)) + body
+
+    def loads(self, data: bytes):
+        if not data:
+            raise ValueError("Пустой фрейм")
+
+        flag, body = data[0], data[1:]
+        if flag == self.FLAG_DEFLATE:
+            decompressor = zlib.decompressobj()
+            try:
+                body = decompressor.decompress(body, self.max_size)
+            except zlib.error as e:
+                raise ValueError(f"Не удалось распаковать фрейм: {e}")
+            if decompressor.unconsumed_tail:
+                raise ValueError("Фрейм превышает допустимый размер")
+        elif flag != self.FLAG_RAW:
+            raise ValueError(f"Неизвестный флаг фрейма: {flag}")
+
+        return msgpack.unpackb(body, raw=False)
+
+
+def get_json_codec(name="auto"):
+    """
+    Сериализатор WebSocket фреймов.
+    auto — orjson, если установлен, иначе стандартный json.
+    """
+    if name == "auto":
+        return OrjsonCodec if orjson is not None else JsonCodec
+    if name == "orjson":
+        if orjson is None:
+            raise ImportError("WS_JSON_CODEC=orjson, но пакет orjson не установлен")
+        return OrjsonCodec
+    if name == "json":
+        return JsonCodec
+    raise ValueError(f"Неизвестный WS_JSON_CODEC: {name}")
+
+
+json_codec = get_json_codec(getattr(settings, "WS_JSON_CODEC", "auto"))
+
+_binary_conf = getattr(settings, "WS_BINARY_PROTOCOL", {})
+msgpack_codec = MsgpackCodec(
+    compress_threshold=_binary_conf.get("COMPRESS_THRESHOLD", 0),
+    compress_level=_binary_conf.get("COMPRESS_LEVEL", 6),
+)
+BINARY_ENABLED = _binary_conf.get("ENABLED", True)
+
+
+def build_event(handler, payload):
+    """
+    Событие для рассылки в комнату: фреймы кодируются один раз здесь,
+    consumer'ы получателей пересылают их как есть.
+    """
+    event = {
+        "type": handler,
+        "frame": json_codec.dumps(payload),
+    }
+    if BINARY_ENABLED:
+        event["frame_bin"] = msgpack_codec.dumps(payload)
+    return event
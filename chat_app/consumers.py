@@ -1,78 +1,253 @@
-import json
 import logging
+import urllib.parse
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from channels.db import aclose_old_connections
 from django.contrib.auth import get_user_model
-from .models import Message, Room
+from .codecs import BINARY_ENABLED, build_event, json_codec, msgpack_codec
+from .fanout import broadcast, group_name, room_fanout
+from .history import recent_messages
+from .membership import room_membership
+from .metrics import registry, save_message_seconds, ws_connections, ws_messages_received
+from .models import Room
+from .outbound import OutboundQueue
+from .persistence import message_writer
+from .presence import presence
+from .ratelimit import rate_limiter
+from .typing_indicators import typing_indicators
+from .unread import unread_counters
 
 logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
+# Типы входящих сообщений для метрик, остальное считается как message
+CLIENT_EVENT_TYPES = ("heartbeat", "typing", "stop_typing", "read")
+
+# Подпротоколы WebSocket (Sec-WebSocket-Protocol)
+SUBPROTOCOL_JSON = "chat.json"
+SUBPROTOCOL_MSGPACK = "chat.msgpack"
+
+# Коды закрытия соединения до accept
+CLOSE_CODE_UNAUTHORIZED = 4401
+CLOSE_CODE_FORBIDDEN = 4403
+
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    async def websocket_connect(self, message):
+        try:
+            await super().websocket_connect(message)
+        finally:
+            # async ORM сам соединение не закрывает: после запросов connect (пользователь, комната,
+            # участники) возвращаем его в пул, чтобы сломанное соединение не жило дольше подключения
+            await aclose_old_connections()
+
     async def connect(self):
         self.room_name = self.scope['url_route']['kwargs']['room_name']
-        self.room_group_name = f'chat_{self.room_name}'
+        self.room_group_name = group_name(self.room_name)
+
+        # Комната и пользователь не меняются за время соединения — резолвим один раз
+        self.room_id = await self.get_room_id(self.room_name)
+        if self.room_id is None:
+            logger.warning("Попытка подключения к несуществующей комнате: %s", self.room_name)
+            await self.close()
+            return
+
+        user = self.scope["user"]
+        self.user_id = user.pk if user.is_authenticated else None
+        self.username = user.username if user.is_authenticated else "Anonymous"
+
+        if room_membership.enforce:
+            if self.user_id is None:
+                logger.warning("Анонимное подключение к комнате %s отклонено", self.room_name)
+                await self.close(code=CLOSE_CODE_UNAUTHORIZED)
+                return
+            if not await room_membership.is_member(self.room_id, self.user_id):
+                logger.warning("Пользователь %s не участник комнаты %s, подключение отклонено", self.username, self.room_name)
+                await self.close(code=CLOSE_CODE_FORBIDDEN)
+                return
+
+        # JSON по умолчанию, MessagePack — если клиент запросил chat.msgpack
+        subprotocols = self.scope.get("subprotocols") or []
+        subprotocol = None
+        if BINARY_ENABLED and SUBPROTOCOL_MSGPACK in subprotocols:
+            subprotocol = SUBPROTOCOL_MSGPACK
+        elif SUBPROTOCOL_JSON in subprotocols:
+            subprotocol = SUBPROTOCOL_JSON
+        self.binary = subprotocol == SUBPROTOCOL_MSGPACK
 
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
-        await self.accept()
+        await self.accept(subprotocol=subprotocol)
+
+        # Все исходящие фреймы идут через ограниченную очередь соединения, см. WS_OUTBOUND
+        self.outbound = OutboundQueue.from_settings(
+            send=lambda text_data, bytes_data: self.send(text_data=text_data, bytes_data=bytes_data),
+            close=self.close,
+            resync_frame=self.resync_frame,
+        )
+        ws_connections.inc()
+        registry.ensure_pusher()
+        await room_fanout.join(self.room_name, self)
+
+        if self.user_id is not None:
+            await presence.join(self.room_name, self.user_id, self.username)
 
-        user = self.scope["user"]
-        username = user.username if user.is_authenticated else "Anonymous"
         # приветственное сообщение
-        await self.send(text_data=json.dumps({
-            "message": f"Подключено к комнате: {self.room_name} as {username}"
-        }))
+        await self.send_payload({
+            "message": f"Подключено к комнате: {self.room_name} as {self.username}"
+        })
+
+        # последние сообщения комнаты из Redis, клиент может отказаться через ?replay=0
+        query = urllib.parse.parse_qs(self.scope.get("query_string", b"").decode())
+        if recent_messages.replay_on_connect and query.get("replay", ["1"])[0] != "0":
+            for frame in await recent_messages.get(self.room_name):
+                await self.send_frame(frame)
 
     async def disconnect(self, close_code):
+        # соединение не было принято (нет комнаты или доступа) — убирать нечего
+        outbound = getattr(self, "outbound", None)
+        if outbound is None:
+            return
+
+        outbound.close()
+        ws_connections.dec()
+
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name,
         )
+        await room_fanout.leave(self.room_name, self)
+
+        if self.user_id is not None:
+            typing_indicators.stopped(self.room_name, self.user_id)
+            await presence.leave(self.room_name, self.user_id)
 
     async def receive(self, text_data=None, bytes_data=None, **kwargs):
-        if not text_data:
+        if text_data:
+            try:
+                data = json_codec.loads(text_data)
+            except ValueError as e:
+                logger.warning(f"Ошибка JSON: {e} | text_data: {repr(text_data)} — игнорируем")
+                return
+        elif bytes_data and self.binary:
+            try:
+                data = msgpack_codec.loads(bytes_data)
+            except ValueError as e:
+                logger.warning(f"Ошибка MessagePack: {e} — игнорируем")
+                return
+        else:
             return
 
-        try:
-            data = json.loads(text_data)
-        except json.JSONDecodeError as e:
-            logger.warning(f"Ошибка JSON: {e} | text_data: {repr(text_data)} — игнорируем")
+        if not isinstance(data, dict):
+            return
+
+        event_type = data.get("type")
+        ws_messages_received.labels(event_type if event_type in CLIENT_EVENT_TYPES else "message").inc()
+        if event_type == "heartbeat":
+            if self.user_id is not None:
+                await presence.heartbeat(self.room_name, self.user_id)
+            return
+        if event_type == "typing":
+            if self.user_id is not None:
+                typing_indicators.typing(self.room_name, self.user_id, self.username)
+            return
+        if event_type == "stop_typing":
+            if self.user_id is not None:
+                typing_indicators.stopped(self.room_name, self.user_id)
+            return
+        if event_type == "read":
+            if self.user_id is not None:
+                await self.mark_read()
             return
 
         message = data.get("message")
 
-        if not message:
+        if not message or not isinstance(message, str):
             return
 
-        user = self.scope.get("user")
-        username = user.username if user and user.is_authenticated else "Anonymous"
+        if self.user_id is not None:
+            sender = ("user", self.user_id)
+        else:
+            sender = ("anon", (self.scope.get("client") or ("unknown",))[0])
+        limited = await rate_limiter.check(sender, ("room", self.room_name))
+        if limited is not None:
+            scope, retry_after_ms = limited
+            await self.send_payload({
+                "type": "error",
+                "code": "rate_limited",
+                "scope": scope,
+                "retry_after_ms": retry_after_ms,
+            })
+            return
 
-        await self.save_message(username, self.room_name, message)
+        if self.user_id is not None:
+            typing_indicators.stopped(self.room_name, self.user_id)
+            try:
+                await self.save_message(message)
+            except Exception as e:
+                # режимы flush/sync: сообщение не сохранено — не рассылаем, соединение не рвём
+                logger.error("Сообщение пользователя %s в комнате %s не сохранено: %s", self.user_id, self.room_name, e)
+                await self.send_payload({"type": "error", "code": "save_failed"})
+                return
+            await unread_counters.message(self.room_id, self.user_id)
 
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "chat_message",
-                "username": username,
-                "message": message,
-            }
-        )
+        # Фрейм кодируется один раз на отправителе, получатели пересылают его как есть
+        event = build_event("chat_message", {
+            "username": self.username,
+            "message": message,
+        })
+
+        await recent_messages.push(self.room_name, event["frame"])
+
+        # Большие комнаты — одна публикация на процесс вместо копии на каждого участника
+        await broadcast(self.room_name, event)
 
     async def chat_message(self, event):
         """Получить сообщение redis и отправить всем участникам"""
-        await self.send(text_data=json.dumps({
-            "username": event["username"],
-            "message": event["message"],
-        }))
-
-    @database_sync_to_async
-    def save_message(self, username, room_name, message):
-        user = User.objects.filter(username=username).first()
-        room = Room.objects.filter(name=room_name).first()
-        if room and user:
-            Message.objects.create(user=user, room=room, content=message)
+        await self.send_frame(event["frame"], event.get("frame_bin"))
+
+    async def presence_update(self, event):
+        """Пачка событий входа/выхода участников комнаты"""
+        await self.send_frame(event["frame"], event.get("frame_bin"))
+
+    async def typing_update(self, event):
+        """Кто в комнате набирает текст, одним фреймом за интервал"""
+        await self.send_frame(event["frame"], event.get("frame_bin"))
+
+    async def send_payload(self, payload):
+        """Отправить событие в протоколе соединения"""
+        if self.binary:
+            self.outbound.put(bytes_data=msgpack_codec.dumps(payload))
+        else:
+            self.outbound.put(text_data=json_codec.dumps(payload))
+
+    async def send_frame(self, frame, frame_bin=None):
+        """Переслать готовый фрейм; для бинарных клиентов JSON перекодируется, если нет frame_bin"""
+        if not self.binary:
+            self.outbound.put(text_data=frame)
+        elif frame_bin is not None:
+            self.outbound.put(bytes_data=frame_bin)
+        else:
+            self.outbound.put(bytes_data=msgpack_codec.dumps(json_codec.loads(frame)))
+
+    def resync_frame(self, missed):
+        """Фрейм для клиента, который отстал и потерял часть сообщений"""
+        payload = {"type": "resync", "missed": missed}
+        if self.binary:
+            return None, msgpack_codec.dumps(payload)
+        return json_codec.dumps(payload), None
+
+    async def save_message(self, message):
+        """Сохранение идёт через write-behind буфер, см. MESSAGE_PERSISTENCE"""
+        with save_message_seconds.time():
+            await message_writer.save(self.user_id, self.room_id, message)
+
+    async def mark_read(self):
+        """Маркер прочтения: счётчик в Redis обнуляется сразу, момент прочтения сохраняется в БД"""
+        await unread_counters.mark_read(self.room_id, self.user_id)
+        await unread_counters.save_cursor(self.room_id, self.user_id)
+
+    async def get_room_id(self, room_name):
+        return await Room.objects.filter(name=room_name).values_list("id", flat=True).afirst()
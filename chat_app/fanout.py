@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import defaultdict
+import msgpack
+from channels.layers import get_channel_layer
+from django.conf import settings
+from redis.exceptions import RedisError
+from .cache import TTLCache
+from .metrics import broadcast_seconds, messages_broadcast
+from .redis_client import async_redis_raw_client
+
+logger = logging.getLogger(__name__)
+
+# Подключений в комнате по всем воркерам: поле hash — воркер, значение — "<подключений>:<живо до>".
+# Поля воркеров, которые перестали обновляться (упали), не считаются и удаляются
+MEMBERS_LUA = """
+local total = 0
+local now = tonumber(ARGV[1])
+local fields = redis.call('HGETALL', KEYS[1])
+for i = 1, #fields, 2 do
+    local count, expires = string.match(fields[i + 1], '^(%d+):(%d+)$')
+    if count and tonumber(expires) > now then
+        total = total + tonumber(count)
+    else
+        redis.call('HDEL', KEYS[1], fields[i])
+    end
+end
+return total
+"""
+
+
+def group_name(room_name):
+    """Группа channel layer для комнаты"""
+    return f"chat_{room_name}"
+
+
+class RoomFanout:
+    """
+    Node-level fan-out для больших комнат.
+    Сообщение публикуется один раз в Redis pub/sub канал комнаты,
+    каждый процесс подписан только на комнаты, где у него есть локальные участники,
+    и сам раздаёт сообщение своим consumer'ам.
+    В обычном режиме group_send кладёт копию сообщения в очередь каждого участника.
+    Число подключений комнаты для MEMBER_THRESHOLD: каждый воркер пишет своё число в hash
+    fanout:members:<room> и раз в heartbeat_interval продлевает его на members_ttl.
+    """
+
+    channel_prefix = "fanout:room:"
+    members_prefix = "fanout:members:"
+
+    def __init__(
+        self, client, enabled=True, pubsub_rooms=(), member_threshold=0, mode_cache_ttl=2,
+        heartbeat_interval=15, members_ttl=45,
+    ):
+        self.client = client
+        self.enabled = enabled
+        self.pubsub_rooms = set(pubsub_rooms)
+        self.member_threshold = member_threshold
+        self.heartbeat_interval = heartbeat_interval
+        self.members_ttl = members_ttl
+        # Режим комнаты кэшируется ненадолго, чтобы не читать счётчик на каждое сообщение
+        self._modes = TTLCache(max_size=10000, ttl=mode_cache_ttl)
+        self._local = defaultdict(set)
+        self._pubsub = None
+        self._task = None
+        self._heartbeat_task = None
+        self._members = client.register_script(MEMBERS_LUA)
+
+    @classmethod
+    def from_settings(cls, client):
+        conf = getattr(settings, "ROOM_FANOUT", {})
+        return cls(
+            client,
+            enabled=conf.get("ENABLED", True),
+            pubsub_rooms=conf.get("PUBSUB_ROOMS", ()),
+            member_threshold=conf.get("MEMBER_THRESHOLD", 0),
+            mode_cache_ttl=conf.get("MODE_CACHE_TTL", 2),
+            heartbeat_interval=conf.get("HEARTBEAT_INTERVAL", 15),
+            members_ttl=conf.get("MEMBERS_TTL", 45),
+        )
+
+    def channel(self, room_name):
+        return f"{self.channel_prefix}{room_name}"
+
+    def members_key(self, room_name):
+        return f"{self.members_prefix}{room_name}"
+
+    @property
+    def worker_id(self):
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    async def join(self, room_name, consumer):
+        """Зарегистрировать локального участника; первый участник подписывает процесс на комнату"""
+        if not self.enabled:
+            return
+
+        # локальное состояние меняется до первого await: join/leave соседних соединений идут конкурентно
+        first = not self._local[room_name]
+        self._local[room_name].add(consumer)
+
+        try:
+            if self.member_threshold:
+                self._ensure_heartbeat()
+                await self._write_members(room_name)
+            if first:
+                await self._subscribe(room_name)
+        except RedisError as e:
+            logger.warning("Fan-out: не удалось подписаться на комнату %s: %s", room_name, e)
+
+    async def leave(self, room_name, consumer):
+        if not self.enabled:
+            return
+
+        consumers = self._local.get(room_name)
+        if consumers is None or consumer not in consumers:
+            return
+        consumers.discard(consumer)
+        if not consumers:
+            del self._local[room_name]
+
+        try:
+            if self.member_threshold:
+                await self._write_members(room_name)
+            # пока ждали Redis, в комнату мог зайти новый участник
+            if room_name not in self._local and self._pubsub is not None:
+                await self._pubsub.unsubscribe(self.channel(room_name))
+        except RedisError as e:
+            logger.warning("Fan-out: не удалось отписаться от комнаты %s: %s", room_name, e)
+
+    async def use_pubsub(self, room_name):
+        """Рассылать ли сообщения комнаты через pub/sub вместо group_send"""
+        if not self.enabled:
+            return False
+        if room_name in self.pubsub_rooms:
+            return True
+        if not self.member_threshold:
+            return False
+
+        mode = self._modes.get(room_name)
+        if mode is None:
+            try:
+                members = await self._members(keys=[self.members_key(room_name)], args=[int(time.time())])
+            except RedisError as e:
+                logger.warning("Fan-out: не удалось получить число участников комнаты %s: %s", room_name, e)
+                return False
+            mode = members >= self.member_threshold
+            self._modes.set(room_name, mode)
+        return mode
+
+    async def _write_members(self, room_name):
+        async with self.client.pipeline(transaction=False) as pipe:
+            self._queue_members(pipe, room_name)
+            await pipe.execute()
+
+    def _queue_members(self, pipe, room_name):
+        """Записать число локальных подключений комнаты: абсолютное значение, а не INCR/DECR"""
+        key = self.members_key(room_name)
+        count = len(self._local.get(room_name, ()))
+        if count:
+            pipe.hset(key, self.worker_id, f"{count}:{int(time.time()) + self.members_ttl}")
+            pipe.expire(key, self.members_ttl)
+        else:
+            pipe.hdel(key, self.worker_id)
+
+    def _ensure_heartbeat(self):
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.get_running_loop().create_task(self._heartbeat())
+
+    async def _heartbeat(self):
+        while self._local:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                async with self.client.pipeline(transaction=False) as pipe:
+                    for room_name in list(self._local):
+                        self._queue_members(pipe, room_name)
+                    await pipe.execute()
+            except RedisError as e:
+                logger.error("Fan-out: не удалось обновить число участников: %s", e)
+
+    async def publish(self, room_name, event):
+        await self.client.publish(self.channel(room_name), msgpack.packb(event, use_bin_type=True))
+
+    async def _subscribe(self, room_name):
+        if self._pubsub is None:
+            self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.channel(room_name))
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+        """
+        Раздать сообщения pub/sub локальным участникам.
+        После ошибки соединения подписки восстанавливаются с паузой от 0.5 до 30 секунд,
+        сообщение, которое не удалось разобрать, пропускается.
+        """
+        delay = 0
+        while self._local or self._pubsub.subscribed:
+            try:
+                if delay:
+                    await self._resubscribe()
+                message = await self._pubsub.get_message(timeout=1.0)
+            except Exception as e:
+                delay = min(delay * 2 or 0.5, 30)
+                logger.error("Fan-out: ошибка pub/sub, переподписка через %.1f с: %s", delay, e)
+                await asyncio.sleep(delay)
+                continue
+            delay = 0
+
+            if message is not None and message["type"] == "message":
+                await self._deliver(message)
+
+    async def _deliver(self, message):
+        room_name = message["channel"].decode()[len(self.channel_prefix):]
+        consumers = list(self._local.get(room_name, ()))
+        if not consumers:
+            return
+
+        try:
+            event = msgpack.unpackb(message["data"], raw=False)
+        except (ValueError, msgpack.UnpackException) as e:
+            logger.warning("Fan-out: пропущено сообщение комнаты %s, не удалось разобрать: %s", room_name, e)
+            return
+
+        results = await asyncio.gather(
+            *(consumer.dispatch(event) for consumer in consumers),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning("Fan-out: ошибка доставки в комнату %s: %s", room_name, result)
+
+    async def _resubscribe(self):
+        """Новое соединение pub/sub с подписками на все комнаты, где есть локальные участники"""
+        broken, self._pubsub = self._pubsub, self.client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await broken.aclose()
+        except (RedisError, OSError):
+            pass
+        channels = [self.channel(room_name) for room_name in self._local]
+        if channels:
+            await self._pubsub.subscribe(*channels)
+        logger.info("Fan-out: переподписка на %s комнат", len(channels))
+
+
+room_fanout = RoomFanout.from_settings(async_redis_raw_client)
+
+
+async def broadcast(room_name, event):
+    """Разослать событие всем участникам комнаты: через pub/sub для больших комнат, иначе group_send"""
+    mode = "pubsub" if await room_fanout.use_pubsub(room_name) else "group"
+    with broadcast_seconds.labels(mode).time():
+        if mode == "pubsub":
+            await room_fanout.publish(room_name, event)
+        else:
+            await get_channel_layer().group_send(group_name(room_name), event)
+    messages_broadcast.labels(mode).inc()
@@ -0,0 +1,67 @@
+import logging
+from django.conf import settings
+from redis.exceptions import RedisError
+from .redis_client import async_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class RecentMessages:
+    """
+    Кольцевой буфер последних сообщений комнаты в Redis.
+    Хранятся готовые фреймы в том виде, в каком их получают клиенты,
+    поэтому при подключении история отдаётся без обращения к БД.
+    """
+
+    key_prefix = "chat:recent:"
+
+    def __init__(self, client, enabled=True, size=50, ttl=0, replay_on_connect=True):
+        self.client = client
+        self.enabled = enabled and size > 0
+        self.size = size
+        self.ttl = ttl
+        self.replay_on_connect = replay_on_connect
+
+    @classmethod
+    def from_settings(cls, client):
+        conf = getattr(settings, "ROOM_RECENT_MESSAGES", {})
+        return cls(
+            client,
+            enabled=conf.get("ENABLED", True),
+            size=conf.get("SIZE", 50),
+            ttl=conf.get("TTL", 0),
+            replay_on_connect=conf.get("REPLAY_ON_CONNECT", True),
+        )
+
+    def key(self, room_name):
+        return f"{self.key_prefix}{room_name}"
+
+    async def push(self, room_name, frame):
+        if not self.enabled:
+            return
+
+        key = self.key(room_name)
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.lpush(key, frame)
+                pipe.ltrim(key, 0, self.size - 1)
+                if self.ttl:
+                    pipe.expire(key, self.ttl)
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning("Не удалось записать сообщение в буфер комнаты %s: %s", room_name, e)
+
+    async def get(self, room_name):
+        """Последние сообщения комнаты, от старых к новым"""
+        if not self.enabled:
+            return []
+
+        try:
+            frames = await self.client.lrange(self.key(room_name), 0, self.size - 1)
+        except RedisError as e:
+            logger.warning("Не удалось прочитать буфер комнаты %s: %s", room_name, e)
+            return []
+        return frames[::-1]
+
+
+recent_messages = RecentMessages.from_settings(async_redis_client)
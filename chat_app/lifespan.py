@@ -0,0 +1,23 @@
+import logging
+from .persistence import message_writer
+
+logger = logging.getLogger(__name__)
+
+
+class LifespanApp:
+    """Обработка ASGI lifespan: при остановке сервера сбрасываем буфер сообщений в БД"""
+
+    async def __call__(self, scope, receive, send):
+        while True:
+            message = await receive()
+
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+
+            elif message["type"] == "lifespan.shutdown":
+                try:
+                    await message_writer.close()
+                except Exception as e:
+                    logger.error("Ошибка при сбросе буфера сообщений: %s", e)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
@@ -0,0 +1,65 @@
+import time
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import RefreshToken, TokenError
+from chat_app.authentication import SESSION_CLAIM
+from chat_app.models import User
+from chat_app.refresh_tokens import refresh_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Перенести refresh токены из User.refresh_token в Redis (chat_app.refresh_tokens). "
+        "Токен без sid становится сессией с sid = jti и живёт до своего exp; "
+        "уже перенесённые сессии не перезаписываются, команду можно запускать повторно"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Пользователей за один запрос к БД")
+        parser.add_argument(
+            "--clear", action="store_true",
+            help="Очистить User.refresh_token у перенесённых, просроченных и невалидных токенов",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Только посчитать, ничего не записывать")
+
+    def handle(self, *args, batch_size, clear, dry_run, **options):
+        users = (
+            User.objects.exclude(refresh_token__isnull=True)
+            .exclude(refresh_token="")
+            .order_by("id")
+            .values_list("id", "refresh_token")
+        )
+
+        imported = existing = invalid = 0
+        processed = []
+        for user_id, raw_token in users.iterator(chunk_size=batch_size):
+            processed.append(user_id)
+            try:
+                # проверяет подпись, срок и чёрный список
+                token = RefreshToken(raw_token)
+            except TokenError:
+                invalid += 1
+                continue
+            if str(token.get("user_id")) != str(user_id):
+                invalid += 1
+                continue
+
+            if dry_run:
+                imported += 1
+                continue
+
+            sid = token.get(SESSION_CLAIM) or token["jti"]
+            ttl = max(1, int(token["exp"] - time.time()))
+            if refresh_tokens.create(user_id, sid, token["jti"], ttl=ttl):
+                imported += 1
+            else:
+                existing += 1
+
+        if clear and not dry_run:
+            for start in range(0, len(processed), batch_size):
+                User.objects.filter(id__in=processed[start:start + batch_size]).update(refresh_token=None)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Перенесено: {imported}, уже в Redis: {existing}, просрочено или невалидно: {invalid}"
+            + (", User.refresh_token очищен" if clear and not dry_run else "")
+            + (" (dry run)" if dry_run else "")
+        ))
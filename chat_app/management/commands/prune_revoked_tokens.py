@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from chat_app.revocation import revoked_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Удалить просроченные записи об отозванных токенах (запускать периодически, например раз в час): "
+        "zset revoked:tokens в Redis с пересборкой фильтров во всех процессах "
+        "и просроченные строки таблиц token_blacklist"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Строк за один DELETE / ZADD")
+        parser.add_argument(
+            "--sync-blacklist", action="store_true",
+            help="Перенести в Redis действующие записи BlacklistedToken (отозванные до перехода на Redis или через admin)",
+        )
+
+    def handle(self, *args, batch_size, sync_blacklist, **options):
+        now = timezone.now()
+
+        synced = 0
+        if sync_blacklist:
+            blacklisted = (
+                BlacklistedToken.objects.filter(token__expires_at__gt=now)
+                .values_list("token__jti", "token__expires_at")
+                .iterator(chunk_size=batch_size)
+            )
+            batch = {}
+            for jti, expires_at in blacklisted:
+                batch[jti] = expires_at.timestamp()
+                if len(batch) >= batch_size:
+                    revoked_tokens.revoke_tokens(batch)
+                    synced += len(batch)
+                    batch = {}
+            revoked_tokens.revoke_tokens(batch)
+            synced += len(batch)
+
+        # после чистки все процессы пересобирают фильтры, в том числе с перенесёнными записями
+        removed = revoked_tokens.prune()
+
+        # BlacklistedToken удаляется каскадом вместе со своим OutstandingToken
+        deleted = 0
+        expired = OutstandingToken.objects.filter(expires_at__lte=now).order_by().values_list("id", flat=True)
+        while True:
+            ids = list(expired[:batch_size])
+            if not ids:
+                break
+            OutstandingToken.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Redis: удалено {removed} просроченных записей"
+            + (f", перенесено из blacklist {synced}" if sync_blacklist else "")
+            + f"; Postgres: удалено {deleted} просроченных токенов"
+        ))
@@ -0,0 +1,91 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from django.utils.dateparse import parse_datetime
+from chat_app.models import Message, Room, User
+from chat_app.persistence import DEAD_LETTER_KEY, DEAD_LETTER_REJECTED_KEY
+from chat_app.redis_client import redis_client
+
+
+class Command(BaseCommand):
+    help = (
+        f"Дописать в БД сообщения, отложенные в Redis ({DEAD_LETTER_KEY}) после неудачной записи пачки. "
+        "Время сообщения сохраняется исходное (момент отправки). "
+        f"Сообщения, которые записать нельзя (комнату или пользователя удалили), переносятся в {DEAD_LETTER_REJECTED_KEY}"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Сообщений за один INSERT")
+
+    def handle(self, *args, batch_size, **options):
+        replayed = rejected = 0
+        while True:
+            items = redis_client.lpop(DEAD_LETTER_KEY, batch_size)
+            if not items:
+                break
+
+            valid, invalid = self._split(items)
+            try:
+                saved, failed = self._save(valid)
+            except Exception as e:
+                # БД недоступна: пачка возвращается в начало списка, порядок сохраняется
+                redis_client.lpush(DEAD_LETTER_KEY, *reversed([item for item, _ in valid]))
+                if invalid:
+                    redis_client.rpush(DEAD_LETTER_REJECTED_KEY, *invalid)
+                raise CommandError(f"Записано {replayed} сообщений, остановлено из-за ошибки БД: {e}")
+
+            invalid += failed
+            if invalid:
+                redis_client.rpush(DEAD_LETTER_REJECTED_KEY, *invalid)
+            replayed += saved
+            rejected += len(invalid)
+
+        self.stdout.write(self.style.SUCCESS(f"Записано {replayed} отложенных сообщений"))
+        if rejected:
+            self.stdout.write(self.style.WARNING(f"{rejected} сообщений нельзя записать, перенесены в {DEAD_LETTER_REJECTED_KEY}"))
+
+    @staticmethod
+    def _split(items):
+        """Разобрать пачку: [(item, Message)] для записи и item'ы, у которых нет комнаты или пользователя"""
+        messages, invalid = [], []
+        for item in items:
+            try:
+                entry = json.loads(item)
+                message = Message(user_id=entry["user_id"], room_id=entry["room_id"], content=entry["content"])
+                # у записей, отложенных до появления timestamp в списке, остаётся время повторной записи
+                if entry.get("timestamp"):
+                    message.timestamp = parse_datetime(entry["timestamp"])
+                    if message.timestamp is None:
+                        raise ValueError(entry["timestamp"])
+                messages.append((item, message))
+            except (ValueError, TypeError, KeyError):
+                invalid.append(item)
+
+        room_ids = set(Room.objects.filter(id__in={m.room_id for _, m in messages}).values_list("id", flat=True))
+        user_ids = set(User.objects.filter(id__in={m.user_id for _, m in messages}).values_list("id", flat=True))
+        valid = []
+        for item, message in messages:
+            if message.room_id in room_ids and message.user_id in user_ids:
+                valid.append((item, message))
+            else:
+                invalid.append(item)
+        return valid, invalid
+
+    @staticmethod
+    def _save(valid):
+        """Записать пачку, вернуть (записано, item'ы, отклонённые БД)"""
+        try:
+            Message.objects.bulk_create([message for _, message in valid])
+            return len(valid), []
+        except IntegrityError:
+            # комнату или пользователя удалили после проверки: пишем по одной
+            pass
+
+        saved, failed = 0, []
+        for item, message in valid:
+            try:
+                message.save()
+                saved += 1
+            except IntegrityError:
+                failed.append(item)
+        return saved, failed
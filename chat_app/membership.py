@@ -0,0 +1,122 @@
+import logging
+from django.conf import settings
+from django.db import transaction
+from redis.exceptions import RedisError, WatchError
+from .models import Room
+from .redis_client import async_redis_client, redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class RoomMembership:
+    """
+    Участники комнат в Redis: set room:members:<room_id> с id пользователей.
+    В set всегда лежит служебный элемент SENTINEL — по нему полный set отличается
+    от отсутствующего или собранного частично (SADD в несуществующий ключ).
+    Проверка при подключении — один SMISMEMBER, сколько бы участников ни было в комнате;
+    без SENTINEL set пересобирается из Postgres.
+    Изменения участников приходят из сигналов m2m_changed (chat_app.signals) после коммита.
+    TTL ограничивает время жизни set, если какое-то изменение до Redis не дошло.
+    """
+
+    key_prefix = "room:members:"
+    SENTINEL = "-"
+
+    def __init__(self, client, sync_client, enforce=True, ttl=15 * 60):
+        self.client = client
+        self.sync_client = sync_client
+        self.enforce = enforce
+        self.ttl = ttl
+
+    @classmethod
+    def from_settings(cls, client, sync_client):
+        conf = getattr(settings, "WS_ROOM_MEMBERSHIP", {})
+        return cls(
+            client,
+            sync_client,
+            enforce=conf.get("ENFORCE", True),
+            ttl=conf.get("TTL", 15 * 60),
+        )
+
+    def key(self, room_id):
+        return f"{self.key_prefix}{room_id}"
+
+    async def is_member(self, room_id, user_id):
+        try:
+            is_member, complete = await self.client.smismember(self.key(room_id), [user_id, self.SENTINEL])
+            if complete:
+                return bool(is_member)
+        except RedisError as e:
+            logger.warning("Membership: Redis недоступен, проверяем по БД: %s", e)
+            return await self._is_member_db(room_id, user_id)
+
+        user_ids = await self._rebuild(room_id)
+        return user_id in user_ids
+
+    async def _rebuild(self, room_id):
+        """
+        Собрать set из БД и вернуть участников.
+        WATCH ставится до чтения из БД: если за это время set изменился (сигнал после коммита),
+        EXEC не пройдёт и устаревший снимок не затрёт изменение; set соберёт следующая проверка
+        """
+        key = self.key(room_id)
+        user_ids = None
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                await pipe.watch(key)
+                user_ids = await self._participant_ids(room_id)
+                pipe.multi()
+                pipe.delete(key)
+                pipe.sadd(key, self.SENTINEL, *user_ids)
+                if self.ttl:
+                    pipe.expire(key, self.ttl)
+                await pipe.execute()
+        except WatchError:
+            logger.info("Membership: участники комнаты %s изменились во время пересборки, set не сохранён", room_id)
+            user_ids = None  # снимок мог устареть — ответ по свежему чтению
+        except RedisError as e:
+            logger.warning("Membership: не удалось сохранить участников комнаты %s: %s", room_id, e)
+        if user_ids is None:
+            user_ids = await self._participant_ids(room_id)
+        return user_ids
+
+    @staticmethod
+    async def _participant_ids(room_id):
+        participants = Room.participants.through.objects.filter(room_id=room_id).values_list("user_id", flat=True)
+        return {user_id async for user_id in participants}
+
+    @staticmethod
+    async def _is_member_db(room_id, user_id):
+        return await Room.participants.through.objects.filter(room_id=room_id, user_id=user_id).aexists()
+
+    # Синхронные методы для сигналов: изменения применяются после коммита транзакции
+
+    def added(self, room_id, user_ids):
+        self._on_commit("sadd", room_id, user_ids)
+
+    def removed(self, room_id, user_ids):
+        self._on_commit("srem", room_id, user_ids)
+
+    def reset(self, room_id):
+        """Забыть комнату целиком: set пересоберётся из БД при следующей проверке"""
+        self._on_commit("delete", room_id, ())
+
+    def _on_commit(self, command, room_id, user_ids):
+        user_ids = list(user_ids)
+        if command != "delete" and not user_ids:
+            return
+        transaction.on_commit(lambda: self._apply(command, room_id, user_ids))
+
+    def _apply(self, command, room_id, user_ids):
+        try:
+            getattr(self.sync_client, command)(self.key(room_id), *user_ids)
+        except RedisError as e:
+            logger.error("Membership: не удалось обновить участников комнаты %s: %s", room_id, e)
+            # лучше пересобрать set из БД, чем оставить его неверным
+            try:
+                self.sync_client.delete(self.key(room_id))
+            except RedisError:
+                pass
+
+
+room_membership = RoomMembership.from_settings(async_redis_client, redis_client)
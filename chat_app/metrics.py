@@ -0,0 +1,544 @@
+import atexit
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+from redis.exceptions import RedisError, WatchError
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Границы бакетов гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Снимок собственный не нужен (берётся свежим), остальные читаются вместе с суммой ушедших процессов,
+# одним вызовом, чтобы перенос снимка в сумму не попал между чтениями
+READ_SNAPSHOTS_LUA = """
+local result = {redis.call('GET', KEYS[2]) or false}
+for _, worker in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+    if worker ~= ARGV[2] then
+        table.insert(result, redis.call('GET', ARGV[1] .. worker) or false)
+    end
+end
+return result
+"""
+
+
+class _Cells:
+    """
+    Значения метрики, разложенные по потокам.
+    Каждый поток пишет только в свою ячейку, поэтому на горячем пути нет блокировок;
+    блокировка берётся один раз при первой записи потока и при чтении.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._local = threading.local()
+        self._cells = []
+        self._lock = threading.Lock()
+
+    def cell(self):
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = [0] * self.size
+            with self._lock:
+                self._cells.append(cell)
+            self._local.cell = cell
+            return cell
+
+    def values(self):
+        with self._lock:
+            cells = list(self._cells)
+        return [sum(column) for column in zip(*cells)] if cells else [0] * self.size
+
+
+class _CounterChild:
+    def __init__(self):
+        self._cells = _Cells(1)
+
+    def inc(self, amount=1):
+        self._cells.cell()[0] += amount
+
+    def values(self):
+        return self._cells.values()
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount=1):
+        self._cells.cell()[0] -= amount
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # счётчики по бакетам (последний — +Inf) и сумма наблюдений
+        self._cells = _Cells(len(buckets) + 2)
+
+    def observe(self, value):
+        cell = self._cells.cell()
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def time(self):
+        return _Timer(self)
+
+    def values(self):
+        return self._cells.values()
+
+
+class Metric:
+    kind = None
+    child_class = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        return self.child_class()
+
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}, получено {values}")
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            # setdefault атомарен: при гонке двух потоков останется один child
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def collect(self):
+        """{labelvalues: [значения]} для снимка процесса"""
+        return {values: child.values() for values, child in list(self._children.items())}
+
+
+class Counter(Metric):
+    kind = "counter"
+    child_class = _CounterChild
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(Metric):
+    """Gauge процесса; между процессами значения складываются"""
+
+    kind = "gauge"
+    child_class = _GaugeChild
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+
+class CallbackMetric:
+    """Метрика, значения которой считаются при сборе: callback() -> {labelvalues: значение}"""
+
+    def __init__(self, name, documentation, kind, callback, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def collect(self):
+        return {
+            tuple(str(value) for value in values): [number]
+            for values, number in self.callback().items()
+        }
+
+
+class Registry:
+    """
+    Реестр метрик процесса.
+    Каждый процесс (воркер uvicorn) раз в push_interval секунд кладёт свой снимок в Redis,
+    endpoint складывает снимки живых процессов, так что счётчики видны по всему серверу.
+    Счётчики и гистограммы завершившегося процесса переносятся в постоянную сумму (retired_key),
+    иначе итог по серверу уменьшится и Prometheus примет это за сброс счётчика.
+    """
+
+    key_prefix = "metrics:worker:"
+    workers_key = "metrics:workers"
+    retired_key = "metrics:retired"
+    # снимок хранится дольше, чем процесс считается живым, чтобы его успели перенести в сумму
+    snapshot_ttl = 24 * 3600
+
+    def __init__(self, client, aggregate=True, push_interval=10):
+        self.client = client
+        self.aggregate = aggregate
+        self.push_interval = push_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._metrics = {}
+        self._pusher_pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, client):
+        conf = getattr(settings, "METRICS", {})
+        return cls(
+            client,
+            aggregate=conf.get("AGGREGATE", True),
+            push_interval=conf.get("PUSH_INTERVAL", 10),
+        )
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, kind, callback, labelnames=()):
+        return self.register(CallbackMetric(name, documentation, kind, callback, labelnames))
+
+    def snapshot(self):
+        """Снимок процесса в виде, пригодном для JSON"""
+        families = {}
+        for metric in list(self._metrics.values()):
+            try:
+                samples = metric.collect()
+            except Exception as e:
+                logger.warning("Метрики: не удалось собрать %s: %s", metric.name, e)
+                continue
+            families[metric.name] = {
+                "kind": metric.kind,
+                "help": metric.documentation,
+                "labelnames": list(metric.labelnames),
+                "buckets": list(getattr(metric, "buckets", ())),
+                "samples": [[list(values), numbers] for values, numbers in samples.items()],
+            }
+        return families
+
+    def ensure_pusher(self):
+        """Запустить фоновую отправку снимков в Redis (один поток на процесс, в том числе после fork)"""
+        if not self.aggregate or self._pusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._pusher_pid == os.getpid():
+                return
+            self._pusher_pid = os.getpid()
+            self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+            threading.Thread(target=self._push_loop, name="metrics-pusher", daemon=True).start()
+            atexit.register(self.deregister)
+
+    def deregister(self):
+        """Процесс завершается: последний снимок его счётчиков переходит в постоянную сумму"""
+        # обработчик atexit наследуется после fork, срабатывает только в процессе, который его запустил
+        if self._pusher_pid != os.getpid():
+            return
+        self._pusher_pid = None
+        try:
+            self.push()
+            self._retire([self.worker_id])
+        except RedisError as e:
+            logger.warning("Метрики: не удалось перенести счётчики процесса в сумму: %s", e)
+
+    def _push_loop(self):
+        while True:
+            try:
+                self.push()
+            except RedisError as e:
+                logger.warning("Метрики: не удалось отправить снимок в Redis: %s", e)
+            time.sleep(self.push_interval)
+
+    def push(self):
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.set(f"{self.key_prefix}{self.worker_id}", json.dumps(self.snapshot()), ex=self.snapshot_ttl)
+            pipe.zadd(self.workers_key, {self.worker_id: time.time()})
+            pipe.execute()
+
+    def collect_all(self):
+        """Снимки всех живых процессов и сумма ушедших; снимок текущего процесса берётся свежим"""
+        snapshots = [self.snapshot()]
+        if not self.aggregate:
+            return snapshots
+
+        try:
+            self._retire()
+            raws = self.client.eval(
+                READ_SNAPSHOTS_LUA, 2, self.workers_key, self.retired_key, self.key_prefix, self.worker_id,
+            )
+            snapshots.extend(json.loads(raw) for raw in raws if raw)
+        except RedisError as e:
+            logger.warning("Метрики: не удалось прочитать снимки воркеров: %s", e)
+        return snapshots
+
+    def _retire(self, workers=None):
+        """
+        Перенести счётчики и гистограммы процессов в постоянную сумму и убрать их снимки.
+        По умолчанию — процессов, которые не обновляли снимок три push_interval.
+        """
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(self.workers_key, self.retired_key)
+                if workers is None:
+                    workers = pipe.zrangebyscore(self.workers_key, "-inf", time.time() - self.push_interval * 3)
+                if not workers:
+                    return
+                keys = [f"{self.key_prefix}{worker}" for worker in workers]
+                raws = pipe.mget([self.retired_key, *keys])
+                retired = fold_counters(json.loads(raw) for raw in raws if raw)
+
+                pipe.multi()
+                pipe.zrem(self.workers_key, *workers)
+                pipe.delete(*keys)
+                pipe.set(self.retired_key, json.dumps(retired))
+                pipe.execute()
+            except WatchError:
+                # снимки переносит другой процесс
+                return
+        logger.info("Метрики: счётчики %s процессов перенесены в сумму", len(workers))
+
+    def render(self):
+        return render_text(merge_snapshots(self.collect_all()))
+
+
+def merge_snapshots(snapshots):
+    """Сложить снимки процессов: счётчики, gauge и бакеты гистограмм суммируются"""
+    merged = {}
+    for snapshot in snapshots:
+        for name, family in snapshot.items():
+            target = merged.setdefault(name, {**family, "samples": {}})
+            for values, numbers in family["samples"]:
+                key = tuple(values)
+                current = target["samples"].get(key)
+                target["samples"][key] = numbers if current is None else [a + b for a, b in zip(current, numbers)]
+    return merged
+
+
+def fold_counters(snapshots):
+    """Сложить счётчики и гистограммы снимков в один снимок; gauge ушедших процессов не нужны"""
+    merged = merge_snapshots(
+        {name: family for name, family in snapshot.items() if family["kind"] in ("counter", "histogram")}
+        for snapshot in snapshots
+    )
+    return {
+        name: {**family, "samples": [[list(values), numbers] for values, numbers in family["samples"].items()]}
+        for name, family in merged.items()
+    }
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labelnames, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def render_text(families):
+    """Prometheus text format 0.0.4"""
+    lines = []
+    for name in sorted(families):
+        family = families[name]
+        labelnames = family["labelnames"]
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['kind']}")
+
+        for values, numbers in sorted(family["samples"].items()):
+            if family["kind"] != "histogram":
+                lines.append(f"{name}{_labels(labelnames, values)} {_number(numbers[0])}")
+                continue
+
+            cumulative = 0
+            for bound, count in zip(family["buckets"], numbers):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labelnames, values, [('le', bound)])} {cumulative}")
+            cumulative += numbers[-2]
+            lines.append(f"{name}_bucket{_labels(labelnames, values, [('le', '+Inf')])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labelnames, values)} {_number(numbers[-1])}")
+            lines.append(f"{name}_count{_labels(labelnames, values)} {cumulative}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+registry = Registry.from_settings(redis_client)
+
+# Именованные TTLCache процесса, см. register_cache
+_caches = {}
+
+
+def register_cache(name, cache):
+    """Показывать статистику TTLCache в метриках"""
+    _caches[name] = cache
+
+
+def _cache_stats(field):
+    return {(name,): cache.stats()[field] for name, cache in list(_caches.items())}
+
+
+def _db_pool_stats(field, scale=1):
+    """Поле psycopg_pool get_stats() по пулам соединений БД (если пул включён)"""
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], "pool", None)
+        if pool is not None:
+            value = pool.get_stats().get(field, 0)
+            stats[(alias,)] = value / scale if scale != 1 else value
+    return stats
+
+
+def _address_allowed(address, allowed):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False) for network in allowed)
+
+
+def metrics_view(request):
+    """
+    Prometheus endpoint. Доступ: при заданном METRICS_TOKEN — только с заголовком Authorization: Bearer <token>,
+    без токена — только с адресов METRICS_ALLOWED_IPS; открыть всем — METRICS_PUBLIC=True
+    """
+    conf = getattr(settings, "METRICS", {})
+    if not conf.get("ENABLED", True):
+        raise Http404
+
+    token = conf.get("TOKEN")
+    if token:
+        header = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(header, f"Bearer {token}"):
+            return HttpResponse(status=401)
+    elif not conf.get("PUBLIC", False):
+        if not _address_allowed(request.META.get("REMOTE_ADDR", ""), conf.get("ALLOWED_IPS", ())):
+            return HttpResponse(status=403)
+
+    registry.ensure_pusher()
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
+
+
+# Метрики горячих путей
+ws_connections = registry.gauge("chat_ws_connections", "Открытые WebSocket соединения")
+ws_messages_received = registry.counter(
+    "chat_ws_messages_received_total", "Входящие WebSocket сообщения по типу", ["type"],
+)
+messages_broadcast = registry.counter(
+    "chat_messages_broadcast_total", "Разосланные в комнаты события по способу доставки", ["mode"],
+)
+broadcast_seconds = registry.histogram(
+    "chat_broadcast_seconds", "Время group_send / публикации в pub/sub", ["mode"],
+)
+save_message_seconds = registry.histogram(
+    "chat_save_message_seconds", "Время сохранения сообщения с точки зрения consumer'а",
+)
+message_flush_seconds = registry.histogram(
+    "chat_message_flush_seconds", "Время записи пачки сообщений в БД",
+)
+message_flush_size = registry.histogram(
+    "chat_message_flush_size", "Размер пачки сообщений", buckets=(1, 5, 10, 25, 50, 100, 200, 500, 1000),
+)
+message_flush_failures = registry.counter(
+    "chat_message_flush_failures_total",
+    "Сбои записи сообщений: retry — повтор, failed — попытки кончились, rejected — строку отклонили ограничения БД, "
+    "dead_letter / lost — сообщений отложено в Redis / потеряно",
+    ["outcome"],
+)
+jwt_auth_failures = registry.counter(
+    "chat_jwt_auth_failures_total", "Отклонённые JWT при подключении WebSocket", ["reason"],
+)
+http_request_seconds = registry.histogram(
+    "chat_http_request_seconds", "Время обработки HTTP запросов", ["route", "method", "status"],
+)
+response_cache_requests = registry.counter(
+    "chat_response_cache_requests_total", "Обращения к кэшу ответов API по результату", ["namespace", "result"],
+)
+revocation_checks = registry.counter(
+    "chat_revocation_checks_total",
+    "Проверки отзыва токенов: miss — отсеяно фильтром, not_revoked — ложное срабатывание или нет фильтра",
+    ["result"],
+)
+registry.callback("chat_cache_entries", "Записей в кэше процесса", "gauge", lambda: _cache_stats("size"), ["cache"])
+registry.callback("chat_cache_hits_total", "Попадания в кэш процесса", "counter", lambda: _cache_stats("hits"), ["cache"])
+registry.callback(
+    "chat_cache_misses_total", "Промахи кэша процесса", "counter", lambda: _cache_stats("misses"), ["cache"],
+)
+registry.callback(
+    "chat_db_pool_connections", "Соединений в пуле БД", "gauge", lambda: _db_pool_stats("pool_size"), ["database"],
+)
+registry.callback(
+    "chat_db_pool_available", "Свободных соединений в пуле БД", "gauge",
+    lambda: _db_pool_stats("pool_available"), ["database"],
+)
+registry.callback(
+    "chat_db_pool_waiting", "Запросов, ждущих соединение из пула", "gauge",
+    lambda: _db_pool_stats("requests_waiting"), ["database"],
+)
+registry.callback(
+    "chat_db_pool_requests_total", "Выдач соединений из пула БД", "counter",
+    lambda: _db_pool_stats("requests_num"), ["database"],
+)
+registry.callback(
+    "chat_db_pool_queued_total", "Выдач соединений, которым пришлось ждать", "counter",
+    lambda: _db_pool_stats("requests_queued"), ["database"],
+)
+registry.callback(
+    "chat_db_pool_wait_seconds_total", "Суммарное ожидание соединения из пула", "counter",
+    lambda: _db_pool_stats("requests_wait_ms", 1000), ["database"],
+)
+registry.callback(
+    "chat_db_pool_errors_total", "Запросы соединения, завершившиеся ошибкой или таймаутом", "counter",
+    lambda: _db_pool_stats("requests_errors"), ["database"],
+)
@@ -1,12 +1,19 @@
+import hashlib
 import logging
+import time
 import urllib.parse
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.backends import TokenBackend
-from channels.db import database_sync_to_async
+from rest_framework_simplejwt.exceptions import TokenBackendError
 
+from chat_app.authentication import SESSION_CLAIM
+from chat_app.cache import TTLCache
 from chat_app.config import pydantic_settings
+from chat_app.metrics import http_request_seconds, jwt_auth_failures, register_cache, registry
+from chat_app.revocation import revoked_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -21,19 +28,27 @@ class JWTAuthMiddleware:
             algorithm=algorithm,
             signing_key=pydantic_settings.secret_key
         )
+        # Кэш проверенных токенов: sha256(token) -> (пользователь, jti, sid)
+        cache_conf = getattr(settings, "JWT_AUTH_CACHE", {})
+        self.token_cache = TTLCache(
+            max_size=cache_conf.get("MAX_SIZE", 10000),
+            ttl=cache_conf.get("TTL", 300),
+        )
+        register_cache("jwt_auth", self.token_cache)
 
     async def __call__(self, scope, receive, send):
         scope = dict(scope)
 
-        instance = JWTAuthMiddlewareInstance(scope, self.app, self.token_backend)
+        instance = JWTAuthMiddlewareInstance(scope, self.app, self.token_backend, self.token_cache)
         return await instance(receive, send)
 
 
 class JWTAuthMiddlewareInstance:
-    def __init__(self, scope, app, token_backend):
+    def __init__(self, scope, app, token_backend, token_cache):
         self.scope = scope
         self.app = app
         self.token_backend = token_backend
+        self.token_cache = token_cache
 
     async def __call__(self, receive, send):
         self.scope["user"] = AnonymousUser()
@@ -60,20 +75,85 @@ class JWTAuthMiddlewareInstance:
         return await self.app(self.scope, receive, send)
 
     async def _authenticate_token(self, token: str):
+        cache_key = hashlib.sha256(token.encode()).hexdigest()
+        cached = self.token_cache.get(cache_key)
+        if cached is not None:
+            user, jti, sid = cached
+            # отзыв проверяется и для закэшированных токенов: фильтр в памяти, Redis — только при срабатывании
+            if await revoked_tokens.ais_revoked(jti=jti, sid=sid):
+                self.token_cache.delete(cache_key)
+                jwt_auth_failures.labels("revoked").inc()
+                return
+            self.scope["user"] = user
+            return
+
+        try:
+            payload = self.token_backend.decode(token, verify=True)
+        except TokenBackendError as e:
+            logger.warning(f"Не валидный токен: {str(e)}")
+            jwt_auth_failures.labels("invalid").inc()
+            return
+
+        if payload.get("token_type") != "access":
+            logger.warning("Для подключения нужен access токен")
+            jwt_auth_failures.labels("token_type").inc()
+            return
+
+        if await revoked_tokens.ais_revoked(jti=payload.get("jti"), sid=payload.get(SESSION_CLAIM)):
+            logger.warning("Токен отозван")
+            jwt_auth_failures.labels("revoked").inc()
+            return
+
         try:
-            payload = self.token_backend.decode(token, verify=False)
             user_id_claim = getattr(settings, "SIMPLE_JWT", {}).get("USER_ID_CLAIM", "user_id")
             user_id = payload.get(user_id_claim)
 
             if user_id:
-                user = await database_sync_to_async(self._get_user)(user_id)
-                if user:
+                user = await User.objects.filter(pk=user_id).afirst()
+                if user and user.is_active:
                     self.scope["user"] = user
+                    # Запись живёт не дольше самого токена
+                    ttl = min(self.token_cache.ttl, payload.get("exp", 0) - time.time())
+                    self.token_cache.set(cache_key, (user, payload.get("jti"), payload.get(SESSION_CLAIM)), ttl=ttl)
+                    return
+            jwt_auth_failures.labels("user").inc()
         except Exception as e:
             logger.error(f"Ошибка декодирования токена: {str(e)}")
-
-    def _get_user(self, user_id):
-        try:
-            return User.objects.get(pk=user_id)
-        except User.DoesNotExist:
-            return None
+            jwt_auth_failures.labels("error").inc()
+
+
+class RequestMetricsMiddleware:
+    """Время обработки HTTP запросов по маршруту, методу и статусу (chat_http_request_seconds)"""
+
+    sync_capable = True
+    async_capable = True
+
+    METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        registry.ensure_pusher()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, started)
+        return response
+
+    def observe(self, request, response, started):
+        # Маршрут шаблоном (room/<int:room_id>/messages/), а не путём — иначе метки не ограничены
+        match = request.resolver_match
+        route = match.route if match is not None else "unmatched"
+        method = request.method if request.method in self.METHODS else "OTHER"
+        http_request_seconds.labels(route, method, response.status_code).observe(time.perf_counter() - started)
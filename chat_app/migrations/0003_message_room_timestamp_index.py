@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:54
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не блокирует запись в таблицу сообщений
+    atomic = False
+
+    dependencies = [
+        ('chat_app', '0002_user_refresh_token'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='message',
+            index=models.Index(fields=['room', '-timestamp', '-id'], name='message_room_ts_id_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:08
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # GIN индекс по большой таблице строится долго — CONCURRENTLY, без блокировки записи
+    atomic = False
+
+    dependencies = [
+        ('chat_app', '0003_message_room_timestamp_index'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='message',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('content', config='simple'), name='message_content_fts_idx'),
+        ),
+    ]
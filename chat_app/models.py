@@ -1,5 +1,16 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
 from django.db import models
+from django.utils import timezone
+
+# Конфигурация полнотекстового поиска по сообщениям: без стемминга, подходит для любого языка.
+# Должна совпадать в индексе и в запросах, иначе Postgres не использует индекс
+MESSAGE_SEARCH_CONFIG = "simple"
+
+
+def message_search_vector():
+    return SearchVector("content", config=MESSAGE_SEARCH_CONFIG)
 
 
 class User(AbstractUser):
@@ -17,6 +28,26 @@ class User(AbstractUser):
         return self.username
 
 
+class ReadOnlyUserError(TypeError):
+    """Попытка сохранить или удалить ClaimsUser"""
+
+
+class ClaimsUser(User):
+    """
+    Пользователь REST API, собранный из claims access токена (chat_app.authentication).
+    Заполнены только pk и USER_CLAIMS, поэтому сохранять и удалять его нельзя
+    """
+
+    class Meta:
+        proxy = True
+
+    def save(self, *args, **kwargs):
+        raise ReadOnlyUserError("Пользователь из claims токена только для чтения")
+
+    def delete(self, *args, **kwargs):
+        raise ReadOnlyUserError("Пользователь из claims токена только для чтения")
+
+
 class Room(models.Model):
     participants = models.ManyToManyField(User, related_name="rooms")
     name = models.CharField(max_length=100, unique=True)
@@ -29,7 +60,35 @@ class Message(models.Model):
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="messages")
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="messages")
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # момент отправки: write-behind буфер выставляет его при постановке в очередь, а не при INSERT
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # История комнаты: keyset-пагинация по (timestamp, id)
+            models.Index(fields=["room", "-timestamp", "-id"], name="message_room_ts_id_idx"),
+            # Полнотекстовый поиск: GIN по выражению to_tsvector, отдельная колонка не нужна
+            GinIndex(message_search_vector(), name="message_content_fts_idx"),
+        ]
 
     def __str__(self):
         return f"[{self.room.name}] {self.user.username}: {self.content[:20]}"
+
+
+class ReadCursor(models.Model):
+    """
+    До какого момента пользователь прочитал комнату.
+    Счётчики непрочитанного живут в Redis (chat_app.unread), здесь — долговременная копия,
+    из которой счётчик пересчитывается, если в Redis его нет.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="read_cursors")
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="read_cursors")
+    last_read_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "room"], name="readcursor_user_room_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.room_id}: {self.last_read_at}"
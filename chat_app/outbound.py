@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import time
+from collections import Counter, deque
+from django.conf import settings
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Политики для медленных клиентов
+POLICY_DROP_OLDEST = "drop_oldest"  # выбрасывать самые старые фреймы
+POLICY_COLLAPSE = "collapse"  # выбросить очередь и отправить {"type": "resync", "missed": N}
+POLICY_DISCONNECT = "disconnect"  # закрыть соединение
+
+POLICIES = (POLICY_DROP_OLDEST, POLICY_COLLAPSE, POLICY_DISCONNECT)
+
+# Состояния соединения
+STATE_OK = "ok"
+STATE_LAGGING = "lagging"
+STATE_RESYNC = "resync"
+STATE_DISCONNECTED = "disconnected"
+
+STATES = (STATE_OK, STATE_LAGGING, STATE_RESYNC, STATE_DISCONNECTED)
+
+# Код закрытия для отключённых медленных клиентов
+CLOSE_CODE_SLOW_CONSUMER = 4008
+
+_RESYNC = object()
+
+
+class OutboundQueue:
+    """
+    Ограниченная очередь исходящих фреймов одного соединения.
+    Consumer только кладёт фреймы в очередь, отправкой занимается отдельная задача,
+    поэтому медленный клиент не задерживает чтение из channel layer,
+    а его отставание ограничено max_size фреймами.
+    """
+
+    # Число соединений процесса в каждом состоянии
+    state_counts = Counter()
+    dropped_total = 0
+
+    def __init__(self, send, close, max_size=256, lag_threshold=64, policy=POLICY_COLLAPSE, resync_frame=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Неизвестная политика для медленных клиентов: {policy}")
+        # send(text_data, bytes_data), close(code) — корутины consumer'а
+        self._send = send
+        self._close = close
+        self.max_size = max_size
+        self.lag_threshold = lag_threshold
+        self.policy = policy
+        # resync_frame(missed) -> (text_data, bytes_data)
+        self._resync_frame = resync_frame
+        self._queue = deque()
+        self._wakeup = asyncio.Event()
+        self.missed = 0
+        self.state = STATE_OK
+        self.state_counts[STATE_OK] += 1
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    @classmethod
+    def from_settings(cls, send, close, resync_frame=None):
+        conf = getattr(settings, "WS_OUTBOUND", {})
+        return cls(
+            send,
+            close,
+            max_size=conf.get("MAX_QUEUE", 256),
+            lag_threshold=conf.get("LAG_THRESHOLD", 64),
+            policy=conf.get("POLICY", POLICY_COLLAPSE),
+            resync_frame=resync_frame,
+        )
+
+    @classmethod
+    def stats(cls):
+        return {
+            "connections": {state: cls.state_counts[state] for state in STATES},
+            "dropped_total": cls.dropped_total,
+        }
+
+    def put(self, text_data=None, bytes_data=None):
+        if self.state in (None, STATE_DISCONNECTED):
+            return
+
+        if len(self._queue) >= self.max_size:
+            self._overflow()
+            if self.state in (STATE_DISCONNECTED, STATE_RESYNC):
+                # этот фрейм тоже учтён как пропущенный
+                if self.state == STATE_RESYNC:
+                    self.missed += 1
+                    OutboundQueue.dropped_total += 1
+                return
+
+        self._queue.append((time.monotonic(), text_data, bytes_data))
+        if self.state != STATE_RESYNC:
+            self._set_state(STATE_LAGGING if len(self._queue) >= self.lag_threshold else STATE_OK)
+        self._wakeup.set()
+
+    def lag(self):
+        """Возраст самого старого неотправленного фрейма в секундах"""
+        if not self._queue:
+            return 0.0
+        return time.monotonic() - self._queue[0][0]
+
+    def __len__(self):
+        return len(self._queue)
+
+    def close(self):
+        self._set_state(None)
+        self._queue.clear()
+        if self._task is not None and not self._task.done() and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    def _overflow(self):
+        if self.policy == POLICY_DROP_OLDEST:
+            self._queue.popleft()
+            self.missed += 1
+            OutboundQueue.dropped_total += 1
+
+        elif self.policy == POLICY_COLLAPSE:
+            dropped = sum(1 for item in self._queue if item[1] is not _RESYNC)
+            self._queue.clear()
+            self.missed += dropped
+            OutboundQueue.dropped_total += dropped
+            self._queue.append((time.monotonic(), _RESYNC, None))
+            self._set_state(STATE_RESYNC)
+            self._wakeup.set()
+
+        elif self.policy == POLICY_DISCONNECT:
+            OutboundQueue.dropped_total += len(self._queue)
+            self._queue.clear()
+            self._set_state(STATE_DISCONNECTED)
+            self._wakeup.set()
+
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        if self.state is not None:
+            self.state_counts[self.state] -= 1
+        if state is not None:
+            self.state_counts[state] += 1
+        self.state = state
+
+    async def _run(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+
+                if self.state == STATE_DISCONNECTED:
+                    logger.warning("Медленный клиент отключён, очередь превысила %s фреймов", self.max_size)
+                    await self._close(CLOSE_CODE_SLOW_CONSUMER)
+                    return
+
+                while self._queue:
+                    _, text_data, bytes_data = self._queue.popleft()
+                    if text_data is _RESYNC:
+                        missed, self.missed = self.missed, 0
+                        self._set_state(STATE_OK)
+                        if self._resync_frame is None:
+                            continue
+                        text_data, bytes_data = self._resync_frame(missed)
+                    await self._send(text_data, bytes_data)
+
+                    if self.state == STATE_LAGGING and len(self._queue) < self.lag_threshold:
+                        self._set_state(STATE_OK)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Ошибка отправки фрейма клиенту: %s", e)
+
+
+registry.callback(
+    "chat_ws_outbound_connections", "Соединения по состоянию исходящей очереди", "gauge",
+    lambda: {(state,): count for state, count in OutboundQueue.stats()["connections"].items()},
+    ["state"],
+)
+registry.callback(
+    "chat_ws_outbound_dropped_total", "Фреймы, выброшенные из очередей медленных клиентов", "counter",
+    lambda: {(): OutboundQueue.dropped_total},
+)
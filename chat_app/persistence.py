@@ -0,0 +1,241 @@
+import asyncio
+import json
+import logging
+from django.conf import settings
+from channels.db import aclose_old_connections
+from django.db import IntegrityError
+from django.utils import timezone
+from redis.exceptions import RedisError
+from .metrics import message_flush_failures, message_flush_seconds, message_flush_size
+from .models import Message
+from .redis_client import async_redis_client
+from .unread import unread_counters
+
+logger = logging.getLogger(__name__)
+
+# Режимы надёжности записи
+MODE_ASYNC = "async"  # fire-and-forget: сообщение попадает в буфер, рассылка не ждёт БД
+MODE_FLUSH = "flush"  # рассылка только после сброса батча, в который попало сообщение
+MODE_SYNC = "sync"  # INSERT на каждое сообщение, без буфера
+
+MODES = (MODE_ASYNC, MODE_FLUSH, MODE_SYNC)
+
+# Пачки, которые не удалось записать в режиме async, см. команду replay_message_dead_letters
+DEAD_LETTER_KEY = "messages:dead_letter"
+# Отложенные сообщения, которые нельзя записать никогда (комнату или пользователя уже удалили)
+DEAD_LETTER_REJECTED_KEY = "messages:dead_letter:rejected"
+
+
+class MessageWriter:
+    """
+    Write-behind запись сообщений.
+    Сообщения копятся в ограниченном буфере процесса и сохраняются
+    одним bulk_create каждые batch_size сообщений или flush_interval_ms миллисекунд.
+    Неудачная запись повторяется retries раз с паузой retry_backoff_ms, удваивающейся с каждой попыткой.
+    IntegrityError не повторяется: пачка делится пополам, пока не останутся только строки с ошибкой,
+    остальные сообщения записываются.
+    Время сообщения выставляется при постановке в буфер, после записи пачки
+    курсоры прочтения отправителей (ReadCursor) сдвигаются до их последнего сообщения.
+    Если БД так и не ответила, в режиме async пачка уходит в Redis список DEAD_LETTER_KEY,
+    в режимах flush и sync ошибка возвращается отправителю.
+    """
+
+    def __init__(
+        self, client=None, mode=MODE_ASYNC, batch_size=200, flush_interval_ms=50, max_buffer=10000,
+        retries=3, retry_backoff_ms=100,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим сохранения сообщений: {mode}")
+        self.client = client
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_buffer = max_buffer
+        self.retries = retries
+        self.retry_backoff = retry_backoff_ms / 1000
+        self._queue = None
+        self._task = None
+        self._closing = False
+
+    @classmethod
+    def from_settings(cls, client):
+        conf = getattr(settings, "MESSAGE_PERSISTENCE", {})
+        return cls(
+            client,
+            mode=conf.get("MODE", MODE_ASYNC),
+            batch_size=conf.get("BATCH_SIZE", 200),
+            flush_interval_ms=conf.get("FLUSH_INTERVAL_MS", 50),
+            max_buffer=conf.get("MAX_BUFFER", 10000),
+            retries=conf.get("RETRIES", 3),
+            retry_backoff_ms=conf.get("RETRY_BACKOFF_MS", 100),
+        )
+
+    async def save(self, user_id, room_id, content):
+        """
+        Поставить сообщение на сохранение.
+        В режиме async возвращается сразу после попадания в буфер
+        (при переполненном буфере ждёт свободного места),
+        в режиме flush — после сохранения батча, в режиме sync — после INSERT.
+        В режимах flush и sync поднимает исключение, если сообщение сохранить не удалось.
+        """
+        entry = (user_id, room_id, content, timezone.now())
+
+        if self.mode == MODE_SYNC or self._closing:
+            await self._write_with_retry([entry])
+            await self._advance_cursors([entry])
+            return
+
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future() if self.mode == MODE_FLUSH else None
+        await self._queue.put((entry, future))
+        if future is not None:
+            await future
+
+    async def close(self):
+        """Сбросить всё, что осталось в буфере, и остановить фоновую задачу"""
+        self._closing = True
+        if self._task is None or self._task.done():
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_buffer)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stop = False
+
+        while not stop:
+            item = await self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+        # Остановка: дописываем то, что успело попасть в буфер
+        rest = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                rest.append(item)
+        for start in range(0, len(rest), self.batch_size):
+            await self._flush(rest[start:start + self.batch_size])
+
+    async def _flush(self, batch):
+        message_flush_size.observe(len(batch))
+        with message_flush_seconds.time():
+            failed = await self._write_batch(batch)
+
+        if len(failed) < len(batch):
+            failed_items = {id(item) for item, _ in failed}
+            await self._advance_cursors([item[0] for item in batch if id(item) not in failed_items])
+        if failed and self.mode == MODE_ASYNC:
+            await self._dead_letter([entry for (entry, _), _ in failed])
+        for (_, future), error in failed:
+            if future is not None and not future.done():
+                future.set_exception(error)
+        for _, future in batch:
+            if future is not None and not future.done():
+                future.set_result(None)
+
+    async def _write_batch(self, batch):
+        """Записать пачку, вернуть [((entry, future), ошибка)] для несохранённых сообщений"""
+        try:
+            await self._write_with_retry([entry for entry, _ in batch])
+        except IntegrityError as e:
+            if len(batch) == 1:
+                message_flush_failures.labels("rejected").inc()
+                logger.error("Сообщение отклонено БД (user_id=%s, room_id=%s): %s", *batch[0][0][:2], e)
+                return [(batch[0], e)]
+            middle = len(batch) // 2
+            return await self._write_batch(batch[:middle]) + await self._write_batch(batch[middle:])
+        except Exception as e:
+            logger.error("Ошибка при сохранении пачки из %s сообщений: %s", len(batch), e)
+            return [(item, e) for item in batch]
+        return []
+
+    async def _write_with_retry(self, entries):
+        for attempt in range(self.retries + 1):
+            try:
+                await self._write(entries)
+                return
+            except IntegrityError:
+                # нарушение ограничений не пройдёт и при повторе
+                raise
+            except Exception as e:
+                if attempt == self.retries:
+                    message_flush_failures.labels("failed").inc()
+                    raise
+                message_flush_failures.labels("retry").inc()
+                delay = self.retry_backoff * 2 ** attempt
+                logger.warning(
+                    "Не удалось сохранить %s сообщений (попытка %s), повтор через %.2f с: %s",
+                    len(entries), attempt + 1, delay, e,
+                )
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    async def _advance_cursors(entries):
+        """Отправитель прочитал комнату до своего сообщения, как и в счётчиках Redis"""
+        cursors = {}
+        for user_id, room_id, _, timestamp in entries:
+            cursors[user_id, room_id] = max(timestamp, cursors.get((user_id, room_id), timestamp))
+        try:
+            await unread_counters.save_cursors(cursors)
+        except Exception as e:
+            logger.warning("Не удалось сдвинуть курсоры прочтения отправителей: %s", e)
+        finally:
+            await aclose_old_connections()
+
+    async def _dead_letter(self, entries):
+        """Сохранить пачку в Redis, чтобы дописать её в БД позже"""
+        try:
+            await self.client.rpush(DEAD_LETTER_KEY, *(
+                json.dumps({"user_id": user_id, "room_id": room_id, "content": content, "timestamp": timestamp.isoformat()})
+                for user_id, room_id, content, timestamp in entries
+            ))
+        except RedisError as e:
+            message_flush_failures.labels("lost").inc(len(entries))
+            logger.critical("Потеряно %s сообщений: не удалось записать ни в БД, ни в Redis: %s", len(entries), e)
+            return
+        message_flush_failures.labels("dead_letter").inc(len(entries))
+        logger.error("%s сообщений отложено в %s", len(entries), DEAD_LETTER_KEY)
+
+    @staticmethod
+    async def _write(entries):
+        # id пользователя и комнаты резолвятся в ChatConsumer.connect, здесь только INSERT
+        try:
+            await Message.objects.abulk_create([
+                Message(user_id=user_id, room_id=room_id, content=content, timestamp=timestamp)
+                for user_id, room_id, content, timestamp in entries
+            ])
+        finally:
+            # соединение возвращается в пул после каждой пачки, сломанное — закрывается
+            await aclose_old_connections()
+
+
+message_writer = MessageWriter.from_settings(async_redis_client)
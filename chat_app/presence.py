@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import Counter, defaultdict
+from django.conf import settings
+from redis.exceptions import RedisError
+from .codecs import build_event
+from .coalescer import StateCoalescer
+from .fanout import broadcast
+from .redis_client import async_redis_client, redis_client
+
+logger = logging.getLogger(__name__)
+
+# Вход: процесс отмечает, что держит подключения пользователя; 1 — пользователя не было онлайн
+JOIN_LUA = """
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+"""
+
+# Выход: процесс снимает свою отметку; пользователь выходит из комнаты, только если не осталось
+# ни одного процесса с живым heartbeat; 1 — пользователь вышел
+LEAVE_LUA = """
+redis.call('ZREM', KEYS[2], ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[3])
+if redis.call('ZCARD', KEYS[2]) > 0 then
+    return 0
+end
+redis.call('DEL', KEYS[2])
+return redis.call('ZREM', KEYS[1], ARGV[1])
+"""
+
+# Чистка: снять пользователя, только если heartbeat так и не обновился; 1 — пользователь вышел
+SWEEP_LUA = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not score or tonumber(score) > tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('DEL', KEYS[2])
+return 1
+"""
+
+
+class Presence:
+    """
+    Кто сейчас в комнате.
+    Для каждой комнаты в Redis хранится sorted set: участник -> время последнего heartbeat.
+    У каждого участника — sorted set процессов, которые держат его подключения (процесс -> heartbeat):
+    подключения считаются в процессе, в Redis процесс отмечается один раз. Пользователь выходит,
+    когда его отпустил последний живой процесс, — несколько вкладок на разных воркерах не дают ложного выхода.
+    Процесс раз в heartbeat_interval обновляет время своих подключений одним pipeline
+    и вычищает записи старше ttl (например, оставшиеся от упавшего процесса).
+    События входа/выхода копятся coalesce_window секунд и уходят в комнату одной пачкой.
+    """
+
+    key_prefix = "presence:room:"
+    connections_prefix = "presence:conn:"
+
+    def __init__(self, client, sync_client, enabled=True, heartbeat_interval=15, ttl=45, coalesce_window=1.0):
+        self.client = client
+        self.sync_client = sync_client
+        self.enabled = enabled
+        self.heartbeat_interval = heartbeat_interval
+        self.ttl = ttl
+        # room_name -> Counter(user_id -> число локальных подключений)
+        self._local = defaultdict(Counter)
+        self._events = StateCoalescer(coalesce_window, self._send_events)
+        self._task = None
+        self._join = client.register_script(JOIN_LUA)
+        self._leave = client.register_script(LEAVE_LUA)
+        self._sweep = client.register_script(SWEEP_LUA)
+        self._pid = None
+        self._process_id = None
+
+    @classmethod
+    def from_settings(cls, client, sync_client):
+        conf = getattr(settings, "PRESENCE", {})
+        return cls(
+            client,
+            sync_client,
+            enabled=conf.get("ENABLED", True),
+            heartbeat_interval=conf.get("HEARTBEAT_INTERVAL", 15),
+            ttl=conf.get("TTL", 45),
+            coalesce_window=conf.get("COALESCE_WINDOW_MS", 1000) / 1000,
+        )
+
+    def key(self, room_name):
+        return f"{self.key_prefix}{room_name}"
+
+    def connections_key(self, room_name, user_id):
+        return f"{self.connections_prefix}{room_name}:{user_id}"
+
+    @property
+    def process_id(self):
+        # после fork у процесса свой id
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._process_id = f"{socket.gethostname()}:{self._pid}"
+        return self._process_id
+
+    async def join(self, room_name, user_id, username):
+        if not self.enabled:
+            return
+
+        connections = self._local[room_name]
+        connections[user_id] += 1
+        self._ensure_started()
+        if connections[user_id] > 1:
+            return
+
+        try:
+            added = await self._join(
+                keys=[self.key(room_name), self.connections_key(room_name, user_id)],
+                args=[user_id, time.time(), self.process_id, self.ttl],
+            )
+        except RedisError as e:
+            logger.warning("Presence: не удалось отметить пользователя %s в комнате %s: %s", user_id, room_name, e)
+            return
+        # Событие только если пользователя не было онлайн (подключение с другого воркера — не вход)
+        if added:
+            self._events.update(room_name, user_id, True, username)
+
+    async def leave(self, room_name, user_id):
+        if not self.enabled:
+            return
+
+        connections = self._local.get(room_name)
+        if not connections or not connections[user_id]:
+            return
+        connections[user_id] -= 1
+        if connections[user_id]:
+            return
+        del connections[user_id]
+        if not connections:
+            del self._local[room_name]
+
+        try:
+            removed = await self._leave(
+                keys=[self.key(room_name), self.connections_key(room_name, user_id)],
+                args=[user_id, self.process_id, time.time() - self.ttl],
+            )
+        except RedisError as e:
+            logger.warning("Presence: не удалось снять пользователя %s в комнате %s: %s", user_id, room_name, e)
+            return
+        if removed:
+            self._events.update(room_name, user_id, False)
+
+    async def heartbeat(self, room_name, user_id):
+        """Heartbeat от клиента: продлить присутствие без ожидания общего цикла"""
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.zadd(self.key(room_name), {user_id: now}, xx=True)
+                pipe.zadd(self.connections_key(room_name, user_id), {self.process_id: now}, xx=True)
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning("Presence: ошибка heartbeat в комнате %s: %s", room_name, e)
+
+    def online_user_ids(self, room_name):
+        """Участники комнаты с живым heartbeat (для REST API, синхронно)"""
+        cutoff = time.time() - self.ttl
+        return [int(user_id) for user_id in self.sync_client.zrangebyscore(self.key(room_name), cutoff, "+inf")]
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while self._local:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self._heartbeat_and_sweep()
+            except RedisError as e:
+                logger.error("Presence: ошибка heartbeat: %s", e)
+
+    async def _heartbeat_and_sweep(self):
+        now = time.time()
+        cutoff = now - self.ttl
+        process_id = self.process_id
+        # снимок: пока идёт pipeline, подключения могут меняться
+        rooms = [(room_name, list(connections)) for room_name, connections in self._local.items()]
+
+        # в _local только комнаты с подключениями: на каждую комнату zadd участников,
+        # отметки процесса у каждого участника и zrangebyscore просроченных
+        async with self.client.pipeline(transaction=False) as pipe:
+            for room_name, user_ids in rooms:
+                pipe.zadd(self.key(room_name), {user_id: now for user_id in user_ids})
+                for user_id in user_ids:
+                    pipe.zadd(self.connections_key(room_name, user_id), {process_id: now})
+                    pipe.expire(self.connections_key(room_name, user_id), self.ttl)
+                pipe.zrangebyscore(self.key(room_name), "-inf", cutoff)
+            results = await pipe.execute()
+
+        position = 0
+        for room_name, user_ids in rooms:
+            position += 2 + 2 * len(user_ids)
+            members = results[position - 1]
+            if not members:
+                continue
+            # SWEEP_LUA вернёт 1 только одному процессу, поэтому событие выхода не задвоится
+            async with self.client.pipeline(transaction=False) as pipe:
+                for member in members:
+                    await self._sweep(
+                        keys=[self.key(room_name), self.connections_key(room_name, int(member))],
+                        args=[member, cutoff],
+                        client=pipe,
+                    )
+                removed = await pipe.execute()
+            for member, was_removed in zip(members, removed):
+                if was_removed:
+                    self._events.update(room_name, int(member), False)
+
+    async def _send_events(self, room_name, changes):
+        joined = [{"id": user_id, "username": username} for user_id, (state, username) in changes.items() if state]
+        left = [user_id for user_id, (state, _) in changes.items() if not state]
+        await broadcast(room_name, build_event("presence_update", {
+            "type": "presence",
+            "joined": joined,
+            "left": left,
+        }))
+
+
+presence = Presence.from_settings(async_redis_client, redis_client)
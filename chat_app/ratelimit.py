@@ -0,0 +1,161 @@
+import logging
+import time
+from django.conf import settings
+from redis.exceptions import RedisError
+from .cache import TTLCache
+from .redis_client import async_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Token bucket сразу для нескольких ключей: токены списываются, только если есть в каждом бакете,
+# иначе не списывается ни один. ARGV — по четыре значения на ключ:
+# токенов в секунду, burst, сколько взять (аренда), сколько вернуть (остаток прошлой аренды).
+# Возвращает {номер отказавшего ключа или 0, через сколько мс у него будет токен, выдано по каждому ключу...}.
+# Время берётся из Redis, чтобы у всех процессов были одинаковые часы.
+TOKEN_BUCKET_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local tokens = {}
+local denied = 0
+local retry_ms = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 4 - 3])
+    local burst = tonumber(ARGV[i * 4 - 2])
+    local refund = tonumber(ARGV[i * 4])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local value = tonumber(state[1])
+    local ts = tonumber(state[2])
+    if value == nil then
+        value = burst
+        ts = now
+    end
+    tokens[i] = math.min(burst, value + math.max(0, now - ts) * rate + refund)
+    if denied == 0 and tokens[i] < 1 then
+        denied = i
+        retry_ms = math.ceil((1 - tokens[i]) / rate * 1000)
+    end
+end
+
+local result = {denied, retry_ms}
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 4 - 3])
+    local burst = tonumber(ARGV[i * 4 - 2])
+    local granted = 0
+    if denied == 0 then
+        granted = math.min(tonumber(ARGV[i * 4 - 1]), math.floor(tokens[i]))
+    end
+    redis.call('HSET', key, 'tokens', tokens[i] - granted, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+    result[i + 2] = granted
+end
+return result
+"""
+
+
+class RateLimiter:
+    """
+    Лимиты на входящие сообщения WebSocket (token bucket в Redis).
+    Сообщение проверяется по всем бакетам (пользователь, комната) одним атомарным вызовом:
+    при отказе одного бакета токены не списываются ни с одного.
+    Чтобы не ходить в Redis на каждое сообщение, процесс арендует токены и тратит их локально:
+    на холодном ключе — один, если ключ израсходовал аренду за lease_ttl секунд — до lease_size.
+    Остаток просроченной аренды возвращается в бакет при следующем обращении к Redis.
+    После отказа ключ до конца retry_after отклоняется локально, без запроса в Redis.
+    """
+
+    key_prefix = "ratelimit:"
+
+    def __init__(self, client, limits, enabled=True, lease_size=5, lease_ttl=1.0):
+        self.client = client
+        # scope -> (токенов в секунду, burst)
+        self.limits = limits
+        self.enabled = enabled
+        self.lease_size = lease_size
+        self.lease_ttl = lease_ttl
+        self._script = client.register_script(TOKEN_BUCKET_LUA)
+        # key -> [осталось токенов, до какого момента (monotonic) их можно тратить]
+        self._leases = TTLCache(max_size=100000)
+        self._denied = TTLCache(max_size=100000)
+
+    @classmethod
+    def from_settings(cls, client):
+        conf = getattr(settings, "WS_RATE_LIMITS", {})
+        return cls(
+            client,
+            limits={
+                "user": conf.get("USER", (5, 20)),
+                "anon": conf.get("ANON", (1, 5)),
+                "room": conf.get("ROOM", (100, 300)),
+            },
+            enabled=conf.get("ENABLED", True),
+            lease_size=conf.get("LEASE_SIZE", 5),
+            lease_ttl=conf.get("LEASE_TTL_MS", 1000) / 1000,
+        )
+
+    async def check(self, *buckets):
+        """
+        buckets — пары (scope, идентификатор), например ("user", 1), ("room", "general").
+        Возвращает None, если сообщение можно принять, иначе (scope, retry_after_ms).
+        """
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+        buckets = [(scope, f"{self.key_prefix}{scope}:{ident}") for scope, ident in buckets]
+        for scope, key in buckets:
+            retry_at = self._denied.get(key)
+            if retry_at is not None:
+                return scope, max(0, int((retry_at - now) * 1000))
+
+        taken, remote = [], []
+        for scope, key in buckets:
+            lease = self._leases.get(key)
+            if lease is not None and lease[0] > 0 and lease[1] > now:
+                lease[0] -= 1
+                taken.append(lease)
+            else:
+                remote.append((scope, key, lease))
+        if not remote:
+            return None
+
+        args = []
+        for scope, key, lease in remote:
+            rate, burst = self.limits[scope]
+            # ключ потратил аренду до её истечения — берём с запасом, иначе один токен
+            hot = lease is not None and lease[1] > now
+            args += [rate, burst, max(1, min(self.lease_size, burst)) if hot else 1, lease[0] if lease else 0]
+        try:
+            denied, retry_after_ms, *granted = await self._script(keys=[key for _, key, _ in remote], args=args)
+        except RedisError as e:
+            # Redis недоступен — не блокируем чат
+            logger.warning("Rate limit: ошибка Redis, сообщение пропущено без проверки: %s", e)
+            return None
+
+        for (scope, key, _), count in zip(remote, granted):
+            # остаток прошлой аренды уже вернулся в бакет
+            if not int(count):
+                self._leases.delete(key)
+                continue
+            rate, burst = self.limits[scope]
+            # запись живёт, пока бакет не наполнится заново: до тех пор остаток аренды стоит вернуть
+            self._leases.set(key, [int(count) - 1, now + self.lease_ttl], ttl=burst / rate + self.lease_ttl)
+
+        denied, retry_after_ms = int(denied), int(retry_after_ms)
+        if denied:
+            for lease in taken:
+                lease[0] += 1
+            scope, key, _ = remote[denied - 1]
+            self._denied.set(key, now + retry_after_ms / 1000, ttl=retry_after_ms / 1000)
+            return scope, retry_after_ms
+        return None
+
+    async def hit(self, scope, ident):
+        """Проверить один бакет, вернуть (можно ли, retry_after_ms)"""
+        limited = await self.check((scope, ident))
+        if limited is None:
+            return True, 0
+        return False, limited[1]
+
+
+rate_limiter = RateLimiter.from_settings(async_redis_client)
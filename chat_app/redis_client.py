@@ -1,4 +1,5 @@
 import redis
+import redis.asyncio
 from django.conf import settings
 
 # Подключение к Redis
@@ -7,4 +8,19 @@ redis_client = redis.Redis(
     port=settings.REDIS_PORT,
     db=settings.REDIS_DB,
     decode_responses=settings.REDIS_DECODE_RESPONSES,
+)
+
+# Асинхронное подключение для consumer'ов и middleware
+async_redis_client = redis.asyncio.Redis(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    db=settings.REDIS_DB,
+    decode_responses=settings.REDIS_DECODE_RESPONSES,
+)
+
+# Асинхронное подключение без декодирования ответов — для бинарных данных (pub/sub fan-out)
+async_redis_raw_client = redis.asyncio.Redis(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    db=settings.REDIS_DB,
 )
\ No newline at end of file
@@ -0,0 +1,100 @@
+import logging
+import time
+from django.db import transaction
+from redis.exceptions import RedisError
+from rest_framework_simplejwt.settings import api_settings
+from .redis_client import redis_client
+from .revocation import revoked_tokens
+
+logger = logging.getLogger(__name__)
+
+# Новая сессия: создаётся, только если такой ещё нет (повторный импорт не откатывает ротацию)
+CREATE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'user', ARGV[1], 'jti', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('SADD', KEYS[2], ARGV[4])
+if redis.call('TTL', KEYS[2]) < tonumber(ARGV[3]) then
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+end
+return 1
+"""
+
+# Ротация: текущий refresh сессии меняется на новый, только если пришёл именно текущий
+ROTATE_LUA = """
+local current = redis.call('HMGET', KEYS[1], 'user', 'jti')
+if current[1] ~= ARGV[1] or current[2] ~= ARGV[2] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'jti', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+if redis.call('TTL', KEYS[2]) < tonumber(ARGV[4]) then
+    redis.call('EXPIRE', KEYS[2], ARGV[4])
+end
+return 1
+"""
+
+
+class RefreshTokenStore:
+    """
+    Сессии refresh токенов в Redis.
+    Вход создаёт сессию sid (claim sid в токенах): hash refresh:session:<sid> с пользователем
+    и jti текущего refresh токена; у пользователя может быть сколько угодно сессий (set refresh:user:<id>).
+    Ротация — compare-and-swap jti в Lua: старый refresh, уже обменянный на новый, не пройдёт.
+    Сессия живёт REFRESH_TOKEN_LIFETIME с последней ротации.
+    """
+
+    session_prefix = "refresh:session:"
+    user_prefix = "refresh:user:"
+
+    def __init__(self, client, ttl):
+        self.client = client
+        self.ttl = ttl
+        self._create = client.register_script(CREATE_LUA)
+        self._rotate = client.register_script(ROTATE_LUA)
+
+    @classmethod
+    def from_settings(cls, client):
+        return cls(client, ttl=int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()))
+
+    def session_key(self, sid):
+        return f"{self.session_prefix}{sid}"
+
+    def user_key(self, user_id):
+        return f"{self.user_prefix}{user_id}"
+
+    def create(self, user_id, sid, jti, ttl=None):
+        """Новая сессия; False — сессия sid уже есть"""
+        ttl = self.ttl if ttl is None else ttl
+        return bool(self._create(
+            keys=[self.session_key(sid), self.user_key(user_id)],
+            args=[user_id, jti, int(ttl), sid],
+        ))
+
+    def rotate(self, user_id, sid, jti, new_jti):
+        """Заменить refresh сессии; False — jti не текущий (токен уже обменян) или сессии нет"""
+        return bool(self._rotate(
+            keys=[self.session_key(sid), self.user_key(user_id)],
+            args=[user_id, jti, new_jti, self.ttl],
+        ))
+
+    def revoke_user(self, user_id):
+        """Завершить все сессии пользователя и отозвать их токены после коммита текущей транзакции"""
+        transaction.on_commit(lambda: self._revoke_user(user_id))
+
+    def _revoke_user(self, user_id):
+        user_key = self.user_key(user_id)
+        try:
+            sids = self.client.smembers(user_key)
+            self.client.delete(user_key, *(self.session_key(sid) for sid in sids))
+            # access токены сессий ещё действуют — отзываем sid до истечения последнего из них
+            expires_at = time.time() + api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()
+            for sid in sids:
+                revoked_tokens.revoke(expires_at, sid=sid)
+        except RedisError as e:
+            logger.error("Не удалось завершить сессии пользователя %s: %s", user_id, e)
+
+
+refresh_tokens = RefreshTokenStore.from_settings(redis_client)
@@ -0,0 +1,130 @@
+import logging
+import time
+import uuid
+from django.conf import settings
+from django.db import transaction
+from redis.exceptions import RedisError
+from rest_framework.renderers import JSONRenderer
+from .metrics import response_cache_requests
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Снять блокировку, только если она всё ещё наша
+UNLOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class ResponseCache:
+    """
+    Кэш готовых JSON-ответов API в Redis: ключ на объект (cache:room:<id>), значение — сериализованные байты.
+    Инвалидируется сигналами (chat_app.signals) после коммита транзакции.
+    При промахе ответ строит только один процесс (single-flight блокировка SET NX),
+    остальные ждут до wait_ms, пока он не положит значение в кэш.
+    """
+
+    key_prefix = "cache:"
+    lock_suffix = ":lock"
+
+    def __init__(self, client, enabled=True, ttl=300, lock_ttl_ms=5000, wait_ms=500, poll_ms=20):
+        self.client = client
+        self.enabled = enabled
+        self.ttl = ttl
+        self.lock_ttl_ms = lock_ttl_ms
+        self.wait = wait_ms / 1000
+        self.poll = poll_ms / 1000
+        self.renderer = JSONRenderer()
+        self._unlock = client.register_script(UNLOCK_LUA)
+
+    @classmethod
+    def from_settings(cls, client):
+        conf = getattr(settings, "RESPONSE_CACHE", {})
+        return cls(
+            client,
+            enabled=conf.get("ENABLED", True),
+            ttl=conf.get("TTL", 300),
+            lock_ttl_ms=conf.get("LOCK_TTL_MS", 5000),
+            wait_ms=conf.get("WAIT_MS", 500),
+        )
+
+    def key(self, namespace, key):
+        return f"{self.key_prefix}{namespace}:{key}"
+
+    def get_or_build(self, namespace, key, build):
+        """
+        JSON-ответ из кэша или build(); build возвращает данные для сериализации
+        или None (объекта нет — такой ответ не кэшируется)
+        """
+        if not self.enabled:
+            return self.render(build())
+
+        cache_key = self.key(namespace, key)
+        try:
+            body = self.client.get(cache_key)
+            if body is not None:
+                response_cache_requests.labels(namespace, "hit").inc()
+                return body
+
+            token = uuid.uuid4().hex
+            lock_key = cache_key + self.lock_suffix
+            if not self.client.set(lock_key, token, nx=True, px=self.lock_ttl_ms):
+                body = self._wait(cache_key)
+                if body is not None:
+                    response_cache_requests.labels(namespace, "wait_hit").inc()
+                    return body
+                # не дождались — строим сами, но в кэш не пишем: блокировка не наша
+                response_cache_requests.labels(namespace, "wait_miss").inc()
+                return self.render(build())
+        except RedisError as e:
+            logger.warning("Кэш ответов: Redis недоступен (%s), строим ответ без кэша", e)
+            response_cache_requests.labels(namespace, "error").inc()
+            return self.render(build())
+
+        response_cache_requests.labels(namespace, "miss").inc()
+        try:
+            body = self.render(build())
+            if body is not None:
+                self.client.set(cache_key, body, ex=self.ttl)
+            return body
+        except RedisError as e:
+            logger.warning("Кэш ответов: не удалось сохранить %s: %s", cache_key, e)
+            return body
+        finally:
+            try:
+                self._unlock(keys=[lock_key], args=[token])
+            except RedisError:
+                pass
+
+    def invalidate(self, namespace, *keys):
+        """Удалить записи после коммита текущей транзакции"""
+        if not self.enabled or not keys:
+            return
+        cache_keys = [self.key(namespace, key) for key in keys]
+        transaction.on_commit(lambda: self._delete(cache_keys))
+
+    def _delete(self, cache_keys):
+        try:
+            self.client.delete(*cache_keys)
+        except RedisError as e:
+            logger.error("Кэш ответов: не удалось удалить %s: %s", cache_keys, e)
+
+    def _wait(self, cache_key):
+        deadline = time.monotonic() + self.wait
+        while time.monotonic() < deadline:
+            time.sleep(self.poll)
+            body = self.client.get(cache_key)
+            if body is not None:
+                return body
+        return None
+
+    def render(self, data):
+        if data is None:
+            return None
+        return self.renderer.render(data)
+
+
+response_cache = ResponseCache.from_settings(redis_client)
@@ -0,0 +1,225 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from django.conf import settings
+from redis.exceptions import RedisError
+from .metrics import revocation_checks
+from .redis_client import async_redis_client, redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Фильтр Блума: «нет» — точно нет, «да» — есть или ложное срабатывание с вероятностью error_rate"""
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(1, capacity)
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # двойное хэширование: k позиций из двух 64-битных половин одного blake2b
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevokedTokens:
+    """
+    Отозванные токены (jti) и сессии (sid, см. chat_app.refresh_tokens).
+    Источник истины — zset revoked:tokens в Redis, score — момент, после которого запись не нужна
+    (exp токена или конец жизни сессии). В каждом процессе лежит фильтр Блума с теми же записями:
+    проверка токена — только поиск в памяти, в Redis идём лишь при срабатывании фильтра.
+    Фильтр пересобирается фоновым потоком раз в rebuild_interval секунд и по сообщению в канале,
+    новые отзывы приходят в него через pub/sub. Пока фильтра нет, каждая проверка идёт в Redis.
+    Если подтвердить в Redis не получилось, решает fail_closed: отказать (True) или пропустить токен.
+    """
+
+    key = "revoked:tokens"
+    channel = "revoked:tokens"
+    # сообщение в канале: пересобрать фильтр (после чистки просроченных записей)
+    REBUILD = "rebuild"
+
+    def __init__(
+        self, client, async_client, capacity=100000, error_rate=0.001, rebuild_interval=300, fail_closed=True,
+    ):
+        self.client = client
+        self.async_client = async_client
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self.fail_closed = fail_closed
+        self._filter = None
+        self._listener_pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, client, async_client):
+        conf = getattr(settings, "REVOCATION", {})
+        return cls(
+            client,
+            async_client,
+            capacity=conf.get("CAPACITY", 100000),
+            error_rate=conf.get("ERROR_RATE", 0.001),
+            rebuild_interval=conf.get("REBUILD_INTERVAL", 300),
+            fail_closed=conf.get("FAIL_CLOSED", True),
+        )
+
+    @staticmethod
+    def members(jti=None, sid=None):
+        members = []
+        if jti:
+            members.append(f"jti:{jti}")
+        if sid:
+            members.append(f"sid:{sid}")
+        return members
+
+    def revoke(self, expires_at, jti=None, sid=None):
+        """Отозвать токен и/или сессию до expires_at (unix time)"""
+        members = self.members(jti, sid)
+        if not members:
+            return
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.zadd(self.key, {member: expires_at for member in members})
+            for member in members:
+                pipe.publish(self.channel, member)
+            pipe.execute()
+        bloom = self._filter
+        if bloom is not None:
+            for member in members:
+                bloom.add(member)
+
+    def revoke_tokens(self, expires_by_jti):
+        """Отозвать пачку токенов {jti: expires_at} без рассылки: в фильтры они попадут при пересборке (prune)"""
+        if expires_by_jti:
+            self.client.zadd(self.key, {f"jti:{jti}": expires_at for jti, expires_at in expires_by_jti.items()})
+
+    def is_revoked(self, jti=None, sid=None):
+        hits = self._hits(jti, sid)
+        if not hits:
+            return False
+        try:
+            scores = self.client.zmscore(self.key, hits)
+        except RedisError as e:
+            return self._unconfirmed(e)
+        return self._confirmed(scores)
+
+    async def ais_revoked(self, jti=None, sid=None):
+        hits = self._hits(jti, sid)
+        if not hits:
+            return False
+        try:
+            scores = await self.async_client.zmscore(self.key, hits)
+        except RedisError as e:
+            return self._unconfirmed(e)
+        return self._confirmed(scores)
+
+    def _hits(self, jti, sid):
+        """Записи, которые надо подтвердить в Redis"""
+        self.ensure_listener()
+        members = self.members(jti, sid)
+        bloom = self._filter
+        if bloom is None:
+            return members
+        hits = [member for member in members if member in bloom]
+        if not hits:
+            revocation_checks.labels("miss").inc()
+        return hits
+
+    def _confirmed(self, scores):
+        now = time.time()
+        revoked = any(score is not None and score > now for score in scores)
+        revocation_checks.labels("revoked" if revoked else "not_revoked").inc()
+        return revoked
+
+    def _unconfirmed(self, error):
+        # фильтр сработал (или его нет), а проверить негде
+        revocation_checks.labels("error").inc()
+        if self.fail_closed:
+            logger.warning("Отзыв токенов: Redis недоступен, токен считается отозванным (FAIL_CLOSED): %s", error)
+            return True
+        logger.error("Отзыв токенов: Redis недоступен, токен принят без проверки отзыва (FAIL_CLOSED=False): %s", error)
+        return False
+
+    def ensure_listener(self):
+        """Запустить фоновый поток фильтра (один на процесс, в том числе после fork)"""
+        if self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self._filter = None
+            logger.info(
+                "Отзыв токенов: при недоступном Redis неподтверждённые токены %s",
+                "отклоняются" if self.fail_closed else "принимаются (FAIL_CLOSED=False)",
+            )
+            threading.Thread(target=self._listen_loop, name="revocation-listener", daemon=True).start()
+
+    def _listen_loop(self):
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                logger.warning("Отзыв токенов: фильтр остановлен, проверки идут в Redis: %s", e)
+            # пока подписки нет, пропущенные отзывы не попадут в фильтр — проверяем всё в Redis
+            self._filter = None
+            time.sleep(1)
+
+    def _listen(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        try:
+            # сначала подписка, потом снимок: отзыв между ними придёт сообщением
+            pubsub.subscribe(self.channel)
+            self.rebuild()
+            rebuild_at = time.monotonic() + self.rebuild_interval
+            while True:
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    data = message["data"]
+                    if isinstance(data, bytes):
+                        data = data.decode()
+                    if data == self.REBUILD:
+                        rebuild_at = 0
+                    elif self._filter is not None:
+                        self._filter.add(data)
+                if time.monotonic() >= rebuild_at:
+                    self.rebuild()
+                    rebuild_at = time.monotonic() + self.rebuild_interval
+        finally:
+            pubsub.close()
+
+    def rebuild(self):
+        """Собрать фильтр заново из живых записей zset"""
+        members = self.client.zrangebyscore(self.key, time.time(), "+inf")
+        # запас в два раза, чтобы вероятность ложных срабатываний не росла до следующей пересборки
+        bloom = BloomFilter(max(self.capacity, 2 * len(members)), self.error_rate)
+        for member in members:
+            bloom.add(member.decode() if isinstance(member, bytes) else member)
+        self._filter = bloom
+        logger.info("Отзыв токенов: фильтр пересобран, записей: %s", len(members))
+
+    def prune(self):
+        """Удалить просроченные записи и попросить процессы пересобрать фильтры; возвращает число удалённых"""
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(self.key, "-inf", time.time())
+            pipe.publish(self.channel, self.REBUILD)
+            removed, _ = pipe.execute()
+        return removed
+
+
+revoked_tokens = RevokedTokens.from_settings(redis_client, async_redis_client)
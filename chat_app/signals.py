@@ -0,0 +1,76 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .membership import room_membership
+from .models import Room, User
+from .refresh_tokens import refresh_tokens
+from .response_cache import response_cache
+from .versions import rooms_version
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def room_changed(sender, instance, **kwargs):
+    rooms_version.bump()
+    response_cache.invalidate("room", instance.pk)
+
+
+@receiver(post_delete, sender=Room)
+def room_deleted(sender, instance, **kwargs):
+    room_membership.reset(instance.pk)
+
+
+@receiver(m2m_changed, sender=Room.participants.through)
+def room_participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # reverse — изменение со стороны пользователя (user.rooms.add): instance — пользователь, pk_set — комнаты
+    if action == "pre_clear":
+        if reverse:
+            # после clear список комнат пользователя уже не узнать
+            room_ids = list(instance.rooms.values_list("id", flat=True))
+            response_cache.invalidate("room", *room_ids)
+            for room_id in room_ids:
+                room_membership.removed(room_id, [instance.pk])
+        else:
+            room_membership.reset(instance.pk)
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    rooms_version.bump()
+    if not reverse:
+        response_cache.invalidate("room", instance.pk)
+        if action == "post_add":
+            room_membership.added(instance.pk, pk_set)
+        elif action == "post_remove":
+            room_membership.removed(instance.pk, pk_set)
+    elif pk_set:
+        response_cache.invalidate("room", *pk_set)
+        for room_id in pk_set:
+            if action == "post_add":
+                room_membership.added(room_id, [instance.pk])
+            else:
+                room_membership.removed(room_id, [instance.pk])
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    response_cache.invalidate("user", instance.pk)
+    # access токены API проверяются без БД: деактивация должна отозвать сессии (sid в токенах)
+    if not instance.is_active and (update_fields is None or "is_active" in update_fields):
+        refresh_tokens.revoke_user(instance.pk)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # участники удаляются каскадом, m2m_changed при этом не отправляется
+    room_ids = list(instance.rooms.values_list("id", flat=True))
+    if room_ids:
+        response_cache.invalidate("room", *room_ids)
+    for room_id in room_ids:
+        room_membership.removed(room_id, [instance.pk])
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    rooms_version.bump()
+    response_cache.invalidate("user", instance.pk)
+    refresh_tokens.revoke_user(instance.pk)
@@ -0,0 +1,19 @@
+import fakeredis
+import pytest
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def redis(redis_server):
+    """Синхронный клиент fakeredis (decode_responses, как redis_client в настройках по умолчанию)"""
+    return fakeredis.FakeRedis(server=redis_server, decode_responses=True)
+
+
+@pytest.fixture
+def async_redis(redis_server):
+    """Асинхронный клиент к тому же серверу fakeredis"""
+    return fakeredis.FakeAsyncRedis(server=redis_server, decode_responses=True)
@@ -0,0 +1,69 @@
+from collections import Counter
+import pytest
+from chat_app.channel_layers import HashRing, ShardedRedisChannelLayer
+
+KEYS = [f"chat_room{i}" for i in range(10000)]
+
+
+def test_empty_ring_is_rejected():
+    with pytest.raises(ValueError):
+        HashRing([])
+
+
+def test_keys_spread_over_all_nodes():
+    ring = HashRing(["a", "b", "c", "d"])
+
+    counts = Counter(ring.get(key) for key in KEYS)
+
+    assert set(counts) == {0, 1, 2, 3}
+    assert all(0.15 < count / len(KEYS) < 0.35 for count in counts.values())
+
+
+def test_same_key_same_node():
+    ring = HashRing(["a", "b", "c"])
+    other = HashRing(["a", "b", "c"])
+
+    assert [ring.get(key) for key in KEYS[:100]] == [other.get(key) for key in KEYS[:100]]
+
+
+def test_adding_node_moves_only_its_share():
+    before = HashRing(["a", "b", "c", "d"])
+    after = HashRing(["a", "b", "c", "d", "e"])
+
+    moved = [key for key in KEYS if before.get(key) != after.get(key)]
+
+    # в среднем переезжает 1/5 ключей, и все они — на новый узел
+    assert 0.1 < len(moved) / len(KEYS) < 0.3
+    assert all(after.get(key) == 4 for key in moved)
+
+
+def hosts(*ports):
+    return [{"address": f"redis://10.0.0.1:{port}/0"} for port in ports]
+
+
+def test_layer_routes_by_ring():
+    layer = ShardedRedisChannelLayer(hosts=hosts(6379, 6380, 6381))
+
+    assert all(layer.consistent_hash(key) == layer.ring.get(key) for key in KEYS[:100])
+    assert len({layer.consistent_hash(key) for key in KEYS[:1000]}) == 3
+
+
+def test_layer_shard_depends_on_address_not_position():
+    layer = ShardedRedisChannelLayer(hosts=hosts(6379, 6380, 6381))
+    reordered = ShardedRedisChannelLayer(hosts=hosts(6381, 6379, 6380))
+
+    for key in KEYS[:200]:
+        address = layer.hosts[layer.consistent_hash(key)]["address"]
+        assert reordered.hosts[reordered.consistent_hash(key)]["address"] == address
+
+
+def test_single_host_layer_skips_ring():
+    layer = ShardedRedisChannelLayer(hosts=hosts(6379))
+
+    assert layer.consistent_hash("chat_general") == 0
+
+
+def test_node_names():
+    assert ShardedRedisChannelLayer._node_name({"address": "redis://r:6379/1"}) == "redis://r:6379/1"
+    assert ShardedRedisChannelLayer._node_name({"master_name": "chat"}) == "sentinel:chat"
+    assert ShardedRedisChannelLayer._node_name({"host": "r", "port": 6380}) == "r:6380/0"
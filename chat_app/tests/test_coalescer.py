@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from chat_app.coalescer import StateCoalescer
+
+
+def make_coalescer(window=0.01):
+    flushed = []
+
+    async def on_flush(room_name, changes):
+        flushed.append((room_name, changes))
+
+    return StateCoalescer(window, on_flush), flushed
+
+
+def test_changes_in_window_are_sent_together():
+    async def main():
+        coalescer, flushed = make_coalescer()
+        coalescer.update("general", 1, "joined", {"username": "ann"})
+        coalescer.update("general", 2, "joined")
+        assert flushed == []
+
+        await asyncio.sleep(0.05)
+        return flushed
+
+    assert asyncio.run(main()) == [("general", {1: ("joined", {"username": "ann"}), 2: ("joined", None)})]
+
+
+def test_opposite_changes_cancel_out():
+    async def main():
+        coalescer, flushed = make_coalescer()
+        coalescer.update("general", 1, "joined")
+        coalescer.update("general", 1, "left")
+        coalescer.update("general", 2, "typing")
+        coalescer.update("general", 2, "typing", {"again": True})
+        await coalescer.flush()
+        return flushed
+
+    assert asyncio.run(main()) == [("general", {2: ("typing", {"again": True})})]
+
+
+def test_flush_is_per_room_and_skips_empty():
+    async def main():
+        coalescer, flushed = make_coalescer()
+        coalescer.update("a", 1, "joined")
+        coalescer.update("b", 1, "joined")
+        coalescer.update("c", 1, "joined")
+        coalescer.update("c", 1, "left")
+        await coalescer.flush()
+        await coalescer.flush()
+        return flushed
+
+    assert asyncio.run(main()) == [("a", {1: ("joined", None)}), ("b", {1: ("joined", None)})]
+
+
+def test_one_timer_per_window():
+    async def main():
+        coalescer, flushed = make_coalescer()
+        coalescer.update("general", 1, "joined")
+        task = coalescer._task
+        coalescer.update("general", 2, "joined")
+        assert coalescer._task is task
+
+        await asyncio.sleep(0.05)
+        coalescer.update("general", 3, "joined")
+        assert coalescer._task is not task
+        await asyncio.sleep(0.05)
+        return flushed
+
+    assert [list(changes) for _, changes in asyncio.run(main())] == [[1, 2], [3]]
+
+
+def test_error_in_one_room_does_not_block_others(caplog):
+    sent = []
+
+    async def on_flush(room_name, changes):
+        if room_name == "broken":
+            raise RuntimeError("layer down")
+        sent.append(room_name)
+
+    async def main():
+        coalescer = StateCoalescer(0.01, on_flush)
+        coalescer.update("broken", 1, "joined")
+        coalescer.update("general", 1, "joined")
+        await coalescer.flush()
+
+    with caplog.at_level(logging.ERROR, logger="chat_app.coalescer"):
+        asyncio.run(main())
+
+    assert sent == ["general"]
+    assert "broken" in caplog.text
@@ -0,0 +1,77 @@
+import asyncio
+import fakeredis
+from redis.exceptions import ConnectionError
+from chat_app.fanout import RoomFanout
+
+
+class Consumer:
+    def __init__(self):
+        self.events = []
+
+    async def dispatch(self, event):
+        self.events.append(event)
+
+
+async def until(condition, timeout=3.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "не дождались"
+        await asyncio.sleep(0.01)
+
+
+def run(redis_server, scenario):
+    async def main():
+        fanout = RoomFanout(fakeredis.FakeAsyncRedis(server=redis_server))
+        consumer = Consumer()
+        await fanout.join("general", consumer)
+        try:
+            await scenario(fanout, consumer)
+        finally:
+            fanout._task.cancel()
+    asyncio.run(main())
+
+
+def test_published_event_reaches_local_consumers(redis_server):
+    async def scenario(fanout, consumer):
+        await fanout.publish("general", {"type": "chat.message", "frame": "hi"})
+        await until(lambda: consumer.events)
+
+        assert consumer.events == [{"type": "chat.message", "frame": "hi"}]
+    run(redis_server, scenario)
+
+
+def test_undecodable_message_is_skipped(redis_server):
+    async def scenario(fanout, consumer):
+        await fanout.client.publish(fanout.channel("general"), b"\xc1")
+        await fanout.publish("general", {"type": "chat.message", "frame": "after"})
+        await until(lambda: consumer.events)
+
+        assert consumer.events == [{"type": "chat.message", "frame": "after"}]
+        assert not fanout._task.done()
+    run(redis_server, scenario)
+
+
+def test_listener_resubscribes_after_redis_error(redis_server):
+    async def scenario(fanout, consumer):
+        broken = fanout._pubsub
+
+        async def disconnected(**kwargs):
+            raise ConnectionError("Connection reset by peer")
+
+        broken.get_message = disconnected
+        await until(lambda: fanout._pubsub is not broken)
+        await until(lambda: fanout._pubsub.subscribed)
+
+        await fanout.publish("general", {"type": "chat.message", "frame": "back"})
+        await until(lambda: consumer.events)
+        assert consumer.events == [{"type": "chat.message", "frame": "back"}]
+    run(redis_server, scenario)
+
+
+def test_listener_stops_when_last_consumer_leaves(redis_server):
+    async def scenario(fanout, consumer):
+        await fanout.leave("general", consumer)
+        await until(fanout._task.done)
+
+        assert fanout._task.exception() is None
+    run(redis_server, scenario)
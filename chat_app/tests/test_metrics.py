@@ -0,0 +1,67 @@
+import os
+import time
+import pytest
+from chat_app.metrics import Registry, merge_snapshots
+
+
+def make_registry(redis, worker_id, push_interval=10):
+    registry = Registry(redis, push_interval=push_interval)
+    registry.worker_id = worker_id
+    registry.counter("messages_total", "Сообщения", ["room"])
+    registry.gauge("connections", "Соединения")
+    registry.histogram("flush_seconds", "Запись пачки", buckets=(0.1, 1.0))
+    return registry
+
+
+def totals(registry):
+    return merge_snapshots(registry.collect_all())
+
+
+def sample(families, name, values=()):
+    return families[name]["samples"].get(tuple(values))
+
+
+@pytest.fixture
+def workers(redis):
+    first, second, scraper = (make_registry(redis, worker_id) for worker_id in ("w1", "w2", "w3"))
+    for registry, count in ((first, 3), (second, 4)):
+        registry._metrics["messages_total"].labels("general").inc(count)
+        registry._metrics["connections"].inc(2)
+        registry._metrics["flush_seconds"].observe(0.5)
+        registry.push()
+    return first, second, scraper
+
+
+def test_live_workers_are_summed(workers):
+    *_, scraper = workers
+
+    families = totals(scraper)
+
+    assert sample(families, "messages_total", ["general"]) == [7]
+    assert sample(families, "connections") == [4]
+
+
+def test_deregistered_worker_keeps_counters_not_gauges(workers, redis):
+    first, second, scraper = workers
+    first._pusher_pid = os.getpid()
+
+    first.deregister()
+    families = totals(scraper)
+
+    assert redis.zrange(scraper.workers_key, 0, -1) == ["w2"]
+    assert sample(families, "messages_total", ["general"]) == [7]
+    assert sample(families, "flush_seconds") == [0, 2, 0, 1.0]
+    assert sample(families, "connections") == [2]
+
+
+def test_stale_worker_is_folded_once(workers, redis):
+    first, second, scraper = workers
+    redis.zadd(scraper.workers_key, {"w1": time.time() - 60})
+
+    assert sample(totals(scraper), "messages_total", ["general"]) == [7]
+    assert sample(totals(scraper), "messages_total", ["general"]) == [7]
+    assert not redis.exists(f"{scraper.key_prefix}w1")
+
+    second._pusher_pid = os.getpid()
+    second.deregister()
+    assert sample(totals(scraper), "messages_total", ["general"]) == [7]
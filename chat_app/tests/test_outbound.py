@@ -0,0 +1,131 @@
+import asyncio
+import pytest
+from chat_app.outbound import (
+    CLOSE_CODE_SLOW_CONSUMER,
+    POLICY_COLLAPSE,
+    POLICY_DISCONNECT,
+    POLICY_DROP_OLDEST,
+    STATE_DISCONNECTED,
+    STATE_LAGGING,
+    STATE_OK,
+    STATE_RESYNC,
+    OutboundQueue,
+)
+
+
+class Client:
+    """Клиент, который не читает, пока тест не откроет release"""
+
+    def __init__(self):
+        self.sent = []
+        self.closed = []
+        self.release = asyncio.Event()
+
+    async def send(self, text_data, bytes_data):
+        await self.release.wait()
+        self.sent.append(text_data)
+
+    async def close(self, code):
+        self.closed.append(code)
+
+
+def run(scenario, **kwargs):
+    async def main():
+        client = Client()
+        queue = OutboundQueue(
+            client.send, client.close, resync_frame=lambda missed: (f"resync:{missed}", None), **kwargs
+        )
+        try:
+            await scenario(queue, client)
+        finally:
+            queue.close()
+    asyncio.run(main())
+
+
+async def drain(queue, client):
+    client.release.set()
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_unknown_policy_is_rejected():
+    async def main():
+        with pytest.raises(ValueError):
+            OutboundQueue(None, None, policy="block")
+    asyncio.run(main())
+
+
+def test_frames_are_sent_in_order():
+    async def scenario(queue, client):
+        for i in range(5):
+            queue.put(str(i))
+        await drain(queue, client)
+
+        assert client.sent == ["0", "1", "2", "3", "4"]
+        assert len(queue) == 0 and queue.state == STATE_OK
+    run(scenario)
+
+
+def test_lagging_state_and_recovery():
+    async def scenario(queue, client):
+        for i in range(3):
+            queue.put(str(i))
+        await asyncio.sleep(0)
+
+        assert queue.state == STATE_LAGGING
+        assert queue.lag() >= 0
+        await drain(queue, client)
+        assert queue.state == STATE_OK
+    run(scenario, max_size=10, lag_threshold=2)
+
+
+def test_drop_oldest_keeps_latest_frames():
+    async def scenario(queue, client):
+        for i in range(6):
+            queue.put(str(i))
+        await drain(queue, client)
+
+        assert client.sent == ["3", "4", "5"]
+        assert queue.missed == 3
+    run(scenario, max_size=3, policy=POLICY_DROP_OLDEST)
+
+
+def test_collapse_replaces_backlog_with_resync():
+    async def scenario(queue, client):
+        for i in range(7):
+            queue.put(str(i))
+        assert queue.state == STATE_RESYNC
+
+        await drain(queue, client)
+        # повторное переполнение в состоянии resync не плодит resync-фреймы
+        assert client.sent == ["resync:7"]
+        assert queue.state == STATE_OK and queue.missed == 0
+
+        queue.put("7")
+        await drain(queue, client)
+        assert client.sent[-1] == "7"
+    run(scenario, max_size=3, policy=POLICY_COLLAPSE)
+
+
+def test_disconnect_closes_slow_client():
+    async def scenario(queue, client):
+        for i in range(5):
+            queue.put(str(i))
+        assert queue.state == STATE_DISCONNECTED
+
+        await drain(queue, client)
+        assert client.closed == [CLOSE_CODE_SLOW_CONSUMER]
+        queue.put("late")
+        assert len(queue) == 0
+    run(scenario, max_size=3, policy=POLICY_DISCONNECT)
+
+
+def test_state_counts_follow_connections():
+    before = OutboundQueue.stats()["connections"]
+
+    async def scenario(queue, client):
+        counts = OutboundQueue.stats()["connections"]
+        assert counts[STATE_OK] == before[STATE_OK] + 1
+    run(scenario)
+
+    assert OutboundQueue.stats()["connections"] == before
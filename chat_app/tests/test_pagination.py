@@ -0,0 +1,85 @@
+from datetime import datetime, timezone
+import pytest
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from chat_app.api.v1.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_CURSOR_ID,
+    MAX_PAGE_SIZE,
+    cursor_datetime,
+    cursor_id,
+    decode_cursor,
+    encode_cursor,
+    get_page_size,
+)
+
+
+def test_cursor_roundtrip():
+    timestamp = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+
+    cursor = encode_cursor([timestamp, 42])
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor, 2) == [str(timestamp), 42]
+
+
+@pytest.mark.parametrize("cursor", ["не base64", "bm90IGpzb24", encode_cursor({"id": 1}), encode_cursor([1])])
+def test_bad_cursor_is_rejected(cursor):
+    with pytest.raises(ValidationError) as error:
+        decode_cursor(cursor, 2)
+
+    assert "cursor" in error.value.detail
+
+
+def request(**params):
+    return Request(APIRequestFactory().get("/api/v1/messages/", params))
+
+
+@pytest.mark.parametrize(
+    "params, expected",
+    [
+        ({}, DEFAULT_PAGE_SIZE),
+        ({"limit": ""}, DEFAULT_PAGE_SIZE),
+        ({"limit": "10"}, 10),
+        ({"limit": "0"}, 1),
+        ({"limit": "100000"}, MAX_PAGE_SIZE),
+    ],
+)
+def test_page_size(params, expected):
+    assert get_page_size(request(**params)) == expected
+
+
+def test_page_size_custom_bounds():
+    assert get_page_size(request(), default=20, maximum=30) == 20
+    assert get_page_size(request(limit="50"), default=20, maximum=30) == 30
+
+
+def test_page_size_must_be_number():
+    with pytest.raises(ValidationError) as error:
+        get_page_size(request(limit="ten"))
+
+    assert "limit" in error.value.detail
+
+
+@pytest.mark.parametrize("value", [5, 0, MAX_CURSOR_ID])
+def test_cursor_id(value):
+    assert cursor_id(value) == value
+
+
+@pytest.mark.parametrize("value", ["5", 1.5, True, None, MAX_CURSOR_ID + 1, -MAX_CURSOR_ID - 1])
+def test_bad_cursor_id_is_rejected(value):
+    with pytest.raises(ValidationError):
+        cursor_id(value)
+
+
+def test_cursor_datetime():
+    assert cursor_datetime("2024-05-01T12:30:00+00:00") == datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize("value", ["2024-13-01T00:00:00", "2024-02-30T00:00:00", "вчера", 1714566600, None])
+def test_bad_cursor_datetime_is_rejected(value):
+    with pytest.raises(ValidationError) as error:
+        cursor_datetime(value)
+
+    assert "cursor" in error.value.detail
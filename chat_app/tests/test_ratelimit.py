@@ -0,0 +1,133 @@
+import asyncio
+import time
+import pytest
+from redis.exceptions import ConnectionError
+from chat_app.ratelimit import RateLimiter
+
+
+def make_limiter(client, lease_size=1, **limits):
+    return RateLimiter(client, limits or {"user": (1, 3), "room": (100, 300)}, lease_size=lease_size)
+
+
+def hits(limiter, count, scope="user", ident=1):
+    async def run():
+        return [await limiter.hit(scope, ident) for _ in range(count)]
+    return asyncio.run(run())
+
+
+def test_burst_then_denied_with_retry_after(async_redis):
+    limiter = make_limiter(async_redis)
+
+    results = hits(limiter, 4)
+
+    assert [allowed for allowed, _ in results] == [True, True, True, False]
+    assert 0 < results[-1][1] <= 1000
+
+
+def test_buckets_are_separate_per_ident(async_redis):
+    limiter = make_limiter(async_redis)
+    hits(limiter, 4, ident=1)
+
+    assert hits(limiter, 1, ident=2) == [(True, 0)]
+
+
+def test_cold_key_takes_one_token(async_redis, redis):
+    limiter = make_limiter(async_redis, lease_size=5, anon=(1, 5))
+
+    assert hits(limiter, 1, scope="anon") == [(True, 0)]
+    assert float(redis.hget("ratelimit:anon:1", "tokens")) == pytest.approx(4, abs=0.1)
+
+
+def test_hot_key_leases_several_tokens_in_one_call(async_redis, redis):
+    limiter = make_limiter(async_redis, lease_size=5, user=(1, 20))
+    calls = []
+    script = limiter._script
+
+    async def counting_script(**kwargs):
+        calls.append(kwargs)
+        return await script(**kwargs)
+
+    limiter._script = counting_script
+
+    assert all(allowed for allowed, _ in hits(limiter, 6))
+    # первое сообщение берёт один токен, второе — аренду на пять
+    assert len(calls) == 2
+    assert float(redis.hget("ratelimit:user:1", "tokens")) == pytest.approx(14, abs=0.1)
+
+    hits(limiter, 1)
+    assert len(calls) == 3
+
+
+def test_expired_lease_is_returned_to_bucket(async_redis, redis):
+    limiter = RateLimiter(async_redis, {"user": (1, 20)}, lease_size=5, lease_ttl=0.05)
+    hits(limiter, 2)
+    assert float(redis.hget("ratelimit:user:1", "tokens")) == pytest.approx(14, abs=0.1)
+
+    time.sleep(0.06)
+    hits(limiter, 1)
+
+    # четыре неизрасходованных токена вернулись, списан один
+    assert float(redis.hget("ratelimit:user:1", "tokens")) == pytest.approx(17, abs=0.2)
+
+
+def test_lease_never_exceeds_burst(async_redis):
+    limiter = make_limiter(async_redis, lease_size=10, user=(1, 3))
+
+    assert [allowed for allowed, _ in hits(limiter, 4)] == [True, True, True, False]
+
+
+def test_denied_key_is_rejected_locally(async_redis):
+    limiter = make_limiter(async_redis)
+    hits(limiter, 4)
+
+    async def broken_script(**kwargs):
+        raise AssertionError("после отказа Redis не нужен")
+
+    limiter._script = broken_script
+    allowed, retry_after_ms = hits(limiter, 1)[0]
+    assert not allowed
+    assert retry_after_ms >= 0
+
+
+def test_redis_error_lets_message_through(async_redis):
+    limiter = make_limiter(async_redis)
+
+    async def failing_script(**kwargs):
+        raise ConnectionError("down")
+
+    limiter._script = failing_script
+    assert hits(limiter, 1) == [(True, 0)]
+
+
+def test_check_returns_first_exhausted_scope(async_redis):
+    limiter = make_limiter(async_redis, user=(1, 5), room=(1, 2))
+
+    async def run():
+        return [await limiter.check(("user", 1), ("room", "general")) for _ in range(3)]
+
+    first, second, third = asyncio.run(run())
+    assert first is None and second is None
+    assert third[0] == "room"
+
+
+def test_room_denial_does_not_charge_user(async_redis, redis):
+    limiter = make_limiter(async_redis, user=(1, 5), room=(1, 1))
+
+    async def run():
+        return [await limiter.check(("user", 1), ("room", "general")) for _ in range(2)]
+
+    first, second = asyncio.run(run())
+    assert first is None and second[0] == "room"
+    assert float(redis.hget("ratelimit:user:1", "tokens")) == pytest.approx(4, abs=0.1)
+
+
+def test_room_denial_returns_leased_user_token(async_redis):
+    limiter = make_limiter(async_redis, lease_size=5, user=(1, 20), room=(1, 1))
+    hits(limiter, 2)
+
+    async def run():
+        return [await limiter.check(("user", 1), ("room", "general")) for _ in range(2)]
+
+    first, second = asyncio.run(run())
+    assert first is None and second[0] == "room"
+    assert limiter._leases.get("ratelimit:user:1")[0] == 3
@@ -0,0 +1,73 @@
+import time
+import pytest
+from chat_app import refresh_tokens as refresh_tokens_module
+from chat_app.refresh_tokens import RefreshTokenStore
+from chat_app.revocation import RevokedTokens
+
+
+@pytest.fixture
+def store(redis):
+    return RefreshTokenStore(redis, ttl=3600)
+
+
+def test_create_starts_session(store, redis):
+    assert store.create(1, "s1", "j1")
+
+    assert redis.hgetall(store.session_key("s1")) == {"user": "1", "jti": "j1"}
+    assert redis.smembers(store.user_key(1)) == {"s1"}
+    assert 0 < redis.ttl(store.session_key("s1")) <= 3600
+
+
+def test_create_does_not_overwrite_existing_session(store, redis):
+    store.create(1, "s1", "j1")
+    store.rotate(1, "s1", "j1", "j2")
+
+    assert not store.create(1, "s1", "j1")
+    assert redis.hget(store.session_key("s1"), "jti") == "j2"
+
+
+def test_rotate_swaps_current_jti(store, redis):
+    store.create(1, "s1", "j1")
+
+    assert store.rotate(1, "s1", "j1", "j2")
+    assert redis.hget(store.session_key("s1"), "jti") == "j2"
+
+
+def test_rotate_rejects_reused_refresh(store):
+    store.create(1, "s1", "j1")
+    store.rotate(1, "s1", "j1", "j2")
+
+    assert not store.rotate(1, "s1", "j1", "j3")
+    # текущий токен сессии после отказа по-прежнему работает
+    assert store.rotate(1, "s1", "j2", "j3")
+
+
+def test_rotate_rejects_other_user_and_missing_session(store):
+    store.create(1, "s1", "j1")
+
+    assert not store.rotate(2, "s1", "j1", "j2")
+    assert not store.rotate(1, "missing", "j1", "j2")
+
+
+def test_rotate_extends_session_ttl(store, redis):
+    store.create(1, "s1", "j1", ttl=10)
+
+    store.rotate(1, "s1", "j1", "j2")
+    assert redis.ttl(store.session_key("s1")) > 10
+    assert redis.ttl(store.user_key(1)) > 10
+
+
+def test_revoke_user_ends_sessions_and_revokes_sids(store, redis, async_redis, monkeypatch):
+    revoked = RevokedTokens(redis, async_redis)
+    monkeypatch.setattr(refresh_tokens_module, "revoked_tokens", revoked)
+    store.create(1, "s1", "j1")
+    store.create(1, "s2", "j2")
+    store.create(2, "s3", "j3")
+
+    store._revoke_user(1)
+
+    assert not redis.exists(store.user_key(1), store.session_key("s1"), store.session_key("s2"))
+    assert redis.exists(store.session_key("s3"))
+    scores = dict(redis.zrange(revoked.key, 0, -1, withscores=True))
+    assert set(scores) == {"sid:s1", "sid:s2"}
+    assert all(score > time.time() for score in scores.values())
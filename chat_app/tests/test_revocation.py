@@ -0,0 +1,111 @@
+import asyncio
+import os
+import time
+import pytest
+from redis.exceptions import ConnectionError
+from chat_app.revocation import BloomFilter, RevokedTokens
+
+
+def test_bloom_has_no_false_negatives():
+    bloom = BloomFilter(10000, 0.001)
+    for i in range(10000):
+        bloom.add(f"jti:{i}")
+
+    assert all(f"jti:{i}" in bloom for i in range(10000))
+    assert bloom.count == 10000
+
+
+def test_bloom_false_positive_rate_close_to_target():
+    bloom = BloomFilter(10000, 0.01)
+    for i in range(10000):
+        bloom.add(f"jti:{i}")
+
+    false_positives = sum(f"other:{i}" in bloom for i in range(20000))
+    assert false_positives / 20000 < 0.02
+
+
+def test_bloom_sizing():
+    bloom = BloomFilter(1000, 0.001)
+
+    # ~14.4 бита и ~10 хэшей на элемент при 0.1% ложных срабатываний
+    assert 14000 <= bloom.size <= 14600
+    assert bloom.hashes == 10
+    assert "anything" not in BloomFilter(1000, 0.001)
+
+
+class DownRedis:
+    def zmscore(self, *args):
+        raise ConnectionError("down")
+
+
+@pytest.fixture
+def tokens(redis, async_redis):
+    revoked = RevokedTokens(redis, async_redis, capacity=1000)
+    # без фонового потока: фильтр собирается в тесте явно
+    revoked._listener_pid = os.getpid()
+    return revoked
+
+
+def test_revoked_token_is_found(tokens):
+    tokens.rebuild()
+    tokens.revoke(time.time() + 60, jti="j1", sid="s1")
+
+    assert tokens.is_revoked(jti="j1")
+    assert tokens.is_revoked(jti="other", sid="s1")
+    assert not tokens.is_revoked(jti="j2", sid="s2")
+    assert asyncio.run(tokens.ais_revoked(jti="j1"))
+
+
+def test_rebuild_loads_live_entries_only(tokens, redis):
+    redis.zadd(tokens.key, {"jti:live": time.time() + 60, "jti:expired": time.time() - 60})
+
+    tokens.rebuild()
+
+    assert "jti:live" in tokens._filter
+    assert tokens._filter.count == 1
+
+
+def test_expired_entry_is_not_revoked(tokens):
+    tokens.rebuild()
+    tokens.revoke(time.time() - 1, jti="j1")
+
+    # фильтр срабатывает, но по score в Redis запись уже не действует
+    assert "jti:j1" in tokens._filter
+    assert not tokens.is_revoked(jti="j1")
+
+
+def test_filter_miss_skips_redis(tokens):
+    tokens.rebuild()
+    tokens.client = DownRedis()
+
+    assert not tokens.is_revoked(jti="never-revoked")
+
+
+def test_without_filter_every_check_goes_to_redis(tokens):
+    tokens.revoke(time.time() + 60, jti="j1")
+
+    assert tokens._filter is None
+    assert tokens.is_revoked(jti="j1")
+    assert not tokens.is_revoked(jti="j2")
+
+
+@pytest.mark.parametrize("fail_closed", [True, False])
+def test_unconfirmed_check_follows_fail_policy(tokens, fail_closed):
+    tokens.rebuild()
+    tokens.revoke(time.time() + 60, jti="j1")
+    tokens.client = DownRedis()
+    tokens.fail_closed = fail_closed
+
+    assert tokens.is_revoked(jti="j1") is fail_closed
+
+
+def test_revoke_tokens_bulk_and_prune(tokens, redis):
+    tokens.revoke_tokens({"a": time.time() + 60, "b": time.time() - 60})
+    pubsub = redis.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(tokens.channel)
+    pubsub.get_message(timeout=0.1)
+
+    assert tokens.prune() == 1
+    assert redis.zrange(tokens.key, 0, -1) == ["jti:a"]
+    message = pubsub.get_message(timeout=1.0)
+    assert message is not None and message["data"] == tokens.REBUILD
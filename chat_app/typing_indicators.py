@@ -0,0 +1,69 @@
+import time
+from django.conf import settings
+from .cache import TTLCache
+from .codecs import build_event
+from .coalescer import StateCoalescer
+from .fanout import broadcast
+
+
+class TypingIndicators:
+    """
+    Индикаторы набора текста.
+    От пользователя в комнате принимается не больше одного события typing за throttle_interval,
+    изменения копятся flush_interval секунд и уходят в комнату одним фреймом.
+    Клиент сам гасит индикатор, если за ttl секунд не пришло обновление.
+    """
+
+    def __init__(self, enabled=True, throttle_interval=3.0, flush_interval=0.5, ttl=6):
+        self.enabled = enabled
+        self.throttle_interval = throttle_interval
+        self.ttl = ttl
+        # (room_name, user_id) -> время последнего принятого typing
+        self._typing = TTLCache(max_size=100000, ttl=ttl)
+        self._events = StateCoalescer(flush_interval, self._send)
+
+    @classmethod
+    def from_settings(cls):
+        conf = getattr(settings, "TYPING", {})
+        return cls(
+            enabled=conf.get("ENABLED", True),
+            throttle_interval=conf.get("THROTTLE_MS", 3000) / 1000,
+            flush_interval=conf.get("FLUSH_INTERVAL_MS", 500) / 1000,
+            ttl=conf.get("TTL", 6),
+        )
+
+    def typing(self, room_name, user_id, username):
+        if not self.enabled:
+            return
+
+        key = (room_name, user_id)
+        now = time.monotonic()
+        last = self._typing.get(key)
+        if last is not None and now - last < self.throttle_interval:
+            return
+        self._typing.set(key, now)
+        self._events.update(room_name, user_id, True, username)
+
+    def stopped(self, room_name, user_id):
+        if not self.enabled:
+            return
+
+        key = (room_name, user_id)
+        if self._typing.get(key) is None:
+            return
+        self._typing.delete(key)
+        self._events.update(room_name, user_id, False)
+
+    async def _send(self, room_name, changes):
+        await broadcast(room_name, build_event("typing_update", {
+            "type": "typing",
+            "typing": [
+                {"id": user_id, "username": username}
+                for user_id, (state, username) in changes.items() if state
+            ],
+            "stopped": [user_id for user_id, (state, _) in changes.items() if not state],
+            "ttl": self.ttl,
+        }))
+
+
+typing_indicators = TypingIndicators.from_settings()
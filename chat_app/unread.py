@@ -0,0 +1,170 @@
+import logging
+from functools import reduce
+from operator import or_
+from django.conf import settings
+from django.db.models import Case, Count, DateTimeField, Q, Value, When
+from django.utils import timezone
+from redis.exceptions import RedisError
+from .models import Message, ReadCursor, Room
+from .redis_client import async_redis_client, redis_client
+
+logger = logging.getLogger(__name__)
+
+# Новое сообщение: +1 к номеру последнего сообщения комнаты, отправитель сразу считается прочитавшим
+MESSAGE_LUA = """
+local seq = redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+if KEYS[2] then
+    redis.call('HSET', KEYS[2], ARGV[1], seq)
+end
+return seq
+"""
+
+# Маркер прочтения: пользователь прочитал всё до текущего номера комнаты
+READ_LUA = """
+local seq = redis.call('HGET', KEYS[1], ARGV[1]) or 0
+redis.call('HSET', KEYS[2], ARGV[1], seq)
+return seq
+"""
+
+
+class UnreadCounters:
+    """
+    Счётчики непрочитанных сообщений.
+    В Redis хранится номер последнего сообщения каждой комнаты (один HINCRBY на сообщение,
+    независимо от числа участников) и для каждого пользователя — номер, до которого он прочитал комнату.
+    Непрочитано = номер комнаты - номер пользователя.
+    Момент прочтения дублируется в ReadCursor (отправка сообщения тоже сдвигает курсор отправителя,
+    см. MessageWriter); если в Redis нет номера пользователя
+    (новый участник, очищенный Redis), счётчик пересчитывается из Postgres и записывается обратно.
+    """
+
+    room_seq_key = "unread:room_seq"
+    read_prefix = "unread:read:"
+
+    def __init__(self, client, sync_client, enabled=True, max_count=1000):
+        self.client = client
+        self.sync_client = sync_client
+        self.enabled = enabled
+        # Пересчёт из Postgres отдаёт не больше max_count непрочитанных на комнату
+        self.max_count = max_count
+        self._message_script = client.register_script(MESSAGE_LUA)
+        self._read_script = client.register_script(READ_LUA)
+
+    @classmethod
+    def from_settings(cls, client, sync_client):
+        conf = getattr(settings, "UNREAD", {})
+        return cls(
+            client,
+            sync_client,
+            enabled=conf.get("ENABLED", True),
+            max_count=conf.get("MAX_COUNT", 1000),
+        )
+
+    def read_key(self, user_id):
+        return f"{self.read_prefix}{user_id}"
+
+    async def message(self, room_id, sender_id=None):
+        """Новое сообщение в комнате"""
+        if not self.enabled:
+            return
+        keys = [self.room_seq_key]
+        if sender_id is not None:
+            keys.append(self.read_key(sender_id))
+        try:
+            await self._message_script(keys=keys, args=[room_id])
+        except RedisError as e:
+            logger.warning("Unread: не удалось учесть сообщение в комнате %s: %s", room_id, e)
+
+    async def mark_read(self, room_id, user_id):
+        """Пользователь прочитал комнату: обнулить счётчик в Redis"""
+        if not self.enabled:
+            return
+        try:
+            await self._read_script(keys=[self.room_seq_key, self.read_key(user_id)], args=[room_id])
+        except RedisError as e:
+            logger.warning("Unread: не удалось отметить прочтение комнаты %s: %s", room_id, e)
+
+    async def save_cursor(self, room_id, user_id):
+        """Долговременная копия прочтения"""
+        await self.save_cursors({(user_id, room_id): timezone.now()})
+
+    @staticmethod
+    async def save_cursors(cursors):
+        """
+        {(user_id, room_id): момент прочтения} — два запроса на любое число курсоров.
+        Курсор только сдвигается вперёд: пачка сообщений может записаться позже, чем отправитель прочитал комнату.
+        """
+        if not cursors:
+            return
+        await ReadCursor.objects.abulk_create(
+            [ReadCursor(user_id=user_id, room_id=room_id, last_read_at=at) for (user_id, room_id), at in cursors.items()],
+            ignore_conflicts=True,
+        )
+        await ReadCursor.objects.filter(reduce(or_, (
+            Q(user_id=user_id, room_id=room_id, last_read_at__lt=at) for (user_id, room_id), at in cursors.items()
+        ))).aupdate(last_read_at=Case(
+            *(When(user_id=user_id, room_id=room_id, then=Value(at)) for (user_id, room_id), at in cursors.items()),
+            output_field=DateTimeField(),
+        ))
+
+    def counts(self, user_id):
+        """{room_id: непрочитано} по всем комнатам пользователя (синхронно, для REST API)"""
+        room_ids = list(
+            Room.participants.through.objects.filter(user_id=user_id).values_list("room_id", flat=True)
+        )
+        if not room_ids:
+            return {}
+        if not self.enabled:
+            return self._counts_from_db(user_id, room_ids)
+
+        try:
+            with self.sync_client.pipeline(transaction=False) as pipe:
+                pipe.hmget(self.room_seq_key, room_ids)
+                pipe.hmget(self.read_key(user_id), room_ids)
+                room_seqs, read_seqs = pipe.execute()
+        except RedisError as e:
+            logger.warning("Unread: Redis недоступен, считаем из БД: %s", e)
+            return self._counts_from_db(user_id, room_ids)
+
+        counts = {}
+        missing = []
+        for room_id, room_seq, read_seq in zip(room_ids, room_seqs, read_seqs):
+            if read_seq is None:
+                missing.append((room_id, int(room_seq or 0)))
+            else:
+                counts[room_id] = max(0, int(room_seq or 0) - int(read_seq))
+
+        if missing:
+            counts.update(self._rebuild(user_id, missing))
+        return counts
+
+    def _rebuild(self, user_id, missing):
+        """Пересчитать счётчики из Postgres и записать в Redis номер, с которым они сойдутся"""
+        rebuilt = self._counts_from_db(user_id, [room_id for room_id, _ in missing])
+        try:
+            with self.sync_client.pipeline(transaction=False) as pipe:
+                for room_id, room_seq in missing:
+                    pipe.hsetnx(self.room_seq_key, room_id, room_seq)
+                    pipe.hsetnx(self.read_key(user_id), room_id, room_seq - rebuilt[room_id])
+                pipe.execute()
+        except RedisError as e:
+            logger.warning("Unread: не удалось сохранить пересчитанные счётчики: %s", e)
+        return rebuilt
+
+    def _counts_from_db(self, user_id, room_ids):
+        cursors = dict(
+            ReadCursor.objects.filter(user_id=user_id, room_id__in=room_ids).values_list("room_id", "last_read_at")
+        )
+        # один запрос: по диапазону индекса (room, timestamp) на комнату, свои сообщения не считаются, как и в Redis
+        ranges = reduce(or_, (
+            Q(room_id=room_id, timestamp__gt=cursors[room_id]) if room_id in cursors else Q(room_id=room_id)
+            for room_id in room_ids
+        ))
+        found = dict(
+            Message.objects.filter(ranges).exclude(user_id=user_id)
+            .order_by().values("room_id").annotate(unread=Count("id")).values_list("room_id", "unread")
+        )
+        return {room_id: min(found.get(room_id, 0), self.max_count) for room_id in room_ids}
+
+
+unread_counters = UnreadCounters.from_settings(async_redis_client, redis_client)
@@ -0,0 +1,58 @@
+import logging
+import secrets
+from django.db import transaction
+from redis.exceptions import RedisError
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class DataVersion:
+    """
+    Номер версии набора данных в Redis (например, списка комнат).
+    Меняется сигналами при любом изменении данных; ответы API, построенные на этих данных,
+    используют его в ETag и ключах кэша, поэтому старые ответы становятся недействительными без перебора ключей.
+    Версия начинается со случайного числа, а не с 0: после потери ключа (flush, рестарт Redis без AOF)
+    номера не повторяются и старые ETag у клиентов не совпадут с новыми данными.
+    """
+
+    key_prefix = "version:"
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.key = f"{self.key_prefix}{name}"
+
+    def get(self):
+        """Текущая версия или None, если Redis недоступен"""
+        try:
+            version = self.client.get(self.key)
+            if version is None:
+                with self.client.pipeline(transaction=False) as pipe:
+                    self._seed(pipe)
+                    pipe.get(self.key)
+                    _, version = pipe.execute()
+            return int(version)
+        except RedisError as e:
+            logger.warning("Не удалось получить версию %s: %s", self.name, e)
+            return None
+
+    def _seed(self, pipe):
+        # если ключа нет, начать со случайной версии; 2**62 оставляет запас для INCR
+        pipe.set(self.key, secrets.randbits(62), nx=True)
+
+    def bump(self):
+        """Сменить версию после коммита транзакции, чтобы новую версию не закэшировали со старыми данными"""
+        transaction.on_commit(self._incr)
+
+    def _incr(self):
+        try:
+            with self.client.pipeline(transaction=False) as pipe:
+                self._seed(pipe)
+                pipe.incr(self.key)
+                pipe.execute()
+        except RedisError as e:
+            logger.error("Не удалось сменить версию %s: %s", self.name, e)
+
+
+rooms_version = DataVersion(redis_client, "rooms")
@@ -12,6 +12,7 @@ from django.core.asgi import get_asgi_application
 
 from chat_app.routing import websocket_urlpatterns
 from chat_app.middleware import JWTAuthMiddleware
+from chat_app.lifespan import LifespanApp
 
 
 application = ProtocolTypeRouter({
@@ -19,4 +20,5 @@ application = ProtocolTypeRouter({
     "websocket": JWTAuthMiddleware(
         URLRouter(websocket_urlpatterns)
     ),
+    "lifespan": LifespanApp(),
 })
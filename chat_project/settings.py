@@ -20,7 +20,7 @@ ALLOWED_HOSTS = env.str("ALLOWED_HOSTS", "127.0.0.1,localhost").split(",")
 # Настройка базы данных
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'ENGINE': 'django.db.backends.postgresql',
         'NAME': env.str('POSTGRES_DB'),
         'USER': env.str('POSTGRES_USER'),
         'PASSWORD': env.str('POSTGRES_PASSWORD'),
@@ -29,8 +29,17 @@ DATABASES = {
     }
 }
 
-# DATABASES["default"]["ENGINE"] = "django.db.backends.postgresql_async"
-DATABASES["default"]["ENGINE"] = "django.db.backends.postgresql"
+# Пул соединений psycopg 3 (зависимость psycopg[binary,pool]); без пакета Django не стартует с ImproperlyConfigured
+# MIN_SIZE/MAX_SIZE — соединений в пуле на процесс, TIMEOUT — сколько секунд ждать свободного соединения
+if env.bool("DB_POOL_ENABLED", True):
+    DATABASES["default"]["CONN_MAX_AGE"] = 0  # с пулом соединения возвращаются в пул, а не держатся потоком
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": env.int("DB_POOL_MIN_SIZE", 2),
+            "max_size": env.int("DB_POOL_MAX_SIZE", 10),
+            "timeout": env.float("DB_POOL_TIMEOUT", 10.0),
+        },
+    }
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -40,6 +49,125 @@ REDIS_PORT = env.str("REDIS_PORT", "6379")  # if DOCKER else '127.0.0.1:6379'
 REDIS_DB = env.str("REDIS_DB", "1")
 REDIS_DECODE_RESPONSES = True
 
+# Сохранение сообщений (write-behind)
+# MODE: async — fire-and-forget, flush — рассылка после сброса батча, sync — INSERT на каждое сообщение
+# RETRIES / RETRY_BACKOFF_MS — повторы записи при ошибке БД, пауза удваивается с каждой попыткой
+MESSAGE_PERSISTENCE = {
+    "MODE": env.str("MESSAGE_PERSISTENCE_MODE", "async"),
+    "BATCH_SIZE": env.int("MESSAGE_BATCH_SIZE", 200),
+    "FLUSH_INTERVAL_MS": env.int("MESSAGE_FLUSH_INTERVAL_MS", 50),
+    "MAX_BUFFER": env.int("MESSAGE_MAX_BUFFER", 10000),
+    "RETRIES": env.int("MESSAGE_WRITE_RETRIES", 3),
+    "RETRY_BACKOFF_MS": env.int("MESSAGE_WRITE_RETRY_BACKOFF_MS", 100),
+}
+
+# Сериализатор WebSocket фреймов: auto | orjson | json
+WS_JSON_CODEC = env.str("WS_JSON_CODEC", "auto")
+
+# Бинарный подпротокол chat.msgpack
+# COMPRESS_THRESHOLD — сжимать zlib фреймы больше N байт, 0 — без сжатия
+WS_BINARY_PROTOCOL = {
+    "ENABLED": env.bool("WS_BINARY_ENABLED", True),
+    "COMPRESS_THRESHOLD": env.int("WS_BINARY_COMPRESS_THRESHOLD", 1024),
+    "COMPRESS_LEVEL": env.int("WS_BINARY_COMPRESS_LEVEL", 6),
+}
+
+# Fan-out больших комнат через Redis pub/sub
+# PUBSUB_ROOMS — комнаты, которые всегда идут через pub/sub
+# MEMBER_THRESHOLD — переключать комнату на pub/sub от N подключений, 0 — только PUBSUB_ROOMS
+# HEARTBEAT_INTERVAL / MEMBERS_TTL — как часто воркер продлевает своё число подключений и через сколько
+# секунд без продления (упавший воркер) оно перестаёт учитываться
+ROOM_FANOUT = {
+    "ENABLED": env.bool("ROOM_FANOUT_ENABLED", True),
+    "PUBSUB_ROOMS": env.list("ROOM_FANOUT_PUBSUB_ROOMS", default=[]),
+    "MEMBER_THRESHOLD": env.int("ROOM_FANOUT_MEMBER_THRESHOLD", 1000),
+    "MODE_CACHE_TTL": env.int("ROOM_FANOUT_MODE_CACHE_TTL", 2),
+    "HEARTBEAT_INTERVAL": env.int("ROOM_FANOUT_HEARTBEAT_INTERVAL", 15),
+    "MEMBERS_TTL": env.int("ROOM_FANOUT_MEMBERS_TTL", 45),
+}
+
+# Присутствие пользователей в комнатах
+PRESENCE = {
+    "ENABLED": env.bool("PRESENCE_ENABLED", True),
+    "HEARTBEAT_INTERVAL": env.int("PRESENCE_HEARTBEAT_INTERVAL", 15),
+    "TTL": env.int("PRESENCE_TTL", 45),
+    "COALESCE_WINDOW_MS": env.int("PRESENCE_COALESCE_WINDOW_MS", 1000),
+}
+
+# Индикаторы набора текста
+# THROTTLE_MS — не чаще одного typing от пользователя в комнате, FLUSH_INTERVAL_MS — период рассылки
+TYPING = {
+    "ENABLED": env.bool("TYPING_ENABLED", True),
+    "THROTTLE_MS": env.int("TYPING_THROTTLE_MS", 3000),
+    "FLUSH_INTERVAL_MS": env.int("TYPING_FLUSH_INTERVAL_MS", 500),
+    "TTL": env.int("TYPING_TTL", 6),
+}
+
+# Лимиты входящих сообщений WebSocket: (сообщений в секунду, burst)
+# USER — на пользователя, ANON — на IP анонимного клиента, ROOM — на комнату
+WS_RATE_LIMITS = {
+    "ENABLED": env.bool("WS_RATE_LIMIT_ENABLED", True),
+    "USER": (env.float("WS_RATE_USER", 5), env.int("WS_RATE_USER_BURST", 20)),
+    "ANON": (env.float("WS_RATE_ANON", 1), env.int("WS_RATE_ANON_BURST", 5)),
+    "ROOM": (env.float("WS_RATE_ROOM", 100), env.int("WS_RATE_ROOM_BURST", 300)),
+    "LEASE_SIZE": env.int("WS_RATE_LEASE_SIZE", 5),
+    "LEASE_TTL_MS": env.int("WS_RATE_LEASE_TTL_MS", 1000),
+}
+
+# Исходящие очереди соединений (медленные клиенты)
+# MAX_QUEUE — сколько фреймов может ждать отправки, LAG_THRESHOLD — с какого числа соединение считается отстающим
+# POLICY: drop_oldest | collapse (сброс очереди и фрейм resync) | disconnect
+WS_OUTBOUND = {
+    "MAX_QUEUE": env.int("WS_OUTBOUND_MAX_QUEUE", 256),
+    "LAG_THRESHOLD": env.int("WS_OUTBOUND_LAG_THRESHOLD", 64),
+    "POLICY": env.str("WS_OUTBOUND_POLICY", "collapse"),
+}
+
+# Подключаться к комнате по WebSocket могут только её участники
+# TTL — время жизни set участников комнаты в Redis (пересобирается из БД при промахе),
+# он же — сколько максимум может прожить set, в который не дошло изменение участников
+WS_ROOM_MEMBERSHIP = {
+    "ENFORCE": env.bool("WS_ROOM_MEMBERSHIP_ENFORCE", True),
+    "TTL": env.int("WS_ROOM_MEMBERSHIP_TTL", 15 * 60),
+}
+
+# Счётчики непрочитанных сообщений
+# MAX_COUNT — потолок счётчика при пересчёте из БД (если в Redis нет данных)
+UNREAD = {
+    "ENABLED": env.bool("UNREAD_ENABLED", True),
+    "MAX_COUNT": env.int("UNREAD_MAX_COUNT", 1000),
+}
+
+# Кэш ответов API (комнаты, пользователи) в Redis
+# LOCK_TTL_MS — single-flight блокировка на построение ответа, WAIT_MS — сколько ждать чужого построения
+RESPONSE_CACHE = {
+    "ENABLED": env.bool("RESPONSE_CACHE_ENABLED", True),
+    "TTL": env.int("RESPONSE_CACHE_TTL", 300),
+    "LOCK_TTL_MS": env.int("RESPONSE_CACHE_LOCK_TTL_MS", 5000),
+    "WAIT_MS": env.int("RESPONSE_CACHE_WAIT_MS", 500),
+}
+
+# Метрики Prometheus (GET /metrics/)
+# TOKEN — если задан, нужен заголовок Authorization: Bearer <token>
+# ALLOWED_IPS — без TOKEN endpoint доступен только с этих адресов/сетей, PUBLIC=True — доступен всем
+# AGGREGATE — каждый процесс раз в PUSH_INTERVAL секунд кладёт снимок в Redis, endpoint суммирует все процессы
+METRICS = {
+    "ENABLED": env.bool("METRICS_ENABLED", True),
+    "TOKEN": env.str("METRICS_TOKEN", ""),
+    "ALLOWED_IPS": env.list("METRICS_ALLOWED_IPS", default=["127.0.0.1", "::1"]),
+    "PUBLIC": env.bool("METRICS_PUBLIC", False),
+    "AGGREGATE": env.bool("METRICS_AGGREGATE", True),
+    "PUSH_INTERVAL": env.int("METRICS_PUSH_INTERVAL", 10),
+}
+
+# Последние сообщения комнаты в Redis (отдаются при подключении без запроса в БД)
+ROOM_RECENT_MESSAGES = {
+    "ENABLED": env.bool("ROOM_RECENT_ENABLED", True),
+    "SIZE": env.int("ROOM_RECENT_SIZE", 50),
+    "TTL": env.int("ROOM_RECENT_TTL", 7 * 24 * 60 * 60),  # 0 — без TTL
+    "REPLAY_ON_CONNECT": env.bool("ROOM_RECENT_REPLAY", True),
+}
+
 # Установленные приложения
 INSTALLED_APPS = [
     'chat_app',
@@ -50,6 +178,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework.authtoken',
     'drf_spectacular',
     'drf_spectacular_sidecar',
@@ -58,16 +187,26 @@ INSTALLED_APPS = [
     'rest_framework_simplejwt.token_blacklist',
 ]
 
+# Шарды Redis для channel layer: "host:port,host:port" или redis:// URL через запятую
+# Если не заданы — используется один REDIS_HOST:REDIS_PORT
+REDIS_SHARDS = env.list("REDIS_SHARDS", default=[])
+CHANNEL_LAYER_HOSTS = [
+    shard if "://" in shard else tuple(shard.rsplit(":", 1))
+    for shard in REDIS_SHARDS
+] or [(REDIS_HOST, REDIS_PORT)]
+
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "BACKEND": "chat_app.channel_layers.ShardedRedisChannelLayer",
         "CONFIG": {
-            "hosts": [(REDIS_HOST, REDIS_PORT)]
+            "hosts": CHANNEL_LAYER_HOSTS,
+            "ring_replicas": env.int("REDIS_SHARD_REPLICAS", 160),
         },
     },
 }
 
 MIDDLEWARE = [
+    'chat_app.middleware.RequestMetricsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -104,11 +243,23 @@ STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'static'
 
 # Django REST Framework
+# Аутентификация REST API: Bearer access token из /api/v1/token/get/, проверяется по подписи без БД
+# STATELESS — пользователь из claims токена, иначе из БД через кэш на USER_CACHE_TTL секунд
+REST_JWT_AUTH = {
+    "STATELESS": env.bool("REST_JWT_STATELESS", True),
+    "USER_CACHE_SIZE": env.int("REST_JWT_USER_CACHE_SIZE", 10000),
+    "USER_CACHE_TTL": env.int("REST_JWT_USER_CACHE_TTL", 60),
+}
+# Старые схемы Basic (PBKDF2 на каждый запрос) и Token (DRF authtoken) — для клиентов, не перешедших на JWT
+REST_LEGACY_AUTH = env.bool("REST_LEGACY_AUTH", False)
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        "chat_app.authentication.StatelessJWTAuthentication",
+    ] + ([
         "rest_framework.authentication.BasicAuthentication",
         "rest_framework.authentication.TokenAuthentication"
-    ],
+    ] if REST_LEGACY_AUTH else []),
     'DEFAULT_PERMISSION_CLASSES': [
         "rest_framework.permissions.IsAuthenticated",
     ],
@@ -123,6 +274,23 @@ SIMPLE_JWT = {
     "AUTH_HEADER_TYPES": ("Bearer",),
 }
 
+# Отозванные токены и сессии: фильтр Блума в каждом процессе, подтверждение в Redis
+# CAPACITY и ERROR_RATE — размер фильтра, REBUILD_INTERVAL — период пересборки из Redis в секундах
+# FAIL_CLOSED — что делать, если Redis недоступен, а проверку надо подтвердить (срабатывание фильтра
+# или фильтра ещё нет): True — считать токен отозванным (отказ в доступе), False — пропустить токен
+REVOCATION = {
+    "CAPACITY": env.int("REVOCATION_CAPACITY", 100000),
+    "ERROR_RATE": env.float("REVOCATION_ERROR_RATE", 0.001),
+    "REBUILD_INTERVAL": env.int("REVOCATION_REBUILD_INTERVAL", 300),
+    "FAIL_CLOSED": env.bool("REVOCATION_FAIL_CLOSED", True),
+}
+
+# Кэш проверенных JWT в WebSocket middleware
+JWT_AUTH_CACHE = {
+    "MAX_SIZE": env.int("JWT_CACHE_SIZE", 10000),
+    "TTL": env.int("JWT_CACHE_TTL", 300),
+}
+
 AUTH_USER_MODEL = "chat_app.User"
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -5,6 +5,7 @@ from chat_app.config import pydantic_settings
 from rest_framework.decorators import api_view
 from rest_framework.authtoken import views
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
+from chat_app.metrics import metrics_view
 
 API_PREFIX = pydantic_settings.api.prefix
 API_V1_PREFIX = pydantic_settings.api.v1.prefix
@@ -18,6 +19,7 @@ def root_hello(request):
 urlpatterns = [
     path("admin/", admin.site.urls),
     path('', root_hello, name='root'),
+    path("metrics/", metrics_view, name="metrics"),
     path(f"{API_PREFIX}{API_V1_PREFIX}/", include("chat_app.api.v1.users.urls")),
     path(f"{API_PREFIX}{API_V1_PREFIX}/", include("chat_app.api.v1.chat.urls")),
     path(f"{API_PREFIX}{API_V1_PREFIX}/", include("chat_app.api.v1.tokens.urls")),